@@ -1,6 +1,7 @@
 #!/usr/bin/python3
 
 import lib_modem
+import lib_modem_async
 import lib_cellular_stats
 import dbus
 import threading
@@ -9,51 +10,66 @@ import time
 import subprocess
 import logging
 
-def getModemDiagnostic(bus):
+def getModemDiagnostic(bus, modem=None):
 	""" Check cellular connectivity and returns whole modem diagnostic in case of failure, return tuple (status, message)
+	With several modems, the modem to check is given (lib_modem.ModemHandle), its connectivity is checked through the
+	network interface of its Internet context
 	"""
 
+	# The diagnostic is evaluated against a snapshot of the modem: all DBus values are read at once, concurrently
+	snapshot = lib_modem_async.run(lib_modem_async.getModemSnapshot(bus, modem=modem))
+
 	# To check cellular connectivity: read Internet Context status on DBus + contact a server
 	# several attempts
 	signal_strength = -1
 	tech = 'none'
-	status, internet_context_message = lib_modem.isInternetContextActive(bus, False, 3)
+	status, internet_context_message = snapshot.isInternetContextActive()
+	if not status:
+		# give a chance to a context being activated, and take a fresh snapshot if so
+		status, internet_context_message = lib_modem.isInternetContextActive(bus, False, 3, modem=modem)
+		if status:
+			snapshot = lib_modem_async.run(lib_modem_async.getModemSnapshot(bus, modem=modem))
+	# "ppp0" over PPP, "usb0"/"wwan0" when the modem driver of ofono uses NCM/ECM
+	interface_name = lib_modem.getDataInterfaceName(bus, modem=modem)
 	if status:
 		# get signal strenght and technology
-		modem_on_dbus, message = lib_modem.isModemOnDBus(bus)
+		modem_on_dbus, message = snapshot.isModemOnDBus()
 		if modem_on_dbus:
-			signal_strength, message, tech = lib_modem.getSignalStrength(bus)
+			signal_strength, message, tech = snapshot.getSignalStrength()
 		# get connectivity
-		status, message =  lib_modem.contactServer(False, 3)
+		status, message =  lib_modem.contactServer(False, 3, interface_name=interface_name)
 		if status:
 			return lib_modem.ModemDiagnosticCode.WellConfigured, internet_context_message + ", " + message, signal_strength, tech
 
 	# At this stage, the cellular connectivity is identified as faulty
 	# So we build here a detailed diagnostic, step by step
 	full_message = ""
-	mounted_modems_count, mounted_modems_message, mounted_modems_list = lib_modem.listUSBModems(False)
-	full_message += mounted_modems_message
-	if mounted_modems_count == 0:
-		return lib_modem.ModemDiagnosticCode.ModemIsAbsent, full_message, signal_strength, tech
-	elif mounted_modems_count > 1:
-		return lib_modem.ModemDiagnosticCode.SeveralModemsArePresent, full_message, signal_strength, tech
+	if modem == None:
+		mounted_modems_count, mounted_modems_message, mounted_modems_list = lib_modem.listUSBModems(False)
+		full_message += mounted_modems_message
+		if mounted_modems_count == 0:
+			return lib_modem.ModemDiagnosticCode.ModemIsAbsent, full_message, signal_strength, tech
+		elif mounted_modems_count > 1:
+			return lib_modem.ModemDiagnosticCode.SeveralModemsArePresent, full_message, signal_strength, tech
+	else:
+		full_message += "Modem %s" % (modem.describe())
 
 	status, message = lib_modem.isOfonodRunning()
 	full_message += ", %s" % (message)
 	if not status:
 		return lib_modem.ModemDiagnosticCode.OfonodNotRunning, full_message, signal_strength, tech
 
-	status, message = lib_modem.isModemOnDBus(bus)
+	status, message = snapshot.isModemOnDBus()
 	full_message += ", %s" % (message)
 	if not status:
 		return  lib_modem.ModemDiagnosticCode.ModemIsNotRecognized, full_message, signal_strength, tech
 
-	status, message = lib_modem.isSimPresent(bus)
+	status, message = snapshot.isSimPresent()
 	full_message += ", %s" % (message)
 	if not status:
 		return  lib_modem.ModemDiagnosticCode.SimIsAbsent, full_message, signal_strength, tech
 
-	status, message = lib_modem.getPinStatus(bus)
+	status, message = snapshot.getPinStatus()
 	full_message += ", %s" % (message)
 	if status == lib_modem.PinStatus.Unknown:
 		return lib_modem.ModemDiagnosticCode.SimError, full_message, signal_strength, tech
@@ -62,28 +78,31 @@ def getModemDiagnostic(bus):
 	elif status == lib_modem.PinStatus.PinIsRequired:
 		return lib_modem.ModemDiagnosticCode.SimIsPinLocked, full_message, signal_strength, tech
 
-	status, message = lib_modem.isCellularNetworkRegistered(bus)
+	status, message = snapshot.isCellularNetworkRegistered()
 	full_message += ", %s" % (message)
 	if not status:
 		return lib_modem.ModemDiagnosticCode.NetworkIsUnregistered, full_message, signal_strength, tech
 
-	status, message = lib_modem.isDataNetworkRegistered(bus)
+	status, message = snapshot.isDataNetworkRegistered()
 	full_message += ", %s" % (message)
 	if not status:
 		return lib_modem.ModemDiagnosticCode.GPRSNetworkNotRegistered, full_message, signal_strength, tech
 
-	status, message = lib_modem.isInternetContextActive(bus)
+	status, message = snapshot.isInternetContextActive()
 	full_message += ", %s" % (message)
 	if not status:
 		return lib_modem.ModemDiagnosticCode.APNConnectionFailed, full_message, signal_strength, tech
 
-	status, message =  lib_modem.contactServer(False, 3)
+	status, message =  lib_modem.contactServer(False, 3, interface_name=interface_name)
 	full_message += ", %s" % (message)
 	if not status:
 		return lib_modem.ModemDiagnosticCode.ContactServerFailed, full_message, signal_strength, tech
 
 	return lib_modem.ModemDiagnosticCode.WellConfigured, message, signal_strength, tech
 
+# modems are supervised concurrently when several are attached, each in its own thread (see superviseModems)
+failure_counter_lock = threading.Lock()
+
 failure_counter_path = "/tmp/cellular_data_supervisor_failure_counter"
 def getFailureCounter():
 	"""read the current number of failures since the last reboot
@@ -101,9 +120,10 @@ def incrementFailureCounter():
 	"""increment the number of failures since the last reboot
 	"""
 	try:
-		failure_counter = str(getFailureCounter()+1)
-		with open(failure_counter_path, 'w') as failure_counter_file:
-			failure_counter_file.write(failure_counter)
+		with failure_counter_lock:
+			failure_counter = str(getFailureCounter()+1)
+			with open(failure_counter_path, 'w') as failure_counter_file:
+				failure_counter_file.write(failure_counter)
 	except Exception as e:
 		return
 	return
@@ -117,6 +137,88 @@ def displayFailureCounter():
 def displayUptimeCounter():
 	logger.info("Connection uptime (hh.mm) %.2f" % lib_cellular_stats.computeUpTime())
 
+def isModemSupervised(bus, modem, modem_diagnostic):
+	"""Tell whether a faulty modem among several is supervised, return tuple (status, message). A modem on DBus without
+	internet context has never been configured (config_modem configures a single modem): it is left as is. A modem whose
+	contexts cannot be read (not on DBus, Sim absent or Pin locked, DBus error) is supervised, it is what recovery is for
+	"""
+	if modem_diagnostic in (lib_modem.ModemDiagnosticCode.WellConfigured, lib_modem.ModemDiagnosticCode.OfonodNotRunning):
+		return True, ""
+	configured, message = lib_modem.hasInternetContext(bus, modem=modem)
+	return configured != False, message
+
+def superviseModem(bus, modem, diagnostic_only, results):
+	"""Diagnose one of several modems and recover it when faulty, without disturbing the other modems: ofono and connman
+	are left running, only the faulty modem is reset (soft reset, a hard reset powering all the modems off).
+	A modem never configured is left as is (see isModemSupervised).
+	The diagnostic code is stored in results, indexed by modem key (None for a modem left as is)
+	"""
+	name = modem.describe()
+	modem_diagnostic, modem_diagnostic_message, signal_strength_value, technology = getModemDiagnostic(bus, modem)
+	supervised, message = isModemSupervised(bus, modem, modem_diagnostic)
+	if not supervised:
+		logger.info("Modem %s is not configured (%s), nothing to supervise" % (name, message))
+		results[modem.getKey()] = None
+		return
+	results[modem.getKey()] = modem_diagnostic
+
+	if not diagnostic_only:
+		lib_cellular_stats.logModemDiagnostic(modem_diagnostic, signal_strength=signal_strength_value, tech=technology)
+
+	if modem_diagnostic == lib_modem.ModemDiagnosticCode.WellConfigured:
+		logger.info("Modem %s: cellular data connection is available: %s" % (name, modem_diagnostic_message))
+		return
+	logger.warning("Modem %s: cellular data connection is not available: %s (code %d)" % (name, modem_diagnostic_message, modem_diagnostic.value))
+	if diagnostic_only:
+		return
+
+	incrementFailureCounter()
+	if modem_diagnostic == lib_modem.ModemDiagnosticCode.OfonodNotRunning:
+		# common to all modems, see superviseModems
+		return
+
+	# collect information from the modem itself on a secondary serial port of the modem, ofono keeps running
+	details = lib_modem.logModemDiagnosticInformation(modem)
+	lib_cellular_stats.logModemDiagnosticDetails(details, "cellular_data_supervisor", modem_diagnostic)
+
+	logger.warning("Modem %s: reboot modem (soft)" % (name))
+	lib_cellular_stats.logForcedModemReboot()
+	reboot_modem_result, reboot_modem_message, reset_details = lib_modem.resetModem(False, modem=modem)
+	logger.warning("Modem %s: %s" % (name, reboot_modem_message))
+	lib_cellular_stats.logModemReset(reset_details, "cellular_data_supervisor")
+
+def superviseModems(bus, modems, diagnostic_only):
+	"""Supervise several modems concurrently, each in its own thread (see superviseModem). return the exit code: the
+	first faulty diagnostic code, WellConfigured when all modems are fine.
+	Only one configured modem is supported: config_modem refuses to configure a modem when several are attached, the
+	modems configured beforehand (e.g. before another modem was plugged) are supervised. When none of the modems is
+	configured, nothing can be recovered: SeveralModemsArePresent is returned, like with a single modem diagnostic
+	"""
+	results = {}
+	threads = [threading.Thread(target=superviseModem, args=(bus, modem, diagnostic_only, results), name=modem.describe()) for modem in modems]
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+
+	codes = [results.get(modem.getKey(), lib_modem.ModemDiagnosticCode.ModemIsNotRecognized) for modem in modems]
+	faulty_codes = [code for code in codes if code not in (None, lib_modem.ModemDiagnosticCode.WellConfigured)]
+	if codes.count(None) == len(codes):
+		logger.error("%d modems are installed, none of them is configured (config_modem configures a single modem). Nothing we can do to recover..." % (len(codes)))
+		faulty_codes = [lib_modem.ModemDiagnosticCode.SeveralModemsArePresent]
+
+	if not diagnostic_only:
+		if lib_modem.ModemDiagnosticCode.OfonodNotRunning in faulty_codes:
+			logger.warning("Start Ofonod again")
+			start_ofonod_result, start_ofonod_message = lib_modem.startOfonod()
+			logger.warning("%s" % (start_ofonod_message))
+		displayUptimeCounter()
+		displayFailureCounter()
+
+	if len(faulty_codes) == 0:
+		return lib_modem.ModemDiagnosticCode.WellConfigured.value
+	return faulty_codes[0].value
+
 if __name__ == '__main__':
 	"""This Python script aims at correcting the bug "CYSCAT-88 3G: If the controller lost the 3G connection, he failed to reconnect by itself to the 3G"
 
@@ -128,6 +230,8 @@ if __name__ == '__main__':
 	-In case of a working cellular data connexion, this program simply logs the positive result and exits (and will be run again X minutes later)
 	-In case of a faulty cellular data connection, it logs a detailed diagnostic of the failure/root cause (modem, driver, Ofono, SIM, etc) and applies the adapted corrective action to recover (resetting the modem, restarting ofono etc) and exits.
 
+	When several modems are attached, each of them is diagnosed and recovered on its own, concurrently: the faulty modem only is reset, ofono and connman keep running for the other modems.
+
 	An optional command line argument "diagonly" is supported. In this case, this program will stop after displaying the cellular data connection diagnostic and will not take any corrective action to recover from any issue.
 	With "stats" argument, the program will stop after displaying uptime counter and failure counter
 	"""
@@ -168,6 +272,13 @@ if __name__ == '__main__':
 	# Get DBus
 	the_bus = dbus.SystemBus()
 
+	# several modems (capacity, carrier diversity) are supervised independently and concurrently
+	modem_registry = lib_modem.ModemRegistry(the_bus)
+	logger.info(modem_registry.refresh())
+	# modems that cannot be told apart are diagnosed as a whole, like a single modem
+	if len(modem_registry.getModems()) > 1 and modem_registry.isMatched():
+		exit(superviseModems(the_bus, modem_registry.getModems(), diagnostic_only))
+
 	# retrieve the full modem diagnostic
 	modem_diagnostic, modem_diagnostic_message, signal_strength_value, technology = getModemDiagnostic(the_bus)
 
@@ -204,6 +315,9 @@ if __name__ == '__main__':
 			# Several USB modems detected
 			logger.error(mounted_modems_message + ". Nothing we can do to recover...")
 		else:
+			# collect information from the modem itself while ofono still runs, on a secondary serial port of the modem
+			details = lib_modem.logModemDiagnosticInformation()
+
 			# The action taken depends on the issue
 			action_number = 1
 
@@ -212,6 +326,11 @@ if __name__ == '__main__':
 			logger.warning("%s" % (stop_ofonod_message))
 			time.sleep(4)
 
+			# no secondary serial port was free: the serial port of ofono is free once ofono is stopped
+			if len(details) == 0:
+				details = lib_modem.logModemDiagnosticInformation()
+			lib_cellular_stats.logModemDiagnosticDetails(details, "cellular_data_supervisor", modem_diagnostic)
+
 			action_number+=1
 			logger.warning("Step %d: restart Connman" % (action_number))
 			restart_connman_result, restart_connman_message = lib_modem.restartConnman()
@@ -223,8 +342,9 @@ if __name__ == '__main__':
 			# keep a trace of this forced reboot in stats
 			lib_cellular_stats.logForcedModemReboot()
 
-			reboot_modem_result, reboot_modem_message = lib_modem.rebootModemHard()
+			reboot_modem_result, reboot_modem_message, reset_details = lib_modem.resetModem(True)
 			logger.warning(reboot_modem_message)
+			lib_cellular_stats.logModemReset(reset_details, "cellular_data_supervisor")
 
 			logger.warning("Last action: start Ofonod again")
 			start_ofonod_result, start_ofonod_message = lib_modem.startOfonod()
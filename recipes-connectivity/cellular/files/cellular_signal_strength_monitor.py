@@ -14,6 +14,9 @@ import time
 import signal
 import logging
 
+# DBus calls of the polling loop (every 3 seconds) must not hang on a stuck ofono for the default 25 seconds
+DBUS_POLICY = lib_modem.RetryPolicy(call_timeout=2)
+
 # global variables for signal strength value log reduction
 counter_send = 0
 previous_signal_strength = -1
@@ -61,9 +64,9 @@ def pollCellularSignalStrength():
 	while not kill_now:
 		signal_strength = -1
 		tech = 'none'
-		modem_on_dbus, message = lib_modem.isModemOnDBus(bus)
+		modem_on_dbus, message = lib_modem.isModemOnDBus(bus, policy=DBUS_POLICY)
 		if modem_on_dbus:
-			signal_strength, message, tech = lib_modem.getSignalStrength(bus)
+			signal_strength, message, tech = lib_modem.getSignalStrength(bus, policy=DBUS_POLICY)
 
 		if signal_strength == -1:
 			# due to an unknown issue it is possible that we receive inadvertent -1 values
@@ -107,6 +110,9 @@ if __name__ == '__main__':
 	# Get DBus
 	bus = dbus.SystemBus()
 
+	# keep ofono properties in memory, updated by DBus signals, so that polling does not hammer ofono
+	lib_modem.startPropertyMirror(bus)
+
 	# prefer polling mode in order to detect when modem is locked or removed etc
 	pollCellularSignalStrength()
 
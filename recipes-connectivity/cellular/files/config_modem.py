@@ -1,9 +1,13 @@
 #!/usr/bin/python3
 
 import lib_modem
+import lib_modem_async
+import asyncio
 import lib_system
 import lib_cellular_stats
 import shutil
+import json
+import hashlib
 import os
 import time
 import dbus
@@ -15,6 +19,9 @@ LOGS_FILE_PATH = "/media/persistent/system/config_modem_logs"
 LOGS_FILE_MAX_BYTES = 512*1024
 LOGS_FILE_BACKUP_COUNT = 1
 
+# Last enumeration of modems on DBus (JSON), collected by the diagnostic report
+MODEMS_ENUMERATION_FILE_PATH = "/media/persistent/system/config_modem_enumeration.json"
+
 # Size of logs generated by cellular connection : 20 KBytes
 # 512 KBytes --> History of the last 25 attempts to configure cellular
 
@@ -31,6 +38,27 @@ logger = logging.getLogger(__name__)
 # Possible values are "att" and "verizon".
 NA_MODEM_DEFAULT_FW = "att"
 
+# Maximum time (seconds) to read the state of the modem logged on failures
+MODEM_STATE_TIMEOUT = 5
+
+# Maximum time (seconds) to wait for the registration on a cellular network
+REGISTRATION_TIMEOUT = 50
+
+# Time budget (seconds) of a configuration: waits and retries of all stages stop at this deadline
+CONFIGURATION_TIME_BUDGET = 15*60
+
+# Progress of the configuration being loaded (JSON), to resume it where it failed on the next attempt of
+# the modem configuration loader service. It is on a tmpfs: a reboot of the controller restarts the configuration from scratch
+CHECKPOINT_FILE_PATH = "/run/config_modem_checkpoint.json"
+# Number of attempts resuming a failed configuration before starting from scratch again (clear configuration, reboot modem)
+MAX_RESUME_ATTEMPTS = 3
+
+# Configuration successfully applied last time and identity of the modem and Sim it was applied to (JSON). When loading
+# a configuration, the live state is compared to it to only reconfigure what differs
+APPLIED_CONFIGURATION_FILE_PATH = "/media/persistent/system/config_modem_applied.json"
+# Maximum time (seconds) to wait for the ICCID of the Sim on DBus, read by ofono once the Sim is initialized
+SIM_IDENTITY_TIMEOUT = 10
+
 # Name of the systemd service responsible of loading modem configuration after an update
 MODEM_CONFIG_LOADER_SERVICE = "modem_configuration_loader.service"
 
@@ -64,14 +92,14 @@ def showHelp(script_name):
 	logger.info("or")
 	logger.info("use: \"%s get_configuration\" to return current modem configuration" % (sys.argv[0]))
 	logger.info("")
+	logger.info("use: \"%s timings\" to show the duration of each stage of the last modem configurations" % (sys.argv[0]))
+	logger.info("")
 
 def enableAndStartOfonod():
 	logger.info("")
 	logger.info("-Enable and start ofono service")
 	lib_modem.enableOfonod()
 	lib_modem.startOfonod()
-	#Wait a bit when starting ofono to let him discovering modems. Ofono is longer to start just after an OS upgrade
-	time.sleep(10)
 
 def enableAndStartCellularDataSupervisor():
 	""" Enable & start a timer-background service that check connectivity status every X minutes
@@ -104,6 +132,10 @@ def clearConfiguration(remove_config_modem_file = False):
 
 	if remove_config_modem_file == True:
 		lib_modem.removeConfigModemFile()
+		try:
+			os.remove(APPLIED_CONFIGURATION_FILE_PATH)
+		except OSError:
+			pass
 
 	# Stop and disable cellular data supervisor
 	lib_modem.stopCellularDataSupervisor()
@@ -141,10 +173,66 @@ def clearConfiguration(remove_config_modem_file = False):
 
 	lib_system.sync()
 
+def areModemInterfacesReady(bus, NA_modem):
+	"""Check if ofono has discovered the modem interfaces used to configure it (especially simManager and networkRegistration)
+	"""
+	interfaces = lib_modem.getModemInterfaces(bus)
+	if "org.ofono.SimManager" not in interfaces:
+		return False
+	if NA_modem and "org.ofono.TelitProvider" not in interfaces:
+		return False
+	if "org.ofono.NetworkRegistration" in interfaces:
+		return True
+
+	# networkRegistration only shows up once the Sim is usable: don't wait for it when the Sim is absent or locked
+	present, _ = lib_modem.isSimPresent(bus)
+	if not present:
+		return True
+	pin_status, _ = lib_modem.getPinStatus(bus)
+	return pin_status in [lib_modem.PinStatus.PinIsRequired, lib_modem.PinStatus.PukIsRequired]
+
+def logModemState(bus):
+	"""Log the state of the modem seen by ofono, all interfaces being read concurrently within a few seconds
+	"""
+	logger.info("")
+	logger.info("-State of the modem at failure time")
+	try:
+		snapshot = lib_modem_async.run(lib_modem_async.getModemSnapshot(bus), MODEM_STATE_TIMEOUT)
+	except asyncio.TimeoutError:
+		logger.info("Modem state not available after %d seconds" % (MODEM_STATE_TIMEOUT))
+		return
+	logger.info(snapshot.isModemOnDBus()[1])
+	logger.info(snapshot.isSimPresent()[1])
+	logger.info(snapshot.getPinStatus()[1])
+	logger.info(snapshot.isCellularNetworkRegistered()[1])
+	logger.info(snapshot.isDataNetworkRegistered()[1])
+	logger.info(snapshot.isInternetContextActive()[1])
+	signal_strength, message, tech = snapshot.getSignalStrength()
+	logger.info("Signal strength %d, technology %s" % (signal_strength, tech))
+
 def exitInError(modem_diagnostic_code):
 	"""Common exit function in case of failures
 	"""
 
+	timeline.finish(modem_diagnostic_code)
+
+	# state of the modem is logged before clearing configuration and rebooting the modem
+	if the_bus != None:
+		logModemState(the_bus)
+
+	# the loading of the configuration is resumed on next attempt when the modem made it to DBus (there is no need to
+	# reset it) unless it has been resumed too many times already
+	checkpoint["failed"] = current_stage
+	checkpoint["attempts"] += 1
+	if load_existing_configuration and "modem interfaces" in checkpoint["completed"] and checkpoint["attempts"] <= MAX_RESUME_ATTEMPTS:
+		saveCheckpoint(checkpoint)
+		modem_diagnostic_code_value = modem_diagnostic_code.value
+		logger.error("")
+		logger.error("---Finishing in Error with code %d, configuration will resume at stage '%s'---" % (modem_diagnostic_code_value, current_stage))
+		lib_cellular_stats.logModemDiagnostic(modem_diagnostic_code)
+		exit(modem_diagnostic_code_value)
+	removeCheckpoint()
+
 	if load_existing_configuration:
 		# failed to apply existing modem configuration:
 		# - clear configuration and keep modem configuration file for next tentative
@@ -155,7 +243,9 @@ def exitInError(modem_diagnostic_code):
 
 	# reboot modem (hard) to be fresh for next configuration (except when several modems are present)
 	if modem_diagnostic_code != lib_modem.ModemDiagnosticCode.SeveralModemsArePresent:
-		lib_modem.rebootModemHard()
+		reset_status, reset_message, reset_details = lib_modem.resetModem(True)
+		logger.info(reset_message)
+		lib_cellular_stats.logModemReset(reset_details, "config_modem")
 
 	modem_diagnostic_code_value = modem_diagnostic_code.value
 
@@ -168,6 +258,14 @@ def exitInSuccess():
 	"""Common exit function in case of success
 	"""
 
+	timeline.finish(lib_modem.ModemDiagnosticCode.WellConfigured)
+	removeCheckpoint()
+	saveAppliedConfiguration()
+
+	# the configured APN settings are saved, the APN candidate that connected is kept with the applied configuration
+	if apn_settings != (apn, user_name, password):
+		logger.info("Connected with APN candidate \"%s\" instead of the configured APN \"%s\"" % (apn_settings[0], apn))
+
 	if NA_modem:
 		lib_modem.saveConfigModemFile(pin, apn, user_name, password, fwmode, True)
 	else:
@@ -182,6 +280,396 @@ def exitInSuccess():
 
 	exit(lib_modem.ModemDiagnosticCode.WellConfigured.value)
 
+def showTimings():
+	"""Show the duration of each stage of the last modem configurations, oldest first
+	"""
+	runs = lib_cellular_stats.loadTimings()
+	if len(runs) == 0:
+		logger.info("No modem configuration timings available")
+		return
+	for run in runs:
+		logger.info("")
+		logger.info("%s UTC '%s': %s in %.1f s, %d DBus calls" % (run["date"], run["command"], run.get("result", "unfinished"),
+			run.get("duration", 0), run.get("dbus_calls", 0)))
+		for stage in run["stages"]:
+			logger.info("    %-24s %8.1f s  %8.1f s  %4d DBus calls  %s" % (stage["name"], stage["start"], stage.get("duration", 0),
+				stage["dbus_calls"], stage.get("outcome", "")))
+
+def getConfigurationKey():
+	"""Identify the configuration being loaded: a checkpoint of another configuration cannot be resumed
+	"""
+	return hashlib.sha256("\n".join([pin, apn, user_name, password, fwmode]).encode()).hexdigest()
+
+def loadCheckpoint():
+	"""Return the checkpoint of the configuration being loaded, None if there is none (or of another configuration)
+	"""
+	try:
+		with open(CHECKPOINT_FILE_PATH, "r") as checkpoint_file:
+			checkpoint = json.load(checkpoint_file)
+		if checkpoint["configuration"] == getConfigurationKey():
+			return checkpoint
+	except Exception:
+		pass
+	return None
+
+def saveCheckpoint(checkpoint):
+	try:
+		with open(CHECKPOINT_FILE_PATH, "w") as checkpoint_file:
+			json.dump(checkpoint, checkpoint_file)
+	except Exception as e:
+		logger.warning("Failed to save configuration checkpoint: %s" % (e))
+
+def removeCheckpoint():
+	try:
+		os.remove(CHECKPOINT_FILE_PATH)
+	except OSError:
+		pass
+
+def getModemAndSimIdentity(bus):
+	"""Return the identity of the modem and of its Sim as seen by ofono: { "modem": IMEI, "iccid": ICCID }
+	"""
+	snapshot = lib_modem.getModemSnapshot(bus)
+	identity = { "modem": "", "iccid": "" }
+	if 'org.ofono.Modem' in snapshot.properties:
+		identity["modem"] = str(snapshot.properties['org.ofono.Modem'].get("Serial", ""))
+	if 'org.ofono.SimManager' in snapshot.properties:
+		identity["iccid"] = str(snapshot.properties['org.ofono.SimManager'].get("CardIdentifier", ""))
+	return identity
+
+def saveAppliedConfiguration():
+	try:
+		with open(APPLIED_CONFIGURATION_FILE_PATH, "w") as applied_file:
+			json.dump({ "configuration": getConfigurationKey(), "identity": getModemAndSimIdentity(the_bus),
+				"apn_settings": list(apn_settings) }, applied_file)
+	except Exception as e:
+		logger.warning("Failed to save applied configuration: %s" % (e))
+
+def getLiveStateCheckpoint():
+	"""When the configuration being loaded has already been applied to the same modem and Sim, and ofono still runs,
+	return a checkpoint with all stages completed: they are revalidated against the live state and only the stages not
+	valid anymore are run. Return None when the configuration must be applied from scratch
+	"""
+	logger.info("")
+	logger.info("-Compare live state with configuration")
+
+	try:
+		with open(APPLIED_CONFIGURATION_FILE_PATH, "r") as applied_file:
+			applied = json.load(applied_file)
+	except Exception:
+		logger.info("Configuration has never been applied")
+		return None
+	if applied["configuration"] != getConfigurationKey():
+		logger.info("Configuration differs from the one applied last time")
+		return None
+
+	status, message = lib_modem.isOfonodRunning()
+	if not status:
+		logger.info(message)
+		return None
+
+	# at boot, ofono may not have enumerated the modem yet: wait for it like stageModemOnDBus()
+	status, message = lib_modem.isModemOnDBus(the_bus, False, 7)
+	if not status:
+		logger.warning("Modem is not on DBus yet, the live state cannot be compared: %s" % (message))
+		return None
+
+	identity = getModemAndSimIdentity(the_bus)
+	if identity["iccid"] == "" and applied["identity"]["iccid"] != "":
+		# the Sim may not be initialized yet
+		lib_modem.waitFor(the_bus, lambda: getModemAndSimIdentity(the_bus)["iccid"] != "", SIM_IDENTITY_TIMEOUT)
+		identity = getModemAndSimIdentity(the_bus)
+	if identity["modem"] != applied["identity"]["modem"]:
+		logger.info("Modem differs from last time: %s instead of %s" % (identity["modem"], applied["identity"]["modem"]))
+		return None
+	if identity["iccid"] != applied["identity"]["iccid"]:
+		if identity["iccid"] == "":
+			logger.warning("Sim is not ready, the live state cannot be compared")
+		else:
+			logger.info("Sim changed since last time: %s instead of %s" % (identity["iccid"], applied["identity"]["iccid"]))
+		return None
+
+	logger.info("Configuration already applied to this modem and Sim, revalidate it")
+	return { "configuration": getConfigurationKey(), "completed": [name for name, function, is_valid in STAGES], "failed": None, "attempts": 0,
+		"apn_settings": applied.get("apn_settings", [apn, user_name, password]) }
+
+def stageUSBDetection():
+	# look for a compatible modem on the system.
+	# prevent customer from using several modems: a single modem is configured, the supervisor leaving the modems
+	# without internet context alone (see cellular_data_supervisor.superviseModems)
+	mounted_modems_count, mounted_modems_message, mounted_modems_list = lib_modem.listUSBModems(True)
+	if mounted_modems_count == 0:
+		exitInError(lib_modem.ModemDiagnosticCode.ModemIsAbsent)
+	elif mounted_modems_count > 1:
+		exitInError(lib_modem.ModemDiagnosticCode.SeveralModemsArePresent)
+
+def stageDiagnosticInformation():
+	# Log a set of information from modem for diagnostic purpose
+	details = lib_modem.logModemDiagnosticInformation()
+	lib_cellular_stats.logModemDiagnosticDetails(details, "config_modem")
+
+def stageOfonoStart():
+	enableAndStartOfonod()
+
+	logger.info("")
+	logger.info("-Check if ofonod process is running")
+	status, message = lib_modem.isOfonodRunning()
+	logger.info(message)
+	if not status:
+		exitInError(lib_modem.ModemDiagnosticCode.OfonodNotRunning)
+
+def stageModemOnDBus():
+	global NA_modem
+
+	# Ofono is longer to discover modems just after an OS upgrade: wait for the modem up to 30 seconds
+	status, message = lib_modem.isModemOnDBus(the_bus, True, 7)
+	if not status:
+		exitInError(lib_modem.ModemDiagnosticCode.ModemIsNotRecognized)
+
+	# Determining if the current modem seen on DBus is made for the North America network.
+	NA_modem = isNorthAmericaModem()
+
+def isModemOnDBusValid():
+	"""Revalidation of stageModemOnDBus(), it determines again the type of modem as well
+	"""
+	global NA_modem
+
+	status, message = lib_modem.isModemOnDBus(the_bus)
+	if status:
+		NA_modem = isNorthAmericaModem()
+	return status
+
+def isNorthAmericaModem():
+	"""Type of the modem seen on DBus, from its cached identity (discovered on the first run with this modem)
+	"""
+	identity = lib_modem.getModemIdentity(the_bus)
+	if identity == None:
+		return lib_modem.isNorthAmericaModemViaDBus(the_bus)
+	return identity["north_america"]
+
+def stageModemInterfaces():
+	# Interfaces of the modem are discovered by ofono step by step. Wait (at most 1 minute) for the interfaces
+	# (especially simManager and networkRegistration) that are used by the next stages
+	logger.info("")
+	logger.info("-Wait for modem interfaces")
+	start = time.monotonic()
+	if lib_modem.waitFor(the_bus, lambda: areModemInterfacesReady(the_bus, NA_modem), 60):
+		logger.info("Modem interfaces are ready after %.1f s" % (time.monotonic() - start))
+	else:
+		logger.info("Modem interfaces are still incomplete after %.1f s" % (time.monotonic() - start))
+
+def stageEnumeration():
+	# List the content of all information related to modems on DBus
+	lib_modem_async.dumpModems(the_bus, MODEMS_ENUMERATION_FILE_PATH)
+
+def stageFirmwareMode():
+	# As opposed to European modems, North America ones carry two different firmwares ("att" or "verizon"). Therefore,
+	# testing if a modem is made for the North America network is necessary before handling
+	# its firmwares.
+
+	# Setting the modem firmware for North America modem
+	logger.info("")
+	if NA_modem:
+		logger.info("This is North America modem")
+		current_firmware = lib_modem.getProviderMode(the_bus)
+		logger.info("North America modem firmware mode currently enabled: '%s'" % (current_firmware))
+
+		if fwmode != current_firmware:
+			logger.info("Switching the North America modem firmware to: '%s'" % (fwmode))
+			# After a firmware switch, the modem reboots automatically: wait for it to be back on DBus with the new firmware
+			status, message = lib_modem.switchProviderMode(the_bus, fwmode, verbose = True)
+			if not status:
+				exitInError(lib_modem.ModemDiagnosticCode.SwitchFirmwareFailed)
+
+			# ofono discovers interfaces of the rebooted modem step by step again
+			stageModemInterfaces()
+	else:
+		logger.info("This is European modem")
+
+def stageSim():
+	status, message = lib_modem.isSimPresent(the_bus, True, 5)
+	if not status:
+		exitInError(lib_modem.ModemDiagnosticCode.SimIsAbsent)
+
+def stagePin():
+	# Retrieve Pin status and ask pin if required
+	status, message = lib_modem.getPinStatus(the_bus, True)
+	if status == lib_modem.PinStatus.Unknown:
+		exitInError(lib_modem.ModemDiagnosticCode.SimError)
+	elif status == lib_modem.PinStatus.PukIsRequired:
+		exitInError(lib_modem.ModemDiagnosticCode.SimIsPukLocked)
+
+	if status == lib_modem.PinStatus.PinIsRequired:
+		if len(pin) == 0:
+			exitInError(lib_modem.ModemDiagnosticCode.SimIsPinLocked)	#Sim is locked but no PIN is given
+		else:
+			status, message = lib_modem.disablePin(the_bus, pin, True)
+			if status == lib_modem.DisablePinAnswer.Unknown:
+				exitInError(lib_modem.ModemDiagnosticCode.SimError)
+			elif status == lib_modem.DisablePinAnswer.WrongPin:
+				exitInError(lib_modem.ModemDiagnosticCode.SimIsPinLocked)
+
+def stageProviderName():
+	# retrieve service provider name, displayed for information purpose
+	# may need a couple of seconds to be available after PIN unlocking
+	provider_name, dummy_msg = lib_modem.getServiceProviderName(the_bus, True, 5)
+
+	# Telenor SIM cards are provided with controllers and are supposed to be used in multiple countries.
+	# Roaming is necessary when using SIM card linked to a mobile provider based in a different country
+	# than the one the SIM card is used in.
+	# Historically, roaming was enabled exactly below this comment, but it proved to be too late.
+	# Even enabling roaming right after starting ofono in this scrict was still to late.
+	# Therefore, our version of Ofono has been patched to allow roaming by default.
+
+def stageRegistration():
+	# wait for network registration, the network of the last registration is tried first
+	status, message, details = lib_modem.registerToNetwork(the_bus, REGISTRATION_TIMEOUT, True)
+	lib_cellular_stats.logNetworkRegistration(details, "config_modem")
+	if not status:
+		exitInError(lib_modem.ModemDiagnosticCode.NetworkIsUnregistered)
+
+	status, message = lib_modem.saveRegisteredNetwork(the_bus)
+	logger.info(message)
+
+def stageDataAttach():
+	status, message = lib_modem.isDataNetworkRegistered(the_bus, True, 20)
+	if not status:
+		exitInError(lib_modem.ModemDiagnosticCode.GPRSNetworkNotRegistered)
+
+def stageContext():
+	# an internet context already configured as expected is kept as is
+	status, message = lib_modem.isInternetContextConfigured(the_bus, *apn_settings, verbose=True)
+	if status:
+		return
+
+	configureInternetContext()
+
+def configureInternetContext():
+	# clear any internet context in the Sim to force creation of a new one
+	lib_modem.clearInternetContext(the_bus)
+	lib_modem.setInternetContext(the_bus, *apn_settings)
+
+def useNextAPNCandidate():
+	"""After a connection failure, configure the internet context with the next APN candidate, return False when all
+	candidates have been tried. The APN settings given may be wrong or empty: the settings of the operator of the Sim
+	are tried next, in the same run (see lib_modem.getAPNCandidates). The configured APN settings are left unchanged
+	(they identify the configuration, see getConfigurationKey), the candidate used is kept in apn_settings and in the
+	checkpoint
+	"""
+	global apn_settings, apn_candidates
+
+	if apn_candidates == None:
+		apn_candidates = lib_modem.getAPNCandidates(the_bus, apn, user_name, password)
+		logger.info("")
+		logger.info("APN candidates: %s" % (", ".join(["\"%s\"" % (candidate[0]) for candidate in apn_candidates])))
+		tried_apn_candidates.append(apn_settings)
+	remaining = [candidate for candidate in apn_candidates if candidate not in tried_apn_candidates]
+	if len(remaining) == 0:
+		return False
+
+	apn_settings = remaining[0]
+	checkpoint["apn_settings"] = list(apn_settings)
+	tried_apn_candidates.append(remaining[0])
+	logger.info("")
+	logger.info("-Connection failed, try APN candidate %d/%d: \"%s\"" % (apn_candidates.index(remaining[0]) + 1, len(apn_candidates), apn_settings[0]))
+	timeline.start("context (APN \"%s\")" % (apn_settings[0]))
+	configureInternetContext()
+	return True
+
+def stageConnmanService():
+	global cellular_service_path
+
+	while True:
+		status, cellular_service_path = lib_modem.getCellularServiceInConnman(the_bus, True, 3)
+		# even if cellular service is listed on connman, it does NOT mean that apn settings are valid
+		if status:
+			return
+		if not useNextAPNCandidate():
+			exitInError(lib_modem.ModemDiagnosticCode.APNConnectionFailed)
+
+def isCellularServiceConnectedValid():
+	"""Revalidation of stageConnmanService() and stageConnect()
+	"""
+	global cellular_service_path
+
+	status, message = lib_modem.isCellularServiceConnected(the_bus)
+	if status:
+		cellular_service_path = message
+	return status
+
+def stageConnect():
+	while True:
+		# The cellular service is now ready to be connected via connman
+		status, message = lib_modem.connectToCellularServiceInConnman(the_bus, cellular_service_path, True)
+		# the connection fails when in case of wrong apn (DBus exception while connecting to cellular service in Connman:net.connman.Error.Failed: Input/output error)
+		if status:
+			return
+		if not useNextAPNCandidate():
+			exitInError(lib_modem.ModemDiagnosticCode.APNConnectionFailed)
+		# the cellular service of connman follows the new internet context
+		stageConnmanService()
+
+def stageContextActive():
+	status, message = lib_modem.isInternetContextActive(the_bus, True, 3)
+	if not status:
+		exitInError(lib_modem.ModemDiagnosticCode.InternetContextFailed)
+	# ppp0, or usb0/wwan0 when the modem driver of ofono uses NCM/ECM
+	logger.info("Data connection over %s" % (lib_modem.getDataInterfaceName(the_bus)))
+
+def stageServicesStart():
+	enableAndStartCellularDataSupervisor()
+	enableAndStartCellularSignalStrengthMonitor()
+
+# Stages of the configuration, in order: (name, function, revalidation)
+# Stages completed by a failed configuration are revalidated by their revalidation function (it returns True when the
+# stage still holds, cheaply and without logs) to resume the configuration at the first stage not valid anymore.
+# Stages without revalidation function are always run again.
+STAGES = [
+	("usb detection", stageUSBDetection, lambda: lib_modem.listUSBModems(False)[0] == 1),
+	("diagnostic information", stageDiagnosticInformation, lambda: True),
+	("ofono start", stageOfonoStart, lambda: lib_modem.isOfonodRunning()[0]),
+	("modem on dbus", stageModemOnDBus, isModemOnDBusValid),
+	("modem interfaces", stageModemInterfaces, lambda: areModemInterfacesReady(the_bus, NA_modem)),
+	("enumeration", stageEnumeration, lambda: True),
+	("firmware mode", stageFirmwareMode, lambda: not NA_modem or lib_modem.getProviderMode(the_bus) == fwmode),
+	("sim", stageSim, lambda: lib_modem.isSimPresent(the_bus)[0]),
+	("pin", stagePin, lambda: lib_modem.getPinStatus(the_bus)[0] == lib_modem.PinStatus.PinIsValidOrNotRequired),
+	("provider name", stageProviderName, lambda: True),
+	("registration", stageRegistration, lambda: lib_modem.isCellularNetworkRegistered(the_bus)[0]),
+	("data attach", stageDataAttach, lambda: lib_modem.isDataNetworkRegistered(the_bus)[0]),
+	("context", stageContext, lambda: lib_modem.isInternetContextConfigured(the_bus, *apn_settings)[0]),
+	("connman service", stageConnmanService, isCellularServiceConnectedValid),
+	("connect", stageConnect, isCellularServiceConnectedValid),
+	("context active", stageContextActive, lambda: lib_modem.isInternetContextActive(the_bus)[0]),
+	("services start", stageServicesStart, None),
+]
+
+def runStages(checkpoint):
+	"""Run the stages of the configuration, record progress in checkpoint. Stages completed in checkpoint are
+	revalidated and skipped while they still hold
+	"""
+	global current_stage
+
+	completed = checkpoint["completed"]
+	checkpoint["completed"] = []
+	first_stage = 0
+	if len(completed) > 0:
+		timeline.start("revalidation")
+		logger.info("")
+		logger.info("-Revalidate completed stages")
+		for index, (name, function, is_valid) in enumerate(STAGES):
+			first_stage = index
+			if name not in completed or is_valid == None or not is_valid():
+				break
+			logger.info("Stage '%s' still holds" % (name))
+			checkpoint["completed"].append(name)
+
+	for name, function, is_valid in STAGES[first_stage:]:
+		current_stage = name
+		timeline.start(name)
+		function()
+		checkpoint["completed"].append(name)
+		saveCheckpoint(checkpoint)
+
 # getModemStateFilePath : this file will be created when enable modem is called and removed when disable modem called.
 def getModemStateFilePath():
 	"""path to the file containing modem configuration file
@@ -241,6 +729,12 @@ if __name__ == '__main__':
 		command = command + argument + " "
 	logger.debug(command)
 
+	the_bus = None
+	NA_modem = False
+	apn_settings = None
+	apn_candidates = None
+	tried_apn_candidates = []
+	current_stage = None
 	load_existing_configuration = False
 	good_usage = False
 	if (len(sys.argv) == 1+1):	# 1 argument is given after script name
@@ -297,14 +791,24 @@ if __name__ == '__main__':
 			if isModemPresent(False):
 				logger.info("Modem is present")
 
-				NA_modem = False
+				NA_modem = None
 
+				# the identity of the modem is cached: the modem is only queried the first time
 				ofono_running, _ = lib_modem.isOfonodRunning()
-				if ofono_running:
-					the_bus = dbus.SystemBus()
-					NA_modem = lib_modem.isNorthAmericaModemViaDBus(the_bus)
-				else:
+				the_bus = dbus.SystemBus() if ofono_running else None
+				identity = lib_modem.getModemIdentity(the_bus)
+				if identity != None:
+					NA_modem = identity["north_america"]
+				elif not ofono_running:
 					NA_modem = lib_modem.isNorthAmericaModemViaSerial()
+					# no serial port of the modem is free (e.g. ofono started meanwhile): ask ofono
+					ofono_running, _ = lib_modem.isOfonodRunning()
+					the_bus = dbus.SystemBus() if ofono_running else None
+				if NA_modem == None and ofono_running:
+					NA_modem = lib_modem.isNorthAmericaModemViaDBus(the_bus)
+				if NA_modem == None:
+					logger.error("Modem type is unknown, the modem did not answer")
+					exit(1)
 
 				modem_type = "us" if NA_modem else "eu"
 				logger.info(modem_type)
@@ -328,6 +832,9 @@ if __name__ == '__main__':
 			if fwmode != "":
 				logger.info(fwmode)
 
+			exit(0)
+		elif sys.argv[1] == "timings":
+			showTimings()
 			exit(0)
 	elif len(sys.argv) == 4+1 or len(sys.argv) == 5+1:	# 4 or 5 arguments are given after script name
 		# The first 4 arguments are always: PIN, APN, Username and Password
@@ -348,6 +855,9 @@ if __name__ == '__main__':
 		showHelp(sys.argv[0])
 		exit(1)
 
+	# duration of each stage of the configuration is recorded for statistics, see "timings" argument
+	timeline = lib_cellular_stats.StageTimeline(sys.argv[1] if load_existing_configuration else "configure", lib_modem.getDBusCallCount)
+
 	logger.info("PIN: \"%s\"" % (pin))
 	logger.info("APN: \"%s\"" % (apn))
 	logger.info("Username: \"%s\"" % (user_name))
@@ -356,143 +866,41 @@ if __name__ == '__main__':
 	# if modem is enabled through command prompt, save the modem status for UX mode.
 	saveModemState()
 
-	if load_existing_configuration:
-		# Clear current configuration (if any) but keep any existing modem configuration file for any further tentative
-		clearConfiguration(False)
-	else:
-		# Stops cellular data connectivity. Clear all related configuration data as it is a new configuration request
-		clearConfiguration(True)
-
-	# look for a compatible modem on the system.
-	# prevent customer from using several modems
-	mounted_modems_count, mounted_modems_message, mounted_modems_list = lib_modem.listUSBModems(True)
-	if mounted_modems_count == 0:
-		exitInError(lib_modem.ModemDiagnosticCode.ModemIsAbsent)
-	elif mounted_modems_count > 1:
-		exitInError(lib_modem.ModemDiagnosticCode.SeveralModemsArePresent)
-
-	# Log a set of information from modem for diagnostic purpose
-	lib_modem.logModemDiagnosticInformation()
-
-	enableAndStartOfonod()
-
-	logger.info("")
-	logger.info("-Check if ofonod process is running")
-	status, message = lib_modem.isOfonodRunning()
-	logger.info(message)
-	if not status:
-		exitInError(lib_modem.ModemDiagnosticCode.OfonodNotRunning)
-
 	# Get DBus
 	the_bus = dbus.SystemBus()
+	lib_modem.countDBusCalls(the_bus)
 
-	status, message = lib_modem.isModemOnDBus(the_bus, True, 5)
-	if not status:
-		exitInError(lib_modem.ModemDiagnosticCode.ModemIsNotRecognized)
-
-	# List the content of all information related to modems on DBus
-	# This enumeration can be instantanous when empty or partially discovered by ofono.
-	# Force a minimum duration of 1 minute
-	# Necessary to wait for more interfaces (especially simManager and networkRegistration) that are used right after this listing
-	start = time.time()
-	lib_modem.enumerateModems(the_bus)
-	end = time.time()
-	duration = end - start
-	if duration < 60:
-		wait_duration = round(60-duration, 0)
-		logger.info("-Sleep for %s s" % (wait_duration))
-		time.sleep(wait_duration)
-
-	# Determining if the current modem seen on DBus is made for the North America network.
-	NA_modem = lib_modem.isNorthAmericaModemViaDBus(the_bus)
-
-	# As opposed to European modems, North America ones carry two different firmwares ("att" or "verizon"). Therefore,
-	# testing if a modem is made for the North America network is necessary before handling
-	# its firmwares.
+	# keep ofono properties in memory, updated by DBus signals, so that waiting for the modem does not poll ofono
+	lib_modem.startPropertyMirror(the_bus)
 
-	# Setting the modem firmware for North America modem
-	logger.info("")
-	if NA_modem:
-		logger.info("This is North America modem")
-		current_firmware = lib_modem.getProviderMode(the_bus)
-		logger.info("North America modem firmware mode currently enabled: '%s'" % (current_firmware))
-
-		if fwmode != current_firmware:
-			logger.info("Switching the North America modem firmware to: '%s'" % (fwmode))
-			status, message = lib_modem.configureProviderMode(the_bus, fwmode, verbose = True)
-			if not status:
-				exitInError(lib_modem.ModemDiagnosticCode.SwitchFirmwareFailed)
-
-			# After a firmware switch, the modem reboots automatically.
-			# It usually takes less than 15 seconds to reboot, so we wait 30 seconds
-			# to have some buffer time.
-			time.sleep(30)
-
-			os.execv(sys.argv[0], sys.argv)
-	else:
-		logger.info("This is European modem")
-
-	status, message = lib_modem.isSimPresent(the_bus, True, 5)
-	if not status:
-		exitInError(lib_modem.ModemDiagnosticCode.SimIsAbsent)
-
-	# Retrieve Pin status and ask pin if required
-	status, message = lib_modem.getPinStatus(the_bus, True)
-	if status == lib_modem.PinStatus.Unknown:
-		exitInError(lib_modem.ModemDiagnosticCode.SimError)
-	elif status == lib_modem.PinStatus.PukIsRequired:
-		exitInError(lib_modem.ModemDiagnosticCode.SimIsPukLocked)
-
-	if status == lib_modem.PinStatus.PinIsRequired:
-		if len(pin) == 0:
-			exitInError(lib_modem.ModemDiagnosticCode.SimIsPinLocked)	#Sim is locked but no PIN is given
+	# a failed loading of the configuration may be resumed where it stopped, an already applied configuration is only
+	# revalidated, a new configuration always starts from scratch
+	checkpoint = None
+	if load_existing_configuration:
+		checkpoint = loadCheckpoint()
+		if checkpoint == None:
+			timeline.start("live state")
+			checkpoint = getLiveStateCheckpoint()
+	if checkpoint == None:
+		removeCheckpoint()
+		checkpoint = { "configuration": getConfigurationKey(), "completed": [], "failed": None, "attempts": 0 }
+
+		timeline.start("clear configuration")
+		if load_existing_configuration:
+			# Clear current configuration (if any) but keep any existing modem configuration file for any further tentative
+			clearConfiguration(False)
 		else:
-			status, message = lib_modem.disablePin(the_bus, pin, True)
-			if status == lib_modem.DisablePinAnswer.Unknown:
-				exitInError(lib_modem.ModemDiagnosticCode.SimError)
-			elif status == lib_modem.DisablePinAnswer.WrongPin:
-				exitInError(lib_modem.ModemDiagnosticCode.SimIsPinLocked)
-
-	# retrieve service provider name, displayed for information purpose
-	# may need a couple of seconds to be available after PIN unlocking
-	provider_name, dummy_msg = lib_modem.getServiceProviderName(the_bus, True, 5)
-
-	# Telenor SIM cards are provided with controllers and are supposed to be used in multiple countries.
-	# Roaming is necessary when using SIM card linked to a mobile provider based in a different country
-	# than the one the SIM card is used in.
-	# Historically, roaming was enabled exactly below this comment, but it proved to be too late.
-	# Even enabling roaming right after starting ofono in this scrict was still to late.
-	# Therefore, our version of Ofono has been patched to allow roaming by default.
-
-	# wait for network registration
-	status, message = lib_modem.isCellularNetworkRegistered(the_bus, True, 10)
-	if not status:
-		exitInError(lib_modem.ModemDiagnosticCode.NetworkIsUnregistered)
-
-	status, message = lib_modem.isDataNetworkRegistered(the_bus, True, 20)
-	if not status:
-		exitInError(lib_modem.ModemDiagnosticCode.GPRSNetworkNotRegistered)
-
-	# clear any internet context in the Sim to force creation of a new one
-	lib_modem.clearInternetContext(the_bus)
-	lib_modem.setInternetContext(the_bus, apn, user_name, password)
-
-	status, cellular_service_path = lib_modem.getCellularServiceInConnman(the_bus, True, 3)
-	# even if cellular service is listed on connman, it does NOT mean that apn settings are valid
-	if not status:
-		exitInError(lib_modem.ModemDiagnosticCode.APNConnectionFailed)
-
-	# The cellular service is now ready to be connected via connman
-	status, message = lib_modem.connectToCellularServiceInConnman(the_bus, cellular_service_path, True)
-	# the connection fails when in case of wrong apn (DBus exception while connecting to cellular service in Connman:net.connman.Error.Failed: Input/output error)
-	if not status:
-		exitInError(lib_modem.ModemDiagnosticCode.APNConnectionFailed)
+			# Stops cellular data connectivity. Clear all related configuration data as it is a new configuration request
+			clearConfiguration(True)
+	elif checkpoint["failed"] != None:
+		logger.info("")
+		logger.info("-Resume configuration (attempt #%d), failed last time at stage '%s'" % (checkpoint["attempts"]+1, checkpoint["failed"]))
 
-	status, message = lib_modem.isInternetContextActive(the_bus, True, 3)
-	if not status:
-		exitInError(lib_modem.ModemDiagnosticCode.InternetContextFailed)
+	# APN settings of the internet context: the configured ones, or the APN candidate used by the configuration resumed
+	apn_settings = tuple(checkpoint.get("apn_settings", [apn, user_name, password]))
 
-	enableAndStartCellularDataSupervisor()
-	enableAndStartCellularSignalStrengthMonitor()
+	# every stage waits and retries within the time budget of the whole configuration
+	with lib_modem.RetryPolicy(deadline=CONFIGURATION_TIME_BUDGET):
+		runStages(checkpoint)
 
 	exitInSuccess()
@@ -3,12 +3,13 @@ import os.path
 import os
 import sys
 import time
+import json
 import logging
 
 from logging.handlers import RotatingFileHandler
 from enum import Enum
 from datetime import datetime
-from lib_modem import ModemDiagnosticCode
+from lib_modem_definitions import ModemDiagnosticCode
 
 date_format = '%Y/%m/%d %H:%M:%S'
 
@@ -57,6 +58,28 @@ def logModemDiagnostic(modem_diagnostic_code, signal_strength="N/A", tech="N/A")
     # log the diagnostic code itself
     return __logModemStatCode(modem_diagnostic_code.value, signal_strength, tech)
 
+def logModemDiagnosticDetails(details, source, modem_diagnostic_code=None):
+    """ log the information collected from the modem for diagnostic (see lib_modem.logModemDiagnosticInformation) in the
+    diagnostic details file, one JSON document per line
+        @details: dict of decoded modem answers
+        @source: name of the program collecting the information
+        @modem_diagnostic_code: the modem diagnostic code at collection time, if known
+    """
+    if len(details) == 0:
+        return False
+    try:
+        record = {
+            "utc": datetime.utcnow().strftime(date_format),
+            "source": source,
+            "code": modem_diagnostic_code.value if isinstance(modem_diagnostic_code, ModemDiagnosticCode) else None,
+            "modem": details
+        }
+        diagnostics_logger.info(json.dumps(record, sort_keys=True))
+        return True
+    except:
+        pass
+    return False
+
 class ExtentedModemStatCode(Enum):
     """ Additional modem stat code used to fill history CSV file
     """
@@ -73,6 +96,37 @@ def logForcedModemReboot():
     """
     return __logModemStatCode(ExtentedModemStatCode.ForcedModemReboot.value)
 
+def __logDiagnosticRecord(name, details, source):
+    """ log details measured by a program (e.g. a modem reset) under name in the diagnostic details file
+    """
+    try:
+        record = {
+            "utc": datetime.utcnow().strftime(date_format),
+            "source": source,
+            name: details
+        }
+        diagnostics_logger.info(json.dumps(record, sort_keys=True))
+        return True
+    except:
+        pass
+    return False
+
+def logModemReset(details, source):
+    """ log the measured times of a modem reset (see lib_modem.resetModem) in the diagnostic details file, to follow the
+    reset latency across modem firmware versions
+        @details: dict of the reset kind, the seconds until the modem was detached and ready, and its firmware revision
+        @source: name of the program resetting the modem
+    """
+    return __logDiagnosticRecord("reset", details, source)
+
+def logNetworkRegistration(details, source):
+    """ log the time to register on the cellular network (see lib_modem.registerToNetwork) in the diagnostic details
+    file, to measure the gain of registering first on the remembered network
+        @details: dict of the remembered network, the fallback to automatic registration and the seconds until registered
+        @source: name of the program waiting for the registration
+    """
+    return __logDiagnosticRecord("registration", details, source)
+
 # file containing date & time of the initial successful modem configuration
 uptime_file_path = "/tmp/cellular_data_supervisor_uptime"
 def logUptime():
@@ -129,6 +183,71 @@ def clearUpTime():
     return
 
 
+# file containing the stage timelines of the last configurations of the modem (JSON)
+timings_file_path = "/media/persistent/system/config_modem_timings.json"
+# number of configurations kept in the timings file
+timings_history_size = 25
+
+class StageTimeline(object):
+    """ Timeline of the stages of a modem configuration: start/end (seconds since the start of the configuration,
+    from a monotonic clock), outcome and number of DBus calls of each stage.
+    A stage ends when the next one starts or when the timeline is finished
+    """
+
+    def __init__(self, command, get_dbus_call_count=lambda: 0):
+        """ @command: name of the configuration run (e.g. "loadconf")
+            @get_dbus_call_count: returns the number of DBus calls done so far
+        """
+        self.__start = time.monotonic()
+        self.__get_dbus_call_count = get_dbus_call_count
+        self.__stage = None
+        self.run = { "command": command, "date": datetime.utcnow().strftime(date_format), "stages": [] }
+
+    def __now(self):
+        return round(time.monotonic() - self.__start, 3)
+
+    def __endStage(self, outcome):
+        if self.__stage is None:
+            return
+        self.__stage["end"] = self.__now()
+        self.__stage["duration"] = round(self.__stage["end"] - self.__stage["start"], 3)
+        self.__stage["outcome"] = outcome
+        self.__stage["dbus_calls"] = self.__get_dbus_call_count() - self.__stage["dbus_calls"]
+        self.__stage = None
+
+    def start(self, name):
+        """ start a stage, the current stage (if any) ends successfully
+        """
+        self.__endStage("success")
+        self.__stage = { "name": name, "start": self.__now(), "dbus_calls": self.__get_dbus_call_count() }
+        self.run["stages"].append(self.__stage)
+
+    def finish(self, modem_diagnostic_code):
+        """ end the timeline with the result of the configuration (the current stage fails unless the result is
+        WellConfigured) and save it in the timings file
+        """
+        success = (modem_diagnostic_code == ModemDiagnosticCode.WellConfigured)
+        self.__endStage("success" if success else "failure")
+        self.run["result"] = modem_diagnostic_code.name
+        self.run["duration"] = self.__now()
+        self.run["dbus_calls"] = sum([stage["dbus_calls"] for stage in self.run["stages"]])
+        try:
+            runs = loadTimings()[-(timings_history_size-1):]
+            runs.append(self.run)
+            with open(timings_file_path, 'w') as the_file:
+                json.dump(runs, the_file, indent=1)
+        except:
+            pass
+
+def loadTimings():
+    """ Return the stage timelines of the last modem configurations (list of dict, oldest first), see StageTimeline
+    """
+    try:
+        with open(timings_file_path, 'r') as the_file:
+            return json.load(the_file)
+    except:
+        return []
+
 """ Create and configure a rotating logger to log all stats.
 Stats are logged in stats_file_path. When file the size is about to be exceeded, the file is closed and a new file is silently opened.
 The system will save old log files by appending the extensions .1
@@ -161,3 +280,17 @@ csvlogger.addHandler(handler)
 new_log_file = (not os.path.isfile(stats_file_path) or os.path.getsize(stats_file_path) == 0)
 if (new_log_file):
         csvlogger.info("Time zone;Local time;UTC time;Stat code; signal_strength (dBm); technology")
+
+# Decoded modem diagnostics are logged in their own file, one JSON document per line
+diagnostics_file_path = "/media/persistent/system/cellular_modem_diagnostics.jsonl"
+
+diagnostics_logger = logging.getLogger('cellular_diagnostics_logger')
+diagnostics_logger.propagate = False
+diagnostics_logger.setLevel(logging.INFO)
+try:
+    # current log file is maximum 512Ko.
+    # backup log file is 512Ko
+    diagnostics_handler = RotatingFileHandler(diagnostics_file_path, maxBytes=512*1024, backupCount=1)
+except:
+    diagnostics_handler = NullHandler()
+diagnostics_logger.addHandler(diagnostics_handler)
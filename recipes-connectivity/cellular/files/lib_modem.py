@@ -9,19 +9,35 @@ import time
 import dbus
 import sys
 import socket
-import ctypes
 import lib_network
+import lib_usb
+import lib_modem_definitions
 import glob
+import re
+import json
 import logging
 import lib_logger
+import threading
+import random
+import copy
 from enum import Enum
 from collections import namedtuple
+from lib_modem_definitions import ModemDiagnosticCode
+from gi.repository import GObject
+from dbus.mainloop.glib import DBusGMainLoop
+
+# The DBus mainloop is enabled here, like in lib_wifi, to ensure it is enabled before the caller script
+# connects to DBus. Signal receivers (see ModemSession and ModemPropertyMirror) depend on it.
+dbus.mainloop.glib.threads_init()
+dbus.mainloop.glib.DBusGMainLoop(set_as_default=True)
 
 logger = logging.getLogger(__name__)
 # Add default empty logger to let the user of the library use it without logger defined
 logger.addHandler(logging.NullHandler())
 
 
+# Network interface of the cellular data connection over PPP. ofono reports the actual interface in the settings of
+# the internet context, e.g. "usb0" or "wwan0" when its modem driver uses NCM/ECM: see getDataInterfaceName
 CELLULAR_INTERFACE_NAME = "ppp0"
 
 OFONO_SERVICE = "ofono.service"
@@ -30,74 +46,97 @@ CELLULAR_DATA_SUPERVISOR_TIMER = "cellular_data_supervisor.timer"
 CELLULAR_DATA_SUPERVISOR_SERVICE = "cellular_data_supervisor.service"
 CELLULAR_SIGNAL_STRENGTH_MONITOR_SERVICE = "cellular_signal_strength_monitor.service"
 
+# Timeout (seconds) of a DBus call when no RetryPolicy applies, same as the default of the DBus library
+DBUS_CALL_TIMEOUT = 25
+# Shortest timeout (seconds) given to a DBus call once the deadline of a RetryPolicy is (nearly) over
+MIN_DBUS_CALL_TIMEOUT = 1
+# Timeout (seconds) of the connection of connman to the cellular service: deliberately long, a PPP bring-up on a slow
+# network takes time. Within a RetryPolicy with a deadline, the connection is given the time left before the deadline
+CONNMAN_CONNECT_TIMEOUT = 10000
+
+# Maximum time (seconds) for a North America modem to reboot on its other firmware, usually less than 15 seconds
+FIRMWARE_SWITCH_TIMEOUT = 90
+
 
-# all stuff containing information on USB modems
-USBModemInfo = namedtuple("USBModemInfo", "Name VidPid")
-
-"""List of all USB modems supported by the system. Add here any further amazing modem.
-
-On USBCFG the ProductId of a telit modem can change.
-Per default/factory-config, telit modems will report as productId 0x0036 (ACM + NCM).
-USBCFG value of '2' will be set automatically for Multitech modems by ofono, which
-will put the modem into 'enterprise'-/acm-only mode which reports as 0x0035.
-USBCFG value of '4' actually sets the Modems into ACM + NCM + Suspend mode, which
-reports as 0x0037.
-"""
-__supported_modems = [
-	USBModemInfo("Multitech/Telit", "1bc7:0035"),
-	USBModemInfo("Multitech/Telit", "1bc7:0036"),
-	USBModemInfo("Multitech/Telit", "1bc7:0037"),
-]
-
-class ModemDiagnosticCode(Enum):
-	WellConfigured = 0
-	ModemIsAbsent = 10
-	SeveralModemsArePresent = 11
-	OfonodNotRunning = 15
-	ModemIsNotRecognized = 20
-	SimIsAbsent = 25
-	SimIsPinLocked = 30
-	SimIsPukLocked = 35
-	SimError = 40
-	NetworkIsUnregistered = 45
-	GPRSNetworkNotRegistered = 50
-	APNConnectionFailed = 55
-	InternetContextFailed = 60
-	ContactServerFailed = 65
-	SwitchFirmwareFailed = 70
-	ConfigureTechnologyFailed = 75
+# USB modems supported by the system (see lib_modem_definitions)
+__supported_modems = lib_modem_definitions.supported_modems
 
 # DBus data conversion stuff
+# conversion of DBus basic types, indexed by DBus type
 _dbus2py = {
 	dbus.String : str,
+	dbus.ObjectPath : str,
+	dbus.Signature : str,
+	dbus.UInt64 : int,
+	dbus.Int64 : int,
 	dbus.UInt32 : int,
 	dbus.Int32 : int,
-	dbus.Int16 : int,
 	dbus.UInt16 : int,
-	dbus.UInt64 : int,
-	dbus.Int64 : int,
+	dbus.Int16 : int,
 	dbus.Byte : int,
+	dbus.Double : float,
 	dbus.Boolean : bool,
-	dbus.ByteArray : str,
-	dbus.ObjectPath : str
+	dbus.ByteArray : lambda d: bytes(d).decode("latin-1")
 }
 
 def __dbus2py(d):
 	"""DBus data conversion stuff
+	Containers (Dictionary, Array, Struct) are walked with an explicit stack rather than recursively, and the elements
+	of basic types they hold are converted in place, without going through the stack
 	"""
-	t = type(d)
-	if t in _dbus2py:
-		return _dbus2py[t](d)
-	if t is dbus.Dictionary:
-		return dict([(__dbus2py(k), __dbus2py(v)) for k, v in list(d.items())])
-	if t is dbus.Array and d.signature == "y":
-		return "".join([chr(b) for b in d])
-	if t is dbus.Array or t is list:
-		return [__dbus2py(v) for v in d]
-	if t is dbus.Struct or t is tuple:
-		return tuple([__dbus2py(v) for v in d])
+	converter = _dbus2py.get(type(d))
+	if converter != None:
+		return converter(d)
+
+	root = [d]
+	stack = [(d, root, 0)]	# (value to convert, container of its converted value, index of its converted value in this container)
+	structs = []		# (container, index) of structs converted as lists, to turn into tuples once their content is converted
+	while stack:
+		value, parent, key = stack.pop()
+		t = type(value)
+		converter = _dbus2py.get(t)
+		if converter != None:
+			parent[key] = converter(value)
+		elif t is dbus.Dictionary or t is dict:
+			converted = {}
+			parent[key] = converted
+			for k, v in value.items():
+				k = _dbus2py.get(type(k), __identity)(k)
+				converter = _dbus2py.get(type(v))
+				if converter != None:
+					converted[k] = converter(v)
+				else:
+					converted[k] = v
+					stack.append((v, converted, k))
+		elif t is dbus.Array and value.signature == "y":
+			parent[key] = bytes(value).decode("latin-1")
+		elif t is dbus.Array or t is list or t is dbus.Struct or t is tuple:
+			converted = list(value)
+			parent[key] = converted
+			if t is dbus.Struct or t is tuple:
+				structs.append((parent, key))
+			for i, v in enumerate(converted):
+				converter = _dbus2py.get(type(v))
+				if converter != None:
+					converted[i] = converter(v)
+				else:
+					stack.append((v, converted, i))
+		else:
+			parent[key] = value
+
+	# structs nested in other structs were registered after them, so they are turned into tuples first
+	for parent, key in reversed(structs):
+		parent[key] = tuple(parent[key])
+	return root[0]
+
+def __identity(d):
 	return d
 
+def dbus2py(d):
+	"""Convert a DBus value (e.g. properties read on ofono) and the values it contains into Python types
+	"""
+	return __dbus2py(d)
+
 def getConfigModemFilePath():
 	"""path to the file containing modem configuration file
 	"""
@@ -181,6 +220,11 @@ def removeConfigModemFile():
 
 	lib_system.sync()
 
+def isSupportedModem(vid_pid):
+	""" Return True when the USB device identified by vid_pid (e.g. "1bc7:0036") is a supported modem
+	"""
+	return lib_modem_definitions.isSupportedModem(vid_pid)
+
 def listUSBModems(verbose=False):
 	""" Return list of supported USB modems currently mounted by the system.
 	tuple (count, message, list)
@@ -194,78 +238,353 @@ def listUSBModems(verbose=False):
 	mounted_modems = []
 	message = "No modem found"
 
-	# We search modems mounted by the system
-	for supported_modem in __supported_modems:
-		try:
-			# check if this modem exists in the system using lsusb command (searched by vendor Id & product Id)
-			command = ['lsusb', '-d', supported_modem.VidPid]
-			with open(os.devnull, 'w') as shutup:
-				subprocess.check_call(command, stdout=shutup, stderr=shutup)
-			count += 1
-			mounted_modems.append(supported_modem)
+	# We search modems mounted by the system (sysfs is read once for all supported modems), identical modems are
+	# listed once per device
+	try:
+		devices = lib_usb.listRegisteredUSBDevices()
+		for supported_modem in lib_usb.findSupportedDevices(__supported_modems, devices):
+			for device in devices[supported_modem.VidPid]:
+				count += 1
+				mounted_modems.append(supported_modem)
 
-			message = "Modem \'%s\' is detected" % (supported_modem.Name)
-			if verbose:
-				logger.info(message)
+				message = "Modem \'%s\' is detected" % (supported_modem.Name)
+				if verbose:
+					logger.info(message)
 
-		except subprocess.CalledProcessError as e:
-			# this exception is raised when lusb commands failed to find a specific device
-			# in this case we look for the next one
-			pass
-		except Exception as e:
-			if verbose:
-				logger.error("Generic exception while getting USB modem(s):%s" % (e))
-			break
+	except Exception as e:
+		if verbose:
+			logger.error("Generic exception while getting USB modem(s):%s" % (e))
 	if count > 1:
-		message = "Several modems are installed"
+		message = "%d modems are installed" % (count)
 	if verbose and count != 1:
 		logger.info(message)
 
 	return count, message, mounted_modems
 
-def sendSerialCommandToModem(command, read_timeout = 1):
-	""" Send a command to the modem via serial line. return tuple (status, modem answer or error message)
-	Note: As it directly opens modem serial port, this function cannot be called when ofono is running...
+# Serial port of the modem used for AT commands (the one also used by ofono)
+MODEM_SERIAL_PORT = "/dev/ttyACM0"
+
+# Line settings of the modem serial port (the simulated modem of tools/modem_simulator.py overrides them, a
+# pseudo-terminal rejecting these settings when opened again)
+MODEM_SERIAL_SETTINGS = {
+	"baudrate": 115200,
+	"parity": serial.PARITY_ODD,
+	"stopbits": serial.STOPBITS_TWO,
+	"bytesize": serial.SEVENBITS
+}
+
+# Read timeout (seconds) of the serial port, short enough to return when the deadline of a command is over
+AT_CHANNEL_READ_TIMEOUT = 0.1
+
+# Timeout (seconds) of the AT command probing a secondary serial port of the modem, ports not answering AT commands
+# (e.g. trace ports) must not delay the search of a free port
+SECONDARY_AT_PORT_PROBE_TIMEOUT = 0.5
+
+# Final result codes ending the answer of the modem to an AT command: a whole line, or a line starting with one of
+# the error prefixes followed by the error code (e.g. "+CME ERROR: SIM not inserted")
+_final_result_codes = ("OK", "ERROR", "NO CARRIER")
+_final_error_prefixes = ("+CME ERROR:", "+CMS ERROR:")
+
+def _isFinalResultCode(line):
+	line = line.strip()
+	return line in _final_result_codes or line.startswith(_final_error_prefixes)
+
+# Extended commands answering without their name as prefix (e.g. "LE910-EU V2" for +CGMM): they cannot be chained as
+# their answers cannot be told apart in the answer of a chain
+_unprefixed_answer_commands = ("+CGMM", "+CGSN", "+CGMR", "+CIMI", "+GMM", "+GSN", "+GMR", "+GMI", "+CGMI")
+
+class ATChannel(object):
+	"""Session of AT commands with the modem over its serial port. The port is opened on the first command and kept
+	open until close() (or the end of a "with" statement). The answer to a command is returned as soon as the modem
+	sends its final result code (OK, ERROR, +CME ERROR...), the timeout of a command only applies to a modem not answering.
+	Note: The default port is the one used by ofono, use openModemATChannel() when ofono may be running...
+	With exclusive, the port is locked (flock) while open so that other sessions cannot open it.
 	"""
-	if len(command) == 0:
-		return False, "Command to send is empty"
 
-	try:
-		ser = serial.Serial(
-			port='/dev/ttyACM0',
-			baudrate=115200,
-			timeout=read_timeout,	#read timeout
-			write_timeout=1,	#write timeout
-			parity=serial.PARITY_ODD,
-			stopbits=serial.STOPBITS_TWO,
-			bytesize=serial.SEVENBITS
-		)
-	except serial.SerialException as e:
-		return False, "Exception while creating serial communication with modem %s" % (e)
+	def __init__(self, port=None, exclusive=False):
+		# default port is read at creation so that it can be changed at run time (e.g. for a simulated modem)
+		self.port = port if port != None else MODEM_SERIAL_PORT
+		self.exclusive = exclusive
+		self.serial = None
+
+	def open(self):
+		"""open the serial port if not already open, raise serial.SerialException on failure
+		"""
+		if self.serial == None:
+			self.serial = serial.Serial(
+				port=self.port,
+				timeout=AT_CHANNEL_READ_TIMEOUT,	#read timeout, the deadline of a command is checked after each read
+				write_timeout=1,	#write timeout
+				exclusive=self.exclusive,
+				**MODEM_SERIAL_SETTINGS
+			)
+
+	def close(self):
+		if self.serial != None:
+			try:
+				self.serial.close()
+			except Exception:
+				pass
+			self.serial = None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exception):
+		self.close()
+		return False
+
+	def sendCommand(self, command, timeout=1):
+		""" Send an AT command (carriage return is added if missing) and read the answer of the modem until its final
+		result code, for at most timeout seconds. return tuple (status, modem answer or error message), status being
+		True when the modem answered with a final result code (the answer may be an error from the modem)
+		"""
+		command = command.rstrip("\r\n")
+		if len(command) == 0:
+			return False, "Command to send is empty"
 
-	try:
-		answer = ''
-		one_line = ''
+		try:
+			self.open()
+		except Exception as e:
+			return False, "Exception while creating serial communication with modem %s" % (e)
 
-		# send the command and retrieve the answer sent by the modem
-		ser.write(command.encode())
-		ser.flush()
+		try:
+			# drop anything received since the previous command (late answer, unsolicited result code)
+			self.serial.reset_input_buffer()
+
+			# send the command and retrieve the answer sent by the modem
+			self.serial.write((command + "\r").encode())
+			self.serial.flush()
+
+			answer = ''
+			one_line = ''
+			deadline = time.monotonic() + timeout
+			while True:
+				# a read returns a partial line when the modem has not sent the end of the line yet
+				one_line += self.serial.readline().decode("utf-8", "replace")
+				if one_line.endswith("\n"):
+					answer += one_line
+					if _isFinalResultCode(one_line):
+						return True, answer
+					one_line = ''
+				if time.monotonic() >= deadline:
+					return False, "No final result code from modem within %.1f s, answer: %s" % (timeout, answer + one_line)
 
-		# read on serial until empty line
-		while True:
-			one_line = ser.readline().decode("utf-8")
-			if len(one_line) == 0:
-				break
-			answer+=one_line
-		ser.close()
+		except Exception as e:
+			# the port is in an unknown state: it is opened again for the next command
+			self.close()
+			return False, "Exception sending/reading serial command to the modem : %s" % (e)
+
+	def sendCommands(self, commands, timeout=2):
+		""" Send several AT commands and return the list of their answers (tuple (status, answer) like sendCommand), in
+		the order of commands. Read and execution commands answering with their name as prefix (e.g. "AT+CREG?",
+		"AT+CSQ") are chained on a single command line ("AT+CREG?;+CSQ") and their answers are split from the answer of
+		the chain. Other commands, and chained commands when the chain fails, are sent one by one
+		"""
+		results = [None] * len(commands)
+		chain = []
+		for index, command in enumerate(commands):
+			match = re.match(r"^AT(\+[A-Z]+)\??$", command.strip().upper())
+			if match and match.group(1) not in _unprefixed_answer_commands:
+				chain.append((index, match.group(1)))
+			else:
+				results[index] = self.sendCommand(command, timeout)
+
+		if len(chain) > 1:
+			# the chain is given the timeout of a single command: the commands chained answer quickly, a command not
+			# answering is found by sending the commands one by one
+			status, answer = self.sendCommand("AT" + ";".join([commands[index].strip()[2:] for index, name in chain]), timeout)
+			lines = [line.strip() for line in answer.splitlines()]
+			if status and lines[-1] == "OK":
+				for index, name in chain:
+					results[index] = (True, "".join([line + "\r\n" for line in lines if line.startswith(name + ":")]) + "OK\r\n")
+				chain = []
+
+		# single command or failed chain (an error of any command of the chain fails the whole chain)
+		for index, name in chain:
+			results[index] = self.sendCommand(commands[index], timeout)
+
+		return results
+
+# Parsing of the answers of AT commands used for diagnostic (see LE910 AT Commands Reference Guide)
+_registration_status = {
+	0: "not registered",
+	1: "registered, home network",
+	2: "searching",
+	3: "registration denied",
+	4: "unknown",
+	5: "registered, roaming"
+}
 
-	except Exception as e:
-		ser.close()
-		return False, "Exception sending/reading serial command to the modem : %s" % (e)
+_access_technologies = {
+	0: "GSM",
+	1: "GSM Compact",
+	2: "UTRAN",
+	3: "GSM w/EGPRS",
+	4: "UTRAN w/HSDPA",
+	5: "UTRAN w/HSUPA",
+	6: "UTRAN w/HSDPA and HSUPA",
+	7: "E-UTRAN"
+}
+
+def __parseAccessTechnology(result, value):
+	result["act"] = int(value)
+	result["technology"] = _access_technologies.get(result["act"], "unknown")
+
+def __parseCSQ(values):
+	# +CSQ: <rssi>,<ber>, rssi 99 means not known or not detectable
+	rssi = int(values[0])
+	return { "rssi": rssi, "ber": int(values[1]), "rssi_dbm": -113 + 2*rssi if rssi <= 31 else None }
+
+def __parseRegistration(values, area_name):
+	# +CREG: <n>,<stat>[,<lac>,<ci>[,<AcT>]] (+CEREG: <tac> instead of <lac>)
+	result = { "n": int(values[0]), "stat": int(values[1]) }
+	result["status"] = _registration_status.get(result["stat"], "unknown")
+	if len(values) >= 4:
+		result[area_name] = values[2]
+		result["ci"] = values[3]
+	if len(values) >= 5 and len(values[4]) > 0:
+		__parseAccessTechnology(result, values[4])
+	return result
+
+def __parseCOPS(values):
+	# +COPS: <mode>[,<format>,<oper>[,<AcT>]]
+	result = { "mode": int(values[0]) }
+	if len(values) >= 3:
+		result["format"] = int(values[1])
+		result["operator"] = values[2]
+	if len(values) >= 4 and len(values[3]) > 0:
+		__parseAccessTechnology(result, values[3])
+	return result
+
+# parsers of answers prefixed by the command name, given the values of the answer
+_at_answer_parsers = {
+	"+CSQ": __parseCSQ,
+	"+CREG": lambda values: __parseRegistration(values, "lac"),
+	"+CGREG": lambda values: __parseRegistration(values, "lac"),
+	"+CEREG": lambda values: __parseRegistration(values, "tac"),
+	"+COPS": __parseCOPS,
+	"+CPIN": lambda values: { "state": values[0] },
+	"+CFUN": lambda values: { "mode": int(values[0]) },
+	"+CGATT": lambda values: { "attached": values[0] == "1" },
+	"+CEMODE": lambda values: { "mode": int(values[0]) },
+}
+
+def parseATAnswer(command, answer):
+	""" Decode the answer of the modem to an AT command used for diagnostic, return a dict:
+		- { "error": final result code or message } when the command failed
+		- the decoded values for commands answering with their name as prefix, e.g. { "rssi": 17, "ber": 99, "rssi_dbm": -79 } for AT+CSQ
+		- { "value": answer line } for other commands (e.g. AT+CGMM, AT+CIMI)
+	"""
+	lines = [line.strip() for line in answer.splitlines() if len(line.strip()) > 0]
+	if len(lines) == 0 or lines[-1] != "OK":
+		return { "error": lines[-1] if len(lines) > 0 else "No answer" }
+
+	match = re.match(r"^AT(\+[A-Z]+)", command.strip().upper())
+	name = match.group(1) if match else None
+	# skip echo of the command and final result code
+	lines = [line for line in lines[:-1] if not line.upper().startswith("AT")]
+	try:
+		if name in _at_answer_parsers:
+			for line in lines:
+				if line.startswith(name + ":"):
+					values = [value.strip().strip('"') for value in line[len(name)+1:].split(",")]
+					return _at_answer_parsers[name](values)
+			return { "error": "No %s answer" % (name) }
+		return { "value": lines[0] if len(lines) > 0 else "" }
+	except (ValueError, IndexError):
+		return { "error": "Unexpected answer \"%s\"" % (" ".join(lines)) }
+
+def listModemSerialPorts(modem=None):
+	""" Return the ACM serial ports (e.g. "/dev/ttyACM0") of the supported USB modems (of modem only, when given), sorted
+	by number. Telit LE910 modems expose several ACM ports answering AT commands, ofono uses the first one
+	"""
+	if modem != None:
+		if modem.UsbPath == None:
+			return []
+		devices = { modem.VidPid: [lib_usb.USBDevice(modem.VidPid, modem.Serial, modem.UsbPath)] }
+	else:
+		devices = lib_usb.listUSBDevices()
+	ports = []
+	for supported_modem in lib_usb.findSupportedDevices(__supported_modems, devices):
+		for device in devices[supported_modem.VidPid]:
+			ports += ["/dev/" + tty for tty in lib_usb.listDeviceTTYs(device) if tty.startswith("ttyACM")]
+	return sorted(ports, key=lambda port: int(re.sub(r"\D", "", port)))
+
+def getModemSerialPort(modem=None):
+	""" Return the serial port of the modem used by ofono for AT commands: MODEM_SERIAL_PORT, the first serial port of
+	modem when given (None when it has none)
+	"""
+	if modem == None:
+		return MODEM_SERIAL_PORT
+	ports = listModemSerialPorts(modem)
+	return ports[0] if len(ports) > 0 else None
+
+def getSerialPortsUsedBy(process_name):
+	""" Return the set of the serial ports (e.g. "/dev/ttyACM0") opened by the processes named process_name
+	"""
+	ports = set()
+	for pid in [entry for entry in os.listdir("/proc") if entry.isdigit()]:
+		try:
+			with open("/proc/%s/comm" % (pid)) as comm:
+				if comm.read().strip() != process_name:
+					continue
+			fd_directory = "/proc/%s/fd" % (pid)
+			for fd in os.listdir(fd_directory):
+				target = os.readlink(os.path.join(fd_directory, fd))
+				if target.startswith("/dev/tty"):
+					ports.add(target)
+		except (IOError, OSError):
+			# process ended or file descriptor closed meanwhile
+			continue
+	return ports
+
+def openSecondaryATChannel(modem=None):
+	""" Claim a serial port of the modem that ofono does not use and that answers AT commands, so that AT commands can
+	be sent while ofono is running. The port is locked while the channel is open.
+	return tuple (ATChannel or None, message), the channel has to be closed by the caller
+	"""
+	used_ports = getSerialPortsUsedBy("ofonod")
+	ofono_port = getModemSerialPort(modem)
+	for port in listModemSerialPorts(modem):
+		if port == ofono_port or port in used_ports:
+			continue
+		channel = ATChannel(port, exclusive=True)
+		status, answer = channel.sendCommand("AT", SECONDARY_AT_PORT_PROBE_TIMEOUT)
+		if status and answer.find('OK') != -1:
+			return channel, "AT commands are sent on secondary port %s" % (port)
+		# not an AT port, or already claimed
+		channel.close()
+	return None, "No modem serial port is free for AT commands"
+
+def openModemATChannel(modem=None):
+	""" Return tuple (ATChannel or None, message): a channel on the port of ofono when ofono is not running, on a
+	secondary port of the modem otherwise (see openSecondaryATChannel). The channel has to be closed by the caller
+	"""
+	ofonod_running, _ = isOfonodRunning()
+	if not ofonod_running:
+		port = getModemSerialPort(modem)
+		if port == None:
+			return None, "Modem %s has no serial port" % (modem.describe())
+		return ATChannel(port), "AT commands are sent on port %s" % (port)
+	return openSecondaryATChannel(modem)
+
+def sendSerialCommandToModem(command, read_timeout = 1):
+	""" Send a command to the modem via serial line. return tuple (status, modem answer or error message)
+	The serial port is opened for this command only, use an ATChannel to send several commands
+	Note: As it directly opens modem serial port, this function cannot be called when ofono is running...
+	"""
+	with ATChannel() as channel:
+		return channel.sendCommand(command, read_timeout)
 
-	return True, answer
+def __sendATCommand(channel, command, timeout):
+	"""Send a command on channel, or on a dedicated channel when channel is None
+	"""
+	if channel == None:
+		return sendSerialCommandToModem(command, timeout)
+	return channel.sendCommand(command, timeout)
 
-def checkModemReadyForATCommands(verbose = False):
+def checkModemReadyForATCommands(verbose = False, channel = None):
 	""" Send a basic AT command to the modem in order to validate that the modem is ready to exchange some AT commands, return tuple (status, message)
 	Note: As it directly opens modem serial port, this function cannot be called when ofono is running...
 	"""
@@ -276,7 +595,7 @@ def checkModemReadyForATCommands(verbose = False):
 
 	# send basic AT command that retrieves modem serial number
 	# we don't care about the returned serial number itself; 'OK' in the answer is good enough to determine that it is ready for some AT commands
-	serial_command_status, modem_answer = sendSerialCommandToModem("AT+CGMR\r")
+	serial_command_status, modem_answer = __sendATCommand(channel, "AT+CGMR", 1)
 
 	status = False
 	message = ""
@@ -295,7 +614,7 @@ def checkModemReadyForATCommands(verbose = False):
 
 	return status, message
 
-def loadModemFactoryConfiguration(verbose = False):
+def loadModemFactoryConfiguration(verbose = False, channel = None):
 	""" Set modem configuration to "Factory-Defined Configuration".
 	It sets the configuration parameters to default values specified by manufacturer.
 	Both the factory profile base section and the extended section are considered (full factory profile).
@@ -307,8 +626,8 @@ def loadModemFactoryConfiguration(verbose = False):
 		logger.info("-Load modem factory-defined configuration")
 
 	# Factory defined configuration is set by sending a specific AT command
-	# increase read timeout as this command is longer to execute
-	serial_command_status, modem_answer = sendSerialCommandToModem("AT&F1\r", 2)
+	# increase timeout as this command is longer to execute
+	serial_command_status, modem_answer = __sendATCommand(channel, "AT&F1", 2)
 
 	status = False
 	message = ""
@@ -329,111 +648,207 @@ def loadModemFactoryConfiguration(verbose = False):
 
 	return status, message
 
-def logModemDiagnosticInformation():
-	""" Log a set of information from modem for diagnostic purpose
-	Note: As it directly opens modem serial port, this function should not be called when ofono is running...
+def logModemDiagnosticInformation(modem=None):
+	""" Log a set of information from modem for diagnostic purpose. Return these information decoded (see parseATAnswer),
+	indexed by name (e.g. "signal", "operator"), an empty dict when they could not be collected
+	When ofono is running, the commands are sent on a secondary serial port of the modem (see openSecondaryATChannel)
 	"""
 
 	logger.info("")
 	logger.info("-Collect modem diagnostic information")
 
-	# check ofonod is not running
-	ofonod_running, _ = isOfonodRunning()
-	if ofonod_running:
-		logger.warning("Cannot collect modem information as Ofonod process is running")
-		return
-
-	# check modem is ready for AT commands, wait a bit and retry if necessary
-	modem_ready_for_AT_commands, message = __retryFunction(checkModemReadyForATCommands, None, False, 5, 1)
+	channel, message = openModemATChannel(modem)
+	if channel == None:
+		logger.warning("Cannot collect modem information: %s" % (message))
+		return {}
 	logger.info(message)
-	if not modem_ready_for_AT_commands:
-		return
 
-	# list of AT commands executed on modem to build diagnostic
+	# all commands are sent in a single session on the serial port
+	with channel:
+		# check modem is ready for AT commands, wait a bit and retry if necessary
+		modem_ready_for_AT_commands, message = __retryFunction(lambda verbose: checkModemReadyForATCommands(verbose, channel), None, False, 5, 1)
+		logger.info(message)
+		if not modem_ready_for_AT_commands:
+			return {}
+
+		return __logATCommands(channel)
+
+def __logATCommands(channel):
+	"""Execute and log the AT commands of the modem diagnostic, return their decoded answers indexed by name
+	"""
+
+	# list of AT commands executed on modem to build diagnostic: (label in logs, command, name of decoded answer)
 	commands_to_execute = [
-		("Set Echo", "ATE1\r"),
-		("Set Verbose", "AT+CMEE=2\r"),
-		("Model", "AT+CGMM\r"),
-		("Serial", "AT+CGSN\r"),
-		("Version", "AT+CGMR\r"),
-		("Mode of operation", "AT+CEMODE?\r"),
-		("Phone Functionality", "AT+CFUN?\r"),
-		("SIM PIN status", "AT+CPIN?\r"),
-		("IMSI", "AT+CIMI\r"),
-		("GPRS Attachment state", "AT+CGATT?\r"),
-		("Network registration", "AT+CREG?\r"),
-		("GPRS Network Registration", "AT+CGREG?\r"),
-		("LTE Network Registration", "AT+CEREG?\r"),
-		("Operator", "AT+COPS?\r"),
-		("Signal", "AT+CSQ\r")
+		("Set Echo", "ATE1", None),
+		("Set Verbose", "AT+CMEE=2", None),
+		("Model", "AT+CGMM", "model"),
+		("Serial", "AT+CGSN", "serial"),
+		("Version", "AT+CGMR", "version"),
+		("Mode of operation", "AT+CEMODE?", "mode_of_operation"),
+		("Phone Functionality", "AT+CFUN?", "functionality"),
+		("SIM PIN status", "AT+CPIN?", "sim_pin"),
+		("IMSI", "AT+CIMI", "imsi"),
+		("GPRS Attachment state", "AT+CGATT?", "gprs_attachment"),
+		("Network registration", "AT+CREG?", "registration"),
+		("GPRS Network Registration", "AT+CGREG?", "gprs_registration"),
+		("LTE Network Registration", "AT+CEREG?", "lte_registration"),
+		("Operator", "AT+COPS?", "operator"),
+		("Signal", "AT+CSQ", "signal")
 	]
 
+	diagnostic = {}
 	try:
-		# execute and log results for each AT command
-		for command in commands_to_execute:
-			# Extract from "LE910 AT Commands Reference Guide" : "The time needed to process the given command and return the response varies, depending on the command type.
-			# Commands that do not interact with the SIM or the network, and only involve internal setups or readings, have an immediate response"
-			# I decreased default timeout to 500ms (15 times longer than observed response time)
-			_, modem_answer = sendSerialCommandToModem(command[1], 0.5)
+		# execute AT commands, chained when possible, and log results for each of them
+		# Extract from "LE910 AT Commands Reference Guide" : "The time needed to process the given command and return the response varies, depending on the command type.
+		# Commands that do not interact with the SIM or the network, and only involve internal setups or readings, have an immediate response"
+		# The answer is returned as soon as it is complete: the timeout only bounds a modem not answering
+		start = time.monotonic()
+		results = channel.sendCommands([command[1] for command in commands_to_execute], 2)
+		for command, (_, modem_answer) in zip(commands_to_execute, results):
 			logger.info(command[0] + ": " + modem_answer)
+			if command[2] != None:
+				diagnostic[command[2]] = parseATAnswer(command[1], modem_answer)
+		logger.info("Diagnostic information collected in %.2f s" % (time.monotonic() - start))
 	except Exception as e:
 		logger.info("Exception while collecting diagnostic information from modem")
 
-def rebootModemHard():
-	""" Perform a hard reboot on modem connected to external USB box.
-	"""
-	logger.info("")
-	logger.info("-Reboot USB modem (hard)")
+	return diagnostic
 
-	try:
-		# call a dedicated sh script to perform this hard reset
-		command = ['reboot_modem.sh']
-		with open(os.devnull, 'w') as shutup:
-			subprocess.check_call(command, stdout=shutup, stderr=shutup)
+# Time (seconds) given to the modem to come back after a reset, until it answers AT commands
+MODEM_RESET_TIMEOUT = 90
 
-	except Exception as e:
-		return False, "exception hard rebooting modem:%s" % (e)
-
-	return True, "modem rebooted (hard)"
+# Interval (seconds) between the AT commands probing the modem once its serial ports are back after a reset
+MODEM_RESET_PROBE_INTERVAL = 0.5
 
-def rebootCurrentModem():
-	"""look for USB modem currently mounted on the system and reboot it. This is a soft reset.
+def resetModem(hard=False, timeout=MODEM_RESET_TIMEOUT, modem=None):
+	""" Reset the modem and wait until it is back: its serial ports removed and created again (kernel uevents), then
+	answering AT commands. A soft reset re-enumerates the modem on USB (toggle of its sysfs "authorized" attribute), a
+	hard reset powers the external USB box off and on (reboot_modem.sh), i.e. all the modems of the box: all of them are
+	awaited. When several modems are attached, the modem to soft reset (ModemHandle) must be given.
+	return tuple (status, message, details), details being the measured times for statistics, e.g.
+	{ "reset": "soft", "detached": 0.12, "ready": 7.45, "firmware": "20.00.403" }: seconds from the reset to the removal of
+	the serial ports and to the first answer to AT commands of the last modem back, firmware revision of the modem (of
+	the first one, after a hard reset of several modems)
 	"""
-
-	# look for a compatible modem on the system and reboot-it
-	mounted_modems_count, mounted_modems_message, mounted_modems_list = listUSBModems(False)
-	if mounted_modems_count == 1:
-		ids = mounted_modems_list[0][1].split(":")
-		int_idVendor = int(ids[0], 16)
-		int_idProduct = int(ids[1], 16)
-		return rebootUSbDeviceModem(int_idVendor, int_idProduct)
+	reset = "hard" if hard else "soft"
+	details = { "reset": reset, "detached": None, "ready": None, "firmware": None }
 
 	logger.info("")
-	logger.info("Error while detecting modem to reboot: %s" % (mounted_modems_message))
-
-	return False, mounted_modems_message
+	logger.info("-Reset USB modem (%s)" % (reset))
+
+	devices = lib_usb.listUSBDevices()
+	modems = [device for supported_modem in lib_usb.findSupportedDevices(__supported_modems, devices) for device in devices[supported_modem.VidPid]]
+	if modem != None and len(modems) > 1 and not hard:
+		modems = [device for device in modems if os.path.realpath(device.Path) == modem.UsbPath]
+	if not hard and len(modems) != 1:
+		if len(modems) > 1:
+			return False, "Cannot reset modem (soft): %d modems found, the modem to reset must be given" % (len(modems)), details
+		return False, "Cannot reset modem (soft): no modem found", details
+	# kernel paths of the USB devices of the modems (e.g. "/devices/soc0/.../1-1"), their serial ports being below them
+	device_paths = [os.path.realpath(device.Path)[len("/sys"):] for device in modems]
 
-def rebootUSbDeviceModem(idVendor, idProduct):
-	"""reboot the external modem by the resetUsbDevice function from libusb library. This is a soft reset.
-	"""
-
-	logger.info("")
-	logger.info("-Reboot USB modem (soft)")
-
-	modem_library_name = 'libModem.so'
 	try:
-		# External modem reboot is done by using a dedicated C library
-		modem_lib = ctypes.CDLL(modem_library_name)
-		modem_lib.ResetUsbDevice(idVendor, idProduct)
+		# uevents are queued from now on: none can be missed while the reset is triggered
+		uevent_socket = lib_usb.openUeventSocket()
+	except OSError as e:
+		return False, "exception listening to kernel uevents:%s" % (e), details
+
+	with uevent_socket:
+		start = time.monotonic()
+		deadline = start + timeout
+		try:
+			if hard:
+				# call a dedicated sh script to perform this hard reset, the modems coming back are awaited below
+				with open(os.devnull, 'w') as shutup:
+					subprocess.check_call(['reboot_modem.sh', '--no-wait'], stdout=shutup, stderr=shutup)
+			else:
+				for value in ("0", "1"):
+					with open(os.path.join(modems[0].Path, "authorized"), "w") as authorized:
+						authorized.write(value)
+		except Exception as e:
+			return False, "exception resetting modem (%s):%s" % (reset, e), details
+
+		# wait for the serial ports of each modem to be removed, then created again. Without modem before a hard reset,
+		# the serial ports of any modem are awaited
+		detached = set()
+		back = set()
+		while len(back) < max(1, len(device_paths)):
+			remaining = deadline - time.monotonic()
+			uevent = lib_usb.readUevent(uevent_socket, remaining) if remaining > 0 else None
+			if uevent == None:
+				return False, "Modem serial ports not back within %d s after reset (%s), %d/%d modem(s) back" % (timeout, reset, len(back), len(device_paths)), details
+			if uevent.get("SUBSYSTEM") != "tty" or not uevent.get("DEVNAME", "").startswith("ttyACM"):
+				continue
+			device_path = next((path for path in device_paths if uevent.get("DEVPATH", "").startswith(path + "/")), None)
+			if device_path == None:
+				if len(device_paths) > 0:
+					# serial port of another modem
+					continue
+				device_path = ""
+				detached.add(device_path)
+			if uevent.get("ACTION") == "remove" and device_path not in detached:
+				detached.add(device_path)
+				if len(detached) == len(device_paths):
+					details["detached"] = round(time.monotonic() - start, 2)
+			elif uevent.get("ACTION") == "add" and device_path in detached:
+				back.add(device_path)
+
+	# the modems answer AT commands a bit after their serial ports are created
+	if len(modems) > 1:
+		handles = [ModemHandle(None, device.Serial, device.VidPid, os.path.realpath(device.Path)) for device in modems]
+	else:
+		handles = [modem]
+	firmwares = {}
+	while True:
+		for index, handle in enumerate(handles):
+			if index in firmwares:
+				continue
+			channel, _ = openModemATChannel(handle)
+			if channel == None:
+				continue
+			with channel:
+				status, answer = channel.sendCommand("AT+CGMR", 1)
+			if status and answer.find('OK') != -1:
+				firmwares[index] = parseATAnswer("AT+CGMR", answer).get("value")
+		if len(firmwares) == len(handles):
+			details["ready"] = round(time.monotonic() - start, 2)
+			details["firmware"] = firmwares[0]
+			break
+		if time.monotonic() >= deadline:
+			return False, "Modem not answering AT commands within %d s after reset (%s), %d/%d modem(s) ready" % (timeout, reset, len(firmwares), len(handles)), details
+		time.sleep(MODEM_RESET_PROBE_INTERVAL)
+
+	# the registry of USB devices is updated from the same uevents by another process: its readers (e.g. ModemRegistry)
+	# must not get the modems as they were before the reset
+	while not __isUSBRegistryUpToDate():
+		if time.monotonic() >= deadline:
+			logger.warning("Registry of USB devices not up to date after reset (%s)" % (reset))
+			break
+		time.sleep(MODEM_RESET_PROBE_INTERVAL)
+	if len(handles) > 1:
+		return True, "%d modems reset (%s) and ready in %.1f s" % (len(handles), reset, details["ready"]), details
+	return True, "Modem reset (%s) and ready in %.1f s" % (reset, details["ready"]), details
+
+def __isUSBRegistryUpToDate():
+	""" Return True when the registry of USB devices (see lib_usb.listRegisteredUSBDevices) lists the supported modems
+	attached according to sysfs
+	"""
+	def listModemDevices(devices):
+		return set([(device.VidPid, device.Serial, os.path.realpath(device.Path)) for supported_modem in lib_usb.findSupportedDevices(__supported_modems, devices) for device in devices[supported_modem.VidPid]])
+	return listModemDevices(lib_usb.listRegisteredUSBDevices()) == listModemDevices(lib_usb.listUSBDevices())
 
-		# wait a bit to let the modem reboot
-		time.sleep(10)
+def rebootModemHard():
+	""" Perform a hard reboot on modem connected to external USB box, return when the modem is back (see resetModem).
+	"""
+	status, message, _ = resetModem(True)
+	return status, message
 
-		return True, "Reboot is done"
-	except Exception as e:
-		logger.exception("Exception while rebooting USB modem:%s" % (e))
-		pass
-	return False, "Exception while rebooting USB modem:%s" % (e)
+def rebootCurrentModem():
+	"""look for USB modem currently mounted on the system and reboot it. This is a soft reset, return when the modem is
+	back (see resetModem).
+	"""
+	status, message, _ = resetModem(False)
+	return status, message
 
 def restartConnman():
 	return lib_system.restartService(CONNMAN_SERVICE)
@@ -501,50 +916,758 @@ def enableCellularSignalStrengthMonitor():
 def disableCellularSignalStrengthMonitor():
 	return lib_system.disableService(CELLULAR_SIGNAL_STRENGTH_MONITOR_SERVICE)
 
+class ModemHandle(namedtuple("ModemHandle", "Path Serial VidPid UsbPath")):
+	"""Modem given to the functions of this library when several modems are attached (see ModemRegistry): ofono path
+	(None when the modem is not on DBus), USB serial number ("" when the device has none), "vid:pid" and sysfs directory
+	of the USB device (None for a modem found on DBus only).
+	The modem is identified by its USB device, its ofono path may change when it comes back after a reset
+	"""
+	__slots__ = ()
+
+	def getKey(self):
+		"""return the key identifying the modem: its USB device, its ofono path for a modem found on DBus only
+		"""
+		return self.UsbPath if self.UsbPath != None else self.Path
+
+	def describe(self):
+		name = self.Path if self.Path != None else self.VidPid
+		if len(self.Serial) > 0:
+			return "%s (USB serial %s)" % (name, self.Serial)
+		return name
+
+	def findPath(self, modems):
+		"""return the path of this modem among modems (result of GetModems), None when it is not there
+		"""
+		for path, properties in modems:
+			if self.UsbPath != None:
+				# "SystemPath" is the sysfs directory of the USB device of the modem
+				if os.path.realpath(str(properties.get("SystemPath", ""))) == self.UsbPath:
+					return path
+			elif str(path) == self.Path:
+				return path
+		return None
+
+class ModemSession(object):
+	"""Resolve the path of the modem on ofono DBus once and cache the DBus interfaces built on it.
+
+	Building a dbus.Interface costs nothing on the bus but resolving the modem path costs a GetModems call,
+	so the path and the interfaces are kept until they become stale:
+	- ofono signals ModemAdded or ModemRemoved, or ofono itself leaves the bus (signals are only dispatched when a main loop is running)
+	- a DBus call made through a cached interface fails (e.g. ofono restarted), see invalidate()
+	"""
+
+	def __init__(self, bus, modem=None):
+		self.bus = bus
+		self.modem = modem		# ModemHandle of the modem of this session, None for the first modem found on DBus
+		self.modem_path = None		# path of the modem on DBus, None when not resolved yet
+		self.interfaces = {}		# DBus interfaces already built, indexed by (object path, interface name)
+		self.signal_matches = []	# signal receivers registered on the bus
+		# the path and the interfaces are invalidated by the signal loop thread while other threads use them
+		self.lock = threading.Lock()
+
+		for signal_name in ["ModemAdded", "ModemRemoved"]:
+			try:
+				match = self.bus.add_signal_receiver(self._onModemsChanged, bus_name='org.ofono', dbus_interface='org.ofono.Manager', signal_name=signal_name)
+				self.signal_matches.append(match)
+			except Exception as e:
+				logger.debug("Cannot subscribe to ofono %s signal:%s" % (signal_name, e))
+		try:
+			# proxies are bound to the unique name of ofonod, they are useless once ofonod is restarted
+			match = self.bus.add_signal_receiver(self._onModemsChanged, bus_name='org.freedesktop.DBus', dbus_interface='org.freedesktop.DBus', signal_name='NameOwnerChanged', arg0='org.ofono')
+			self.signal_matches.append(match)
+		except Exception as e:
+			logger.debug("Cannot subscribe to NameOwnerChanged signal:%s" % (e))
+
+	def _onModemsChanged(self, *args):
+		"""Handler of ModemAdded/ModemRemoved signals
+		"""
+		self.invalidate()
+
+	def invalidate(self):
+		"""Forget the modem path and the cached interfaces, they will be resolved again on next use
+		"""
+		with self.lock:
+			self.modem_path = None
+			self.interfaces = {}
+
+	def close(self):
+		"""Remove the signal receivers registered by this session
+		"""
+		for match in self.signal_matches:
+			try:
+				match.remove()
+			except Exception:
+				pass
+		self.signal_matches = []
+		self.invalidate()
+
+	def resolveModems(self):
+		"""call GetModems and refresh the cached modem path. return tuple (modems or None, path of the modem or None, message)
+		"""
+		try:
+			manager = self.getInterface('org.ofono.Manager', '/')
+			modems = manager.GetModems()
+		except dbus.DBusException as e:
+			self.updateModems(None)
+			return None, None, "DBus exception while getting modems on DBus:%s" % (e)
+		except Exception as e:
+			self.updateModems(None)
+			return None, None, "Generic exception while getting modems on DBus:%s" % (e)
+		modem_path, message = self.updateModems(modems)
+		if len(modems) == 0:
+			modems = None
+		return modems, modem_path, message
+
+	def updateModems(self, modems):
+		"""refresh the cached modem path from modems, the result of a GetModems call (e.g. made asynchronously).
+		return tuple (path of the modem or None, message)
+		"""
+		modem_path = None
+		message = "No modem found on DBus"
+		if modems != None and len(modems) > 0:
+			message = "%d modem(s) found on DBus" % (len(modems))
+			modem_path = modems[0][0] if self.modem == None else self.modem.findPath(modems)
+			if modem_path == None:
+				message = "Modem %s not found on DBus" % (self.modem.describe())
+		with self.lock:
+			if modem_path != self.modem_path:
+				self.modem_path = modem_path
+				self.interfaces = {}
+		return modem_path, message
+
+	def getModems(self):
+		"""retrieve modems on DBus. return tuple (modems or None, message)
+		It always calls GetModems and refreshes the cached modem path
+		"""
+		modems, modem_path, message = self.resolveModems()
+		return modems, message
+
+	def getCachedModemPath(self):
+		"""return the path of the modem when it is known, None when it has to be resolved (see getModemPath)
+		"""
+		with self.lock:
+			return self.modem_path
+
+	def getModemPath(self):
+		"""return tuple (path of the modem or None, message). DBus is only requested when the path is not known yet
+		"""
+		modem_path = self.getCachedModemPath()
+		if modem_path != None:
+			return modem_path, "1 modem(s) found on DBus"
+		modems, modem_path, message = self.resolveModems()
+		return modem_path, message
+
+	def requireModemPath(self):
+		"""return the path of the modem, resolved again when it has been invalidated meanwhile (e.g. by a signal).
+		A DBusException is raised when the modem is not on DBus anymore, like for a failed DBus call
+		"""
+		modem_path, message = self.getModemPath()
+		if modem_path == None:
+			raise dbus.DBusException(message)
+		return modem_path
+
+	def getInterface(self, interface_name, path=None):
+		"""return the DBus interface named interface_name of object path (the modem by default, see requireModemPath)
+		"""
+		if path == None:
+			path = self.requireModemPath()
+		key = (path, interface_name)
+		with self.lock:
+			interface = self.interfaces.get(key)
+		if interface == None:
+			interface = dbus.Interface(self.bus.get_object('org.ofono', path), interface_name)
+			with self.lock:
+				self.interfaces[key] = interface
+		return interface
+
+_modem_session = None
+
+# sessions of the modems given as a ModemHandle, indexed by modem key (see ModemHandle.getKey)
+_modem_sessions = {}
+_modem_sessions_lock = threading.Lock()
+
+def getModemSession(bus, modem=None):
+	"""return the ModemSession shared by all functions of this library for the given bus and modem (ModemHandle, the
+	first modem found on DBus when None)
+	"""
+	global _modem_session
+	with _modem_sessions_lock:
+		if _modem_session == None or _modem_session.bus is not bus:
+			if _modem_session != None:
+				_modem_session.close()
+			for session in _modem_sessions.values():
+				session.close()
+			_modem_sessions.clear()
+			__instrumentBus(bus)
+			_modem_session = ModemSession(bus)
+		if modem == None:
+			return _modem_session
+
+		session = _modem_sessions.get(modem.getKey())
+		if session == None:
+			session = ModemSession(bus, modem)
+			_modem_sessions[modem.getKey()] = session
+		return session
+
+class ModemRegistry(object):
+	"""Modems attached to the system, indexed by ofono path and by USB serial number.
+	USB modems are read from the registry of USB devices (see lib_usb), modems on DBus from ofono, both being matched
+	by the USB device of the modem (ofono property "SystemPath"). A USB modem not on DBus (yet) has no ofono path.
+	The registry is read again by refresh(), e.g. after a modem reset
+	"""
+
+	def __init__(self, bus):
+		self.bus = bus
+		self.modems = []	# list of ModemHandle
+		self.matched = True	# False when modems on DBus could not be matched with USB modems
+
+	def refresh(self):
+		"""read the modems again, return a message describing them
+		"""
+		modems = []
+		for vid_pid, devices in sorted(lib_usb.listRegisteredUSBDevices().items()):
+			if not isSupportedModem(vid_pid):
+				continue
+			for device in devices:
+				modems.append(ModemHandle(None, device.Serial, vid_pid, os.path.realpath(device.Path)))
+
+		dbus_modems, message = getModemSession(self.bus).getModems()
+		for path, properties in (dbus_modems or []):
+			modem = ModemHandle(str(path), "", "", None)
+			for index, usb_modem in enumerate(modems):
+				if usb_modem.findPath([(path, properties)]) != None:
+					modem = usb_modem._replace(Path=str(path))
+					modems[index] = modem
+					break
+			else:
+				modems.append(modem)
+
+		# a modem on DBus and a USB modem left unmatched (e.g. "SystemPath" not reported): they are the same modem
+		# when they are alone, they cannot be told apart otherwise
+		usb_only = [modem for modem in modems if modem.Path == None]
+		dbus_only = [modem for modem in modems if modem.UsbPath == None]
+		if len(usb_only) == 1 and len(dbus_only) == 1:
+			modems.remove(dbus_only[0])
+			modems[modems.index(usb_only[0])] = usb_only[0]._replace(Path=dbus_only[0].Path)
+			usb_only, dbus_only = [], []
+		self.matched = len(usb_only) == 0 or len(dbus_only) == 0
+
+		self.modems = modems
+		on_dbus = len([modem for modem in modems if modem.Path != None])
+		message = "%d modem(s) attached, %d on DBus" % (len(modems), on_dbus)
+		if not self.matched:
+			message += ", modems on DBus not matched with USB modems"
+		return message
+
+	def isMatched(self):
+		"""return False when modems on DBus could not be matched with the USB modems: the modems are then unreliable
+		"""
+		return self.matched
+
+	def getModems(self):
+		return list(self.modems)
+
+	def findByPath(self, path):
+		for modem in self.modems:
+			if modem.Path == str(path):
+				return modem
+		return None
+
+	def findBySerial(self, serial):
+		for modem in self.modems:
+			if len(serial) > 0 and modem.Serial == serial:
+				return modem
+		return None
+
+# Number of DBus method calls done on buses used by this library, counted from the threads of the signal loop, of the
+# property mirror and of the asyncio API as well
+_dbus_calls = 0
+_dbus_calls_lock = threading.Lock()
+
+def __instrumentBus(bus):
+	"""Hook the method calls done on bus (blocking or with reply handlers, to ofono, connman...) to count them and to
+	apply the call timeout of the current RetryPolicy to calls without explicit timeout. Calling it several times on
+	the same bus is harmless.
+	Note: the bus object itself is patched, for all its users: the calls made on it by the caller of this library are
+	counted and get the call timeout of the current RetryPolicy as well
+	"""
+	with _dbus_calls_lock:
+		if getattr(bus, "_lib_modem_instrumented", False):
+			return
+
+		def instrumented(call):
+			def wrapper(*args, **keywords):
+				global _dbus_calls
+				with _dbus_calls_lock:
+					_dbus_calls += 1
+				policy = getCurrentPolicy()
+				if policy != None and keywords.get("timeout", -1) < 0:
+					keywords["timeout"] = policy.getCallTimeout()
+				return call(*args, **keywords)
+			return wrapper
+
+		# proxies of the bus go through these two methods of the connection for every method call
+		bus.call_blocking = instrumented(bus.call_blocking)
+		bus.call_async = instrumented(bus.call_async)
+		bus._lib_modem_instrumented = True
+
+def countDBusCalls(bus):
+	"""Count all method calls done on bus from now on, see getDBusCallCount()
+	"""
+	__instrumentBus(bus)
+
+def getDBusCallCount():
+	"""return the number of DBus method calls done so far on buses used by this library
+	"""
+	with _dbus_calls_lock:
+		return _dbus_calls
+
+_signal_loop = None
+_signal_loop_thread = None
+
+def startSignalLoop():
+	"""Run a GObject main loop in a daemon thread so that DBus signals are dispatched to their receivers.
+	Calling it several times is harmless, the loop is only started once
+	"""
+	global _signal_loop, _signal_loop_thread
+	if _signal_loop_thread != None and _signal_loop_thread.is_alive():
+		return
+	_signal_loop = GObject.MainLoop()
+	_signal_loop_thread = threading.Thread(target=_signal_loop.run, name="modem_signal_loop")
+	_signal_loop_thread.daemon = True
+	_signal_loop_thread.start()
+
+def isSignalLoopRunning():
+	return _signal_loop_thread != None and _signal_loop_thread.is_alive()
+
+class ModemPropertyMirror(object):
+	"""Keep an in-memory copy of the properties of the main ofono interfaces, kept up to date by their PropertyChanged signals.
+
+	Properties of an interface are read once from DBus (on first use) and then only updated by signals, so that
+	predicates like isSimPresent() or isCellularNetworkRegistered() are answered without any DBus call.
+	The mirror is only trustworthy while signals are dispatched, so the signal loop is started with it.
+	"""
+
+	# interfaces whose properties are mirrored. Other interfaces are always read from DBus
+	MIRRORED_INTERFACES = [
+		'org.ofono.Modem',
+		'org.ofono.SimManager',
+		'org.ofono.NetworkRegistration',
+		'org.ofono.ConnectionManager',
+		'org.ofono.ConnectionContext',
+		'org.ofono.TelitDataNetwork',
+	]
+
+	def __init__(self, bus):
+		self.bus = bus
+		self.lock = threading.Lock()
+		self.properties = {}		# properties of each mirrored interface, indexed by (object path, interface name)
+		self.contexts = {}		# list of context paths of each ConnectionManager, indexed by modem path
+		self.pending = {}		# changes signaled while properties are read from DBus, indexed like properties
+		self.signal_matches = []	# signal receivers registered on the bus
+
+		for interface_name in self.MIRRORED_INTERFACES:
+			self._subscribe(self._onPropertyChanged, interface_name, 'PropertyChanged', path_keyword='path', interface_keyword='interface')
+		self._subscribe(self._onContextAdded, 'org.ofono.ConnectionManager', 'ContextAdded', path_keyword='path')
+		self._subscribe(self._onContextRemoved, 'org.ofono.ConnectionManager', 'ContextRemoved', path_keyword='path')
+		self._subscribe(self._onModemRemoved, 'org.ofono.Manager', 'ModemRemoved')
+		try:
+			match = self.bus.add_signal_receiver(self._onOfonoOwnerChanged, bus_name='org.freedesktop.DBus', dbus_interface='org.freedesktop.DBus', signal_name='NameOwnerChanged', arg0='org.ofono')
+			self.signal_matches.append(match)
+		except Exception as e:
+			logger.debug("Cannot subscribe to NameOwnerChanged signal:%s" % (e))
+
+		startSignalLoop()
+
+	def _subscribe(self, handler, interface_name, signal_name, **keywords):
+		try:
+			match = self.bus.add_signal_receiver(handler, bus_name='org.ofono', dbus_interface=interface_name, signal_name=signal_name, **keywords)
+			self.signal_matches.append(match)
+		except Exception as e:
+			logger.debug("Cannot subscribe to %s.%s signal:%s" % (interface_name, signal_name, e))
+
+	def close(self):
+		"""Remove the signal receivers and forget all properties
+		"""
+		for match in self.signal_matches:
+			try:
+				match.remove()
+			except Exception:
+				pass
+		self.signal_matches = []
+		self.clear()
+
+	def clear(self):
+		with self.lock:
+			self.properties = {}
+			self.contexts = {}
+			self.pending = {}
+
+	def _onPropertyChanged(self, name, value, path=None, interface=None):
+		"""Handler of PropertyChanged signals: only interfaces already read are updated, the others are read on first use
+		"""
+		with self.lock:
+			key = (str(path), str(interface))
+			if key in self.pending:
+				# properties being read: the change is replayed onto the reply (see getProperties)
+				self.pending[key].append((name, value))
+				return
+			if key not in self.properties:
+				return
+			# copy on write, a reader may be iterating over the previous dictionary
+			properties = dict(self.properties[key])
+			properties[name] = value
+			self.properties[key] = properties
+
+			if interface == 'org.ofono.Modem' and name == 'Interfaces':
+				# forget interfaces removed from the modem (e.g. SimManager when the modem is powered off)
+				for other_path, other_interface in list(self.properties.keys()):
+					if other_path == key[0] and other_interface != interface and other_interface not in value:
+						del self.properties[(other_path, other_interface)]
+				if 'org.ofono.ConnectionManager' not in value:
+					self.contexts.pop(key[0], None)
+
+	def _onContextAdded(self, context_path, properties, path=None):
+		with self.lock:
+			modem_path = str(path)
+			if modem_path in self.contexts:
+				self.contexts[modem_path] = self.contexts[modem_path] + [str(context_path)]
+			self.properties[(str(context_path), 'org.ofono.ConnectionContext')] = properties
+
+	def _onContextRemoved(self, context_path, path=None):
+		with self.lock:
+			modem_path = str(path)
+			if modem_path in self.contexts:
+				self.contexts[modem_path] = [p for p in self.contexts[modem_path] if p != str(context_path)]
+			self.properties.pop((str(context_path), 'org.ofono.ConnectionContext'), None)
+
+	def _onModemRemoved(self, modem_path):
+		with self.lock:
+			modem_path = str(modem_path)
+			for mirror in (self.properties, self.pending):
+				for key in list(mirror.keys()):
+					if key[0] == modem_path or key[0].startswith(modem_path + "/"):
+						del mirror[key]
+			self.contexts.pop(modem_path, None)
+
+	def _onOfonoOwnerChanged(self, name, old_owner, new_owner):
+		# ofono started, stopped or restarted: nothing known so far is reliable anymore
+		self.clear()
+
+	def getProperties(self, path, interface_name):
+		"""return properties of interface_name of object path, read from DBus on first use only.
+		DBus exceptions are raised to the caller
+		"""
+		key = (str(path), interface_name)
+		mirrored = interface_name in self.MIRRORED_INTERFACES
+		with self.lock:
+			properties = self.properties.get(key)
+			if properties == None and mirrored:
+				# changes signaled until the reply are buffered, they may not be part of it
+				self.pending.setdefault(key, [])
+		if properties != None:
+			return properties
+
+		try:
+			properties = getModemSession(self.bus).getInterface(interface_name, path).GetProperties()
+		except Exception:
+			if mirrored:
+				with self.lock:
+					self.pending.pop(key, None)
+			raise
+		if mirrored:
+			with self.lock:
+				changes = self.pending.pop(key, None)
+				# no pending entry anymore: the mirror has been cleared meanwhile, or another reader stored the properties
+				if changes != None and key not in self.properties:
+					properties = dict(properties)
+					for name, value in changes:
+						properties[name] = value
+					self.properties[key] = properties
+		return properties
+
+	def getContexts(self, modem_path):
+		"""return the list of (context path, context properties) of the ConnectionManager of a modem, like GetContexts()
+		"""
+		modem_path = str(modem_path)
+		with self.lock:
+			context_paths = self.contexts.get(modem_path)
+			if context_paths != None:
+				contexts = []
+				for context_path in context_paths:
+					properties = self.properties.get((context_path, 'org.ofono.ConnectionContext'))
+					if properties == None:
+						break
+					contexts.append((context_path, properties))
+				else:
+					return contexts
+
+		contexts = getModemSession(self.bus).getInterface('org.ofono.ConnectionManager', modem_path).GetContexts()
+		with self.lock:
+			self.contexts[modem_path] = [str(context_path) for context_path, properties in contexts]
+			for context_path, properties in contexts:
+				self.properties[(str(context_path), 'org.ofono.ConnectionContext')] = properties
+		return contexts
+
+_property_mirror = None
+
+def startPropertyMirror(bus):
+	"""Start mirroring ofono properties in memory. All functions of this library use the mirror once it is started
+	"""
+	global _property_mirror
+	if _property_mirror == None or _property_mirror.bus is not bus:
+		stopPropertyMirror()
+		_property_mirror = ModemPropertyMirror(bus)
+	return _property_mirror
+
+def stopPropertyMirror():
+	global _property_mirror
+	if _property_mirror != None:
+		_property_mirror.close()
+		_property_mirror = None
+
+def __getProperties(session, interface_name, path=None):
+	"""return properties of an ofono interface (of the modem by default), from the property mirror when it is started
+	"""
+	if path == None:
+		path = session.requireModemPath()
+	if _property_mirror != None and _property_mirror.bus is session.bus:
+		return _property_mirror.getProperties(path, interface_name)
+	return session.getInterface(interface_name, path).GetProperties()
+
+def __getContexts(session, path=None):
+	"""return contexts of the ofono ConnectionManager (of the modem by default), from the property mirror when it is started
+	"""
+	if path == None:
+		path = session.requireModemPath()
+	if _property_mirror != None and _property_mirror.bus is session.bus:
+		return _property_mirror.getContexts(path)
+	return session.getInterface('org.ofono.ConnectionManager', path).GetContexts()
+
 def __getModemsFromDBus(bus):
 	"""retrieve modems on DBus.
 	"""
-	modems = None
-	message = ""
+	return getModemSession(bus).getModems()
+
+# Any signal sent by ofono or connman is a hint that the state of the cellular connection has changed.
+# waitFor() wakes up on each of them to evaluate its condition again
+_state_changed = threading.Condition()
+_state_generation = 0
+_state_signals_bus = None
+
+def __onStateSignal(*args, **keywords):
+	global _state_generation
+	with _state_changed:
+		_state_generation += 1
+		_state_changed.notify_all()
+
+def __subscribeStateSignals(bus):
+	global _state_signals_bus
+	if _state_signals_bus is bus:
+		return
 	try:
-		manager = dbus.Interface(bus.get_object('org.ofono', '/'), 'org.ofono.Manager')
-		modems = manager.GetModems()
-		number = len(modems)
-		if number == 0:
-			modems = None
-			message = "No modem found on DBus"
-		else:
-			message = "%d modem(s) found on DBus" % (number)
-	except dbus.DBusException as e:
-		modems = None
-		message = "DBus exception while getting modems on DBus:%s" % (e)
+		for bus_name in ['org.ofono', 'net.connman']:
+			bus.add_signal_receiver(__onStateSignal, bus_name=bus_name)
+			bus.add_signal_receiver(__onStateSignal, bus_name='org.freedesktop.DBus', dbus_interface='org.freedesktop.DBus', signal_name='NameOwnerChanged', arg0=bus_name)
+		_state_signals_bus = bus
 	except Exception as e:
-		modems = None
-		message = "Generic exception while getting modems on DBus:%s" % (e)
-	return modems, message
+		logger.debug("Cannot subscribe to ofono/connman signals:%s" % (e))
+	startSignalLoop()
+
+def waitFor(bus, condition, timeout, poll_interval=5, policy=None):
+	""" Wait until condition() returns True, for at most timeout seconds. Return the last result of condition()
+	condition is evaluated again as soon as ofono or connman emits a signal (property changed, modem/interface/service
+	added or removed, service started or stopped...) and at least every poll_interval seconds for states without signal
+	poll_interval is a number of seconds, or a function returning the next interval.
+	The wait ends at the latest at the deadline of policy (by default the current RetryPolicy, if any)
+	"""
+	if policy == None:
+		policy = getCurrentPolicy()
+	if policy != None:
+		timeout = policy.limit(timeout)
+	__subscribeStateSignals(bus)
+	end = time.monotonic() + timeout
+	interval = None
+	while True:
+		with _state_changed:
+			generation = _state_generation
+		if condition():
+			return True
+		remaining = end - time.monotonic()
+		if remaining <= 0:
+			return False
+		# the poll interval only advances when the condition has been polled, not when it is evaluated on a signal
+		if interval == None:
+			interval = poll_interval() if callable(poll_interval) else poll_interval
+		with _state_changed:
+			if _state_generation == generation:
+				_state_changed.wait(min(remaining, interval))
+			if _state_generation == generation:
+				interval = None
+		# signals often come in bursts (e.g. several properties of an interface): let the burst end before evaluating again
+		time.sleep(min(0.1, max(0, end - time.monotonic())))
+
+_policy_scope = threading.local()
+
+class RetryPolicy(object):
+	"""How functions of this library wait for ofono and connman: timeout of each DBus call, number of attempts and delay
+	between them (exponential backoff with jitter) and overall deadline.
+
+	Functions of this library accept a policy parameter. A policy can also be applied to a whole sequence of calls of
+	the current thread with a "with" statement: functions called without policy then retry as asked by their attempts
+	and delay parameters, but with the call timeout and the deadline of the policy, e.g.
+		with lib_modem.RetryPolicy(deadline=600):	# everything must be done within 10 minutes
+			lib_modem.isSimPresent(bus, True, 5)
+			lib_modem.isCellularNetworkRegistered(bus, True, policy=lib_modem.RetryPolicy(attempts=10, backoff=1.5))
+	"""
 
-def __retryFunction(function, bus, verbose, attempts, delay):
-	""" call repeatedly a function given in parameter. A delay is applied between each call.
-	It returns when the result of the called function is True or when the maximum of attempts is reached
+	def __init__(self, attempts=1, delay=5, backoff=1, max_delay=60, jitter=0, call_timeout=DBUS_CALL_TIMEOUT, deadline=None):
+		"""
+		@attempts: number of attempts of a function, at least 1
+		@delay: delay (seconds) before the first retry
+		@backoff: factor applied to the delay for each further retry
+		@max_delay: maximum delay (seconds) between two retries
+		@jitter: random variation of each delay, as a ratio of the delay (e.g. 0.1 for +/-10%)
+		@call_timeout: timeout (seconds) of each DBus call
+		@deadline: time (seconds, from now) after which no retry is done anymore and DBus calls fail quickly, None for no deadline
+		"""
+		self.attempts = max(1, attempts)
+		self.delay = delay
+		self.backoff = backoff
+		self.max_delay = max_delay
+		self.jitter = jitter
+		self.call_timeout = call_timeout
+		self.end = None if deadline == None else time.monotonic() + deadline
+
+	def derive(self, **changes):
+		"""return a copy of this policy with some parameters changed (same names as in the constructor).
+		The deadline of the copy cannot be later than the deadline of this policy
+		"""
+		policy = copy.copy(self)
+		deadline = changes.pop("deadline", None)
+		for name, value in changes.items():
+			setattr(policy, name, value)
+		policy.attempts = max(1, policy.attempts)
+		if deadline != None:
+			end = time.monotonic() + deadline
+			policy.end = end if self.end == None else min(end, self.end)
+		return policy
+
+	def getRemaining(self):
+		"""return the time (seconds) left before the deadline, None without deadline
+		"""
+		if self.end == None:
+			return None
+		return max(0, self.end - time.monotonic())
+
+	def isExpired(self):
+		return self.end != None and time.monotonic() >= self.end
+
+	def limit(self, seconds):
+		"""return seconds, limited to the time left before the deadline
+		"""
+		if self.end == None:
+			return seconds
+		return min(seconds, self.getRemaining())
+
+	def getCallTimeout(self):
+		"""return the timeout (seconds) to apply to the next DBus call
+		"""
+		return max(MIN_DBUS_CALL_TIMEOUT, self.limit(self.call_timeout))
+
+	def __getNominalDelay(self, retry):
+		return min(self.max_delay, self.delay * (self.backoff ** (retry-1)))
+
+	def getDelay(self, retry):
+		"""return the delay (seconds) before retry number retry (1 for the first retry), jitter included
+		"""
+		delay = self.__getNominalDelay(retry)
+		delay *= 1 + random.uniform(-self.jitter, self.jitter)
+		return self.limit(max(0, delay))
+
+	def getBudget(self):
+		"""return the time (seconds) all retries may take, without jitter
+		"""
+		return self.limit(sum([self.__getNominalDelay(retry) for retry in range(1, self.attempts)]))
+
+	def __enter__(self):
+		if not hasattr(_policy_scope, "policies"):
+			_policy_scope.policies = []
+		_policy_scope.policies.append(self)
+		return self
+
+	def __exit__(self, *exception):
+		_policy_scope.policies.pop()
+		return False
+
+def getCurrentPolicy():
+	"""return the RetryPolicy applied by the innermost "with" statement of the current thread, None if there is none
 	"""
-	for attempt in range(0,attempts):
-		if attempt > 0:
-			time.sleep(delay)
-			if verbose:
-				logger.info("")
-				logger.info("-Attempt #%d->" % (attempt+1))
+	policies = getattr(_policy_scope, "policies", [])
+	if len(policies) == 0:
+		return None
+	return policies[-1]
+
+def __callWithPolicy(policy, function, *args):
+	"""call function(*args) with policy applied (when given)
+	"""
+	if policy == None:
+		return function(*args)
+	with policy:
+		return function(*args)
+
+def __retryFunction(function, bus, verbose, attempts, delay, policy=None):
+	""" call repeatedly a function given in parameter until its result is True, as long as policy allows it. Without
+	policy, attempts and delay are used with the call timeout and deadline of the current policy (if any).
+	With a bus, the function is called again as soon as ofono or connman signals a change (see waitFor), at least after each delay.
+	Without a bus, a delay is applied between each call
+	"""
+	if policy == None:
+		current = getCurrentPolicy()
+		policy = RetryPolicy(attempts, delay) if current == None else current.derive(attempts=attempts, delay=delay)
+
+	with policy:
 		if bus is None:	# this function does not require any bus
-			status, message = function(verbose)
-		else:
-			status, message = function(bus, verbose)
-		if status:
-			break	#success, no need to retry anymore
-	return status, message
+			for attempt in range(0,policy.attempts):
+				if attempt > 0:
+					if policy.isExpired():
+						break
+					time.sleep(policy.getDelay(attempt))
+					if verbose:
+						logger.info("")
+						logger.info("-Attempt #%d->" % (attempt+1))
+				status, message = function(verbose)
+				if status:
+					break	#success, no need to retry anymore
+			return status, message
+
+		__instrumentBus(bus)
+		status, message = function(bus, verbose)
+		if status or policy.attempts <= 1 or policy.isExpired():
+			return status, message
+
+		budget = policy.getBudget()
+		if verbose:
+			logger.info("Wait at most %d s for a change..." % (budget))
+		start = time.monotonic()
+		result = [status, message]
+		def condition():
+			result[0], result[1] = function(bus, False)
+			return result[0]
+		retries = [0]
+		def poll_interval():
+			retries[0] += 1
+			return policy.getDelay(retries[0])
+		waitFor(bus, condition, budget, poll_interval)
+		status, message = result
+		if verbose:
+			logger.info("%s (after %.1f s)" % (message, time.monotonic() - start))
+		return status, message
 
-def isModemOnDBus(bus, verbose=False, attempts=1, delay=5):
-	return __retryFunction(__isModemOnDBus, bus, verbose, attempts, delay)
+def isModemOnDBus(bus, verbose=False, attempts=1, delay=5, policy=None, modem=None):
+	return __retryFunction(lambda bus, verbose: __isModemOnDBus(bus, verbose, modem), bus, verbose, attempts, delay, policy)
 
-def __isModemOnDBus(bus, verbose):
+def __isModemOnDBus(bus, verbose, modem=None):
 	""" Check if the modem is visible on ofono DBus
 	"""
 	if verbose:
@@ -552,17 +1675,25 @@ def __isModemOnDBus(bus, verbose):
 		logger.info("-Check for presence of modem on DBus")
 
 	status = False
-	modems, message = __getModemsFromDBus(bus)
-	if modems != None:
+	modem_path, message = getModemSession(bus, modem).getModemPath()
+	if modem_path != None:
 		status = True
 	if verbose:
 		logger.info(message)
 	return status, message
 
-def isSimPresent(bus, verbose=False, attempts=1, delay=5):
-	return __retryFunction(__isSimPresent, bus, verbose, attempts, delay)
+def _evaluateSimPresent(sim_properties):
+	""" evaluate Sim status from org.ofono.SimManager properties, return tuple (present, message)
+	"""
+	present = __dbus2py(sim_properties['Present'])
+	if present:
+		return present, "Sim is present"
+	return present, "Sim is absent"
+
+def isSimPresent(bus, verbose=False, attempts=1, delay=5, policy=None, modem=None):
+	return __retryFunction(lambda bus, verbose: __isSimPresent(bus, verbose, modem), bus, verbose, attempts, delay, policy)
 
-def __isSimPresent(bus, verbose):
+def __isSimPresent(bus, verbose, modem=None):
 	""" retrieve Sim status (present or not)
 	"""
 	if verbose:
@@ -571,21 +1702,16 @@ def __isSimPresent(bus, verbose):
 
 	present = False
 
-	modems, message = __getModemsFromDBus(bus)
-	if modems != None:
-		# we suppose there is only one modem connected
-		modem_path = modems[0][0]
+	session = getModemSession(bus, modem)
+	modem_path, message = session.getModemPath()
+	if modem_path != None:
 
 		present = False
 		try:
-			sim_manager = dbus.Interface(bus.get_object('org.ofono', modem_path),'org.ofono.SimManager')
-			present = __dbus2py(sim_manager.GetProperties()['Present'])
-			if present:
-				message = "Sim is present"
-			else:
-				message = "Sim is absent"
+			present, message = _evaluateSimPresent(__getProperties(session, 'org.ofono.SimManager'))
 
 		except dbus.DBusException as e:
+			session.invalidate()
 			message = "DBus exception while checking presence of Sim card:%s" % (e)
 		except KeyError as e:
 			message = "KeyError exception: %s not present on Dbus" % (e)
@@ -602,34 +1728,36 @@ class PinStatus(Enum):
 	PukIsRequired = 2
 	PinIsValidOrNotRequired = 3
 
-def getPinStatus(bus, verbose=False):
+def _evaluatePinStatus(sim_properties):
+	""" evaluate Pin status from org.ofono.SimManager properties, return tuple (PinStatus, message)
+	"""
+	sim_pin_required = __dbus2py(sim_properties['PinRequired'])
+	if sim_pin_required == "none":
+		return PinStatus.PinIsValidOrNotRequired, "Pin is valid or not required"
+	elif sim_pin_required == "puk":
+		return PinStatus.PukIsRequired, "A Puk is required"
+	return PinStatus.PinIsRequired, "A Pin is required"
+
+def getPinStatus(bus, verbose=False, policy=None, modem=None):
 	""" retrieve Pin status (returns PinStatus enum)
 	"""
+	return __callWithPolicy(policy, __getPinStatus, bus, verbose, modem)
 
+def __getPinStatus(bus, verbose=False, modem=None):
 	if verbose:
 		logger.info("")
 		logger.info("-Get Pin status")
 
 	status = PinStatus.Unknown
 
-	modems, message = __getModemsFromDBus(bus)
-	if modems != None:
-		# we suppose there is only one modem connected
-		modem_path = modems[0][0]
+	session = getModemSession(bus, modem)
+	modem_path, message = session.getModemPath()
+	if modem_path != None:
 
 		try:
-			sim_manager = dbus.Interface(bus.get_object('org.ofono', modem_path), 'org.ofono.SimManager')
-			sim_pin_required = __dbus2py(sim_manager.GetProperties()['PinRequired'])
-			if sim_pin_required == "none":
-				message = "Pin is valid or not required"
-				status = PinStatus.PinIsValidOrNotRequired
-			elif sim_pin_required == "puk":
-				message = "A Puk is required"
-				status = PinStatus.PukIsRequired
-			else:
-				message = "A Pin is required"
-				status = PinStatus.PinIsRequired
+			status, message = _evaluatePinStatus(__getProperties(session, 'org.ofono.SimManager'))
 		except dbus.DBusException as e:
+			session.invalidate()
 			message = "DBus exception while getting Pin status:%s" % (e)
 		except KeyError as e:
 			message = "KeyError exception: %s not present on Dbus" % (e)
@@ -645,27 +1773,30 @@ class DisablePinAnswer(Enum):
 	Success = 1
 	WrongPin = 2
 
-def disablePin(bus, pin, verbose=False):
+def disablePin(bus, pin, verbose=False, policy=None, modem=None):
 	"""Enter a Pin and disable it. Sim must be locked by a Pin before. Exception otherwise
 	"""
+	return __callWithPolicy(policy, __disablePin, bus, pin, verbose, modem)
 
+def __disablePin(bus, pin, verbose=False, modem=None):
 	if verbose:
 		logger.info("")
 		logger.info("-Enter and disable Pin using %s" % (pin))
 
 	status = DisablePinAnswer.Unknown
 
-	modems, message = __getModemsFromDBus(bus)
-	if modems != None:
-		modem_path = modems[0][0]
+	session = getModemSession(bus, modem)
+	modem_path, message = session.getModemPath()
+	if modem_path != None:
 
 		try:
-			sim_manager = dbus.Interface(bus.get_object('org.ofono', modem_path), 'org.ofono.SimManager')
+			sim_manager = session.getInterface('org.ofono.SimManager')
 			sim_manager.EnterPin("pin", pin)
 			sim_manager.UnlockPin("pin", pin)
 			message = "Pin entered and disabled"
 			status = DisablePinAnswer.Success
 		except dbus.DBusException as e:
+			session.invalidate()
 			#In case of wrong pin e is: "org.ofono.Error.Failed: Operation failed"
 			#In case of no pin required e is: "org.ofono.Error.InvalidFormat: Argument format is not recognized"
 			if str(e) == "org.ofono.Error.Failed: Operation failed":
@@ -680,10 +1811,10 @@ def disablePin(bus, pin, verbose=False):
 		logger.info(message)
 	return status, message
 
-def getServiceProviderName(bus, verbose=False, attempts=1, delay=5):
-	return __retryFunction(__getServiceProviderName, bus, verbose, attempts, delay)
+def getServiceProviderName(bus, verbose=False, attempts=1, delay=5, policy=None, modem=None):
+	return __retryFunction(lambda bus, verbose: __getServiceProviderName(bus, verbose, modem), bus, verbose, attempts, delay, policy)
 
-def __getServiceProviderName(bus, verbose):
+def __getServiceProviderName(bus, verbose, modem=None):
 	""" retrieve Service Provicer Name
 	"""
 
@@ -693,16 +1824,15 @@ def __getServiceProviderName(bus, verbose):
 
 	service_provider_name = ""
 
-	modems, message = __getModemsFromDBus(bus)
-	if modems != None:
-		# we suppose there is only one modem connected
-		modem_path = modems[0][0]
+	session = getModemSession(bus, modem)
+	modem_path, message = session.getModemPath()
+	if modem_path != None:
 
 		try:
-			sim_manager = dbus.Interface(bus.get_object('org.ofono', modem_path), 'org.ofono.SimManager')
-			service_provider_name = __dbus2py(sim_manager.GetProperties()['ServiceProviderName'])
+			service_provider_name = __dbus2py(__getProperties(session, 'org.ofono.SimManager')['ServiceProviderName'])
 			message = "Service Provider Name is \'%s\'" % (service_provider_name)
 		except dbus.DBusException as e:
+			session.invalidate()
 			message = "DBus exception while getting Service Provider Name:%s" % (e)
 		except KeyError as e:
 			"""Set service_provider_name to 'Unknown' if we can not get the real value from the SimManager
@@ -720,10 +1850,74 @@ def __getServiceProviderName(bus, verbose):
 
 	return service_provider_name, message
 
-def enumerateModems(bus):
+# Table of the Internet APN settings of mobile operators (no MMS or WAP APN), indexed by MCC and MNC of the Sim (e.g.
+# "22801"): lists of [apn, user name, password], most likely first
+APN_PROVIDERS_FILE_PATH = "/usr/share/cellular/apn_providers.json"
+
+# Table of APN settings, loaded on first use
+_apn_providers = None
+
+def __getAPNProviders():
+	global _apn_providers
+	if _apn_providers == None:
+		try:
+			with open(APN_PROVIDERS_FILE_PATH, "r") as apn_providers_file:
+				_apn_providers = json.load(apn_providers_file)
+		except Exception as e:
+			logger.warning("Failed to load APN table: %s" % (e))
+			_apn_providers = {}
+	return _apn_providers
+
+def getSimOperatorCode(bus, policy=None, modem=None):
+	""" Return the MCC and MNC of the operator of the Sim (e.g. "22801"), from the SimManager of ofono (or its IMSI),
+	None when unknown
+	"""
+	return __callWithPolicy(policy, __getSimOperatorCode, bus, modem)
+
+def __getSimOperatorCode(bus, modem=None):
+	session = getModemSession(bus, modem)
+	modem_path, message = session.getModemPath()
+	if modem_path == None:
+		return None
+	try:
+		properties = __dbus2py(__getProperties(session, 'org.ofono.SimManager'))
+	except dbus.DBusException as e:
+		session.invalidate()
+		return None
+
+	if len(properties.get("MobileCountryCode", "")) > 0 and len(properties.get("MobileNetworkCode", "")) > 0:
+		return properties["MobileCountryCode"] + properties["MobileNetworkCode"]
+	# the length of the MNC (2 or 3 digits) in the IMSI is not known: the table tells
+	imsi = properties.get("SubscriberIdentity", "")
+	for length in (6, 5):
+		if len(imsi) >= length and imsi[:length] in __getAPNProviders():
+			return imsi[:length]
+	return None
+
+def getAPNCandidates(bus, apn="", user_name="", password="", policy=None, modem=None):
+	""" Return the APN settings to try in order to connect, as a list of tuples (apn, user name, password): the given
+	settings first (unless the APN is empty), then the settings of the operator of the Sim found in the APN table, then
+	no APN (LTE networks provide a default one)
+	"""
+	candidates = [(apn, user_name, password)] if len(apn) > 0 else []
+	operator_code = getSimOperatorCode(bus, policy, modem)
+	if operator_code != None:
+		candidates += [tuple(settings) for settings in __getAPNProviders().get(operator_code, [])]
+	candidates.append(("", "", ""))
+
+	# keep the first occurrence of each candidate
+	unique_candidates = []
+	for candidate in candidates:
+		if candidate not in unique_candidates:
+			unique_candidates.append(candidate)
+	return unique_candidates
+
+def enumerateModems(bus, policy=None):
 	"""Print all information accessible from ofono DBus regarding modems and their Sim
 	"""
+	return __callWithPolicy(policy, __enumerateModems, bus)
 
+def __enumerateModems(bus):
 	logger.info("")
 	logger.info("-Enumerate modems")
 
@@ -749,7 +1943,7 @@ def enumerateModems(bus):
 			if 'Call' in interface:
 				continue
 
-			object = dbus.Interface(bus.get_object('org.ofono', path), interface)
+			object = getModemSession(bus).getInterface(interface, path)
 
 			logger.info(("    [ %s ]" % (interface)))
 
@@ -791,10 +1985,39 @@ def enumerateModems(bus):
 				continue
 		logger.info('')
 
-def isCellularNetworkRegistered(bus, verbose=False, attempts=1, delay=5):
-	return __retryFunction(__isCellularNetworkRegistered, bus, verbose, attempts, delay)
+def _evaluateCellularNetworkRegistered(network_registration_properties, get_connection_manager_properties):
+	""" evaluate cellular network registration status from org.ofono.NetworkRegistration properties, return tuple (registered, message)
+	get_connection_manager_properties returns org.ofono.ConnectionManager properties, only needed when not registered
+	"""
+	# retrieve org.ofono.NetworkRegistration.Status property: The current network registration status of the modem
+	# doc: The possible values are:
+	#	"unregistered"  Not registered to any network
+	#	"registered"    Registered to home network
+	#	"searching"     Not registered, but searching
+	#	"denied"        Registration has been denied
+	#	"unknown"       Status is unknown
+	#	"roaming"       Registered, but roaming
+	network_registration_status = __dbus2py(network_registration_properties['Status'])
+	message = "Cellular network is %s" % (network_registration_status)
+	if network_registration_status == "registered" or network_registration_status == "roaming":
+		return True, message
+
+	"""If NetworkRegistration interface is not set to registered/roaming it is still possible that we are able to connect
+	via plain LTE. To verify we are checking the ConnectionsManagers bearer (needs to be 'lte') and the corresponding
+	'attached' value (needs to be 'true'/'1').
+	So far, this kind of LTE behavior was only seen on provider 'Verizon'.
+	"""
+	connection_manager_properties = get_connection_manager_properties()
+	connection_manager_bearer = __dbus2py(connection_manager_properties['Bearer'])
+	connection_manager_attached = __dbus2py(connection_manager_properties['Attached'])
+	if connection_manager_bearer.lower() == 'lte' and connection_manager_attached:
+		return True, "Cellular network is registered via native LTE"
+	return False, message
 
-def __isCellularNetworkRegistered(bus, verbose):
+def isCellularNetworkRegistered(bus, verbose=False, attempts=1, delay=5, policy=None, modem=None):
+	return __retryFunction(lambda bus, verbose: __isCellularNetworkRegistered(bus, verbose, modem), bus, verbose, attempts, delay, policy)
+
+def __isCellularNetworkRegistered(bus, verbose, modem=None):
 	""" retrieve cellular network registration status (registered or not)
 	"""
 
@@ -804,37 +2027,15 @@ def __isCellularNetworkRegistered(bus, verbose):
 
 	status = False
 
-	modems, message = __getModemsFromDBus(bus)
-	if modems != None:
-		modem_path = modems[0][0]
+	session = getModemSession(bus, modem)
+	modem_path, message = session.getModemPath()
+	if modem_path != None:
 
 		try:
-			# retrieve org.ofono.NetworkRegistration.Status property: The current network registration status of the modem
-			# doc: The possible values are:
-			#	"unregistered"  Not registered to any network
-			#	"registered"    Registered to home network
-			#	"searching"     Not registered, but searching
-			#	"denied"        Registration has been denied
-			#	"unknown"       Status is unknown
-			#	"roaming"       Registered, but roaming
-			network_registration_interface = dbus.Interface(bus.get_object('org.ofono', modem_path),'org.ofono.NetworkRegistration')
-			network_registration_status = __dbus2py(network_registration_interface.GetProperties()['Status'])
-			message = "Cellular network is %s" % (network_registration_status)
-			if network_registration_status == "registered" or network_registration_status == "roaming":
-				status = True
-			else:
-				"""If NetworkRegistration interface is not set to registered/roaming it is still possible that we are able to connect
-				via plain LTE. To verify we are checking the ConnectionsManagers bearer (needs to be 'lte') and the corresponding
-				'attached' value (needs to be 'true'/'1').
-				So far, this kind of LTE behavior was only seen on provider 'Verizon'.
-				"""
-				connection_manager_interface = dbus.Interface(bus.get_object('org.ofono', modem_path),'org.ofono.ConnectionManager')
-				connection_manager_bearer = __dbus2py(connection_manager_interface.GetProperties()['Bearer'])
-				connection_manager_attached = __dbus2py(connection_manager_interface.GetProperties()['Attached'])
-				if connection_manager_bearer.lower() == 'lte' and connection_manager_attached:
-					message = "Cellular network is registered via native LTE"
-					status = True
+			status, message = _evaluateCellularNetworkRegistered(__getProperties(session, 'org.ofono.NetworkRegistration'),
+				lambda: __getProperties(session, 'org.ofono.ConnectionManager'))
 		except dbus.DBusException as e:
+			session.invalidate()
 			message = "DBus exception while checking for network resgistration:%s" % (e)
 		except KeyError as e:
 			message = "KeyError exception: %s not present on Dbus" % (e)
@@ -845,10 +2046,142 @@ def __isCellularNetworkRegistered(bus, verbose):
 		logger.info(message)
 	return status, message
 
-def isDataNetworkRegistered(bus, verbose=False, attempts=1, delay=5):
-	return __retryFunction(__isDataNetworkRegistered, bus, verbose, attempts, delay)
+# Network the modem registered on last time (see saveRegisteredNetwork)
+REGISTERED_NETWORK_FILE_PATH = "/media/persistent/system/cellular_registered_network.json"
+
+# Time (seconds) given to the registration on the remembered network before asking for automatic registration
+REMEMBERED_NETWORK_REGISTRATION_TIMEOUT = 20
+
+def __getRegisteredNetworkFilePath(modem=None):
+	""" Return the file remembering the registered network of a modem, one file per USB serial number when a modem is given
+	"""
+	if modem == None or len(modem.Serial) == 0:
+		return REGISTERED_NETWORK_FILE_PATH
+	return REGISTERED_NETWORK_FILE_PATH.replace(".json", "_%s.json" % (re.sub(r"\W", "_", modem.Serial)))
+
+def saveRegisteredNetwork(bus, policy=None, modem=None):
+	""" Remember the network the modem is registered on, so that the next registration tries it first (see
+	registerToNetwork): { "plmn": MCC and MNC e.g. "22801", "technology": e.g. "lte" }. return tuple (status, message)
+	"""
+	return __callWithPolicy(policy, __saveRegisteredNetwork, bus, modem)
+
+def __saveRegisteredNetwork(bus, modem=None):
+	session = getModemSession(bus, modem)
+	modem_path, message = session.getModemPath()
+	if modem_path == None:
+		return False, message
+	try:
+		properties = __dbus2py(__getProperties(session, 'org.ofono.NetworkRegistration'))
+		network = { "plmn": properties["MobileCountryCode"] + properties["MobileNetworkCode"], "technology": properties.get("Technology", "") }
+		with open(__getRegisteredNetworkFilePath(modem), "w") as network_file:
+			json.dump(network, network_file)
+		return True, "Registered network %s (%s) saved" % (network["plmn"], network["technology"])
+	except dbus.DBusException as e:
+		session.invalidate()
+		return False, "DBus exception while getting registered network:%s" % (e)
+	except Exception as e:
+		return False, "Generic exception while saving registered network:%s" % (e)
+
+def loadRegisteredNetwork(modem=None):
+	""" Return the network remembered by saveRegisteredNetwork, None if there is none
+	"""
+	try:
+		with open(__getRegisteredNetworkFilePath(modem), "r") as network_file:
+			return json.load(network_file)
+	except Exception:
+		return None
+
+def __requestRegistration(session, plmn, timeout):
+	""" Ask ofono to register the modem on the network plmn (MCC and MNC, manual registration via its NetworkOperator),
+	on any network when plmn is None (automatic registration via NetworkRegistration). ofono answers once the modem is
+	registered or failed to: the answer is waited for at most timeout seconds. return tuple (status, message), status
+	being True when the registration is done
+	"""
+	try:
+		network_registration = session.getInterface('org.ofono.NetworkRegistration')
+		if plmn == None:
+			network_registration.Register(timeout=timeout)
+			return True, "Automatic registration done"
+
+		# operators known by ofono (current one and last scanned ones), a scan would take minutes
+		for operator_path, properties in network_registration.GetOperators():
+			properties = __dbus2py(properties)
+			if properties.get("MobileCountryCode", "") + properties.get("MobileNetworkCode", "") == plmn:
+				session.getInterface('org.ofono.NetworkOperator', operator_path).Register(timeout=timeout)
+				return True, "Registration on network %s done" % (plmn)
+		return False, "Network %s unknown to ofono" % (plmn)
+	except dbus.DBusException as e:
+		return False, "DBus exception while requesting registration:%s" % (e)
+
+def registerToNetwork(bus, timeout, verbose=False, policy=None, modem=None):
+	""" Wait for the modem to register on a cellular network, for at most timeout seconds. Instead of searching all the
+	networks, ofono is first asked to register the modem on the network remembered by saveRegisteredNetwork (manual
+	registration), for at most REMEMBERED_NETWORK_REGISTRATION_TIMEOUT seconds. ofono is then asked for automatic
+	registration, so that the modem may select another network later on, staying on the remembered one when registered.
+	return tuple (status, message, details), details being the measures for statistics, e.g.
+	{ "plmn": "22801", "technology": "lte", "fallback": False, "duration": 4.2 }: remembered network ofono registered on,
+	automatic registration needed to register, seconds until registered
+	"""
+	return __callWithPolicy(policy, __registerToNetwork, bus, timeout, verbose, modem)
 
-def __isDataNetworkRegistered(bus, verbose):
+def __registerToNetwork(bus, timeout, verbose=False, modem=None):
+	if verbose:
+		logger.info("")
+		logger.info("-Register to cellular network")
+
+	start = time.monotonic()
+	network = loadRegisteredNetwork(modem)
+	details = { "plmn": None, "technology": None, "fallback": False, "duration": None }
+	is_registered = lambda: isCellularNetworkRegistered(bus, modem=modem)[0]
+	policy = getCurrentPolicy()
+
+	def getRemaining():
+		remaining = max(0, timeout - (time.monotonic() - start))
+		return remaining if policy == None else policy.limit(remaining)
+
+	registered = is_registered()
+	if not registered and network != None:
+		session = getModemSession(bus, modem)
+		modem_path, message = session.getModemPath()
+		if modem_path != None:
+			status, message = __requestRegistration(session, network["plmn"], min(getRemaining(), REMEMBERED_NETWORK_REGISTRATION_TIMEOUT))
+			if verbose:
+				logger.info("Register first to network %s (%s): %s" % (network["plmn"], network["technology"], message))
+			if status:
+				details["plmn"] = network["plmn"]
+				details["technology"] = network["technology"]
+				registered = waitFor(bus, is_registered, min(getRemaining(), REMEMBERED_NETWORK_REGISTRATION_TIMEOUT))
+
+			# back to automatic registration (ofono keeps the mode): the modem stays on the network it is registered on.
+			# The request is sent once, the registration itself is awaited below
+			details["fallback"] = not registered
+			status, message = __requestRegistration(session, None, max(1, getRemaining()))
+			if verbose or not status:
+				logger.info("Automatic registration: %s" % (message))
+
+	if not registered:
+		registered = waitFor(bus, is_registered, getRemaining())
+
+	status, message = isCellularNetworkRegistered(bus, modem=modem)
+	if status:
+		details["duration"] = round(time.monotonic() - start, 1)
+		message = "%s after %.1f s" % (message, details["duration"])
+	if verbose:
+		logger.info(message)
+	return status, message, details
+
+def _evaluateDataNetworkRegistered(connection_manager_properties):
+	""" evaluate data network registration status from org.ofono.ConnectionManager properties, return tuple (attached, message)
+	"""
+	gprs_attached = __dbus2py(connection_manager_properties['Attached'])
+	if gprs_attached:
+		return True, "Attached to GPRS/3G/4G network"
+	return False, "Not attached to any GPRS/3G/4G network"
+
+def isDataNetworkRegistered(bus, verbose=False, attempts=1, delay=5, policy=None, modem=None):
+	return __retryFunction(lambda bus, verbose: __isDataNetworkRegistered(bus, verbose, modem), bus, verbose, attempts, delay, policy)
+
+def __isDataNetworkRegistered(bus, verbose, modem=None):
 	""" retrieve data network registration status (registered or not)
 	"""
 
@@ -858,22 +2191,17 @@ def __isDataNetworkRegistered(bus, verbose):
 
 	status = False
 
-	modems, message = __getModemsFromDBus(bus)
-	if modems != None:
-		modem_path = modems[0][0]
+	session = getModemSession(bus, modem)
+	modem_path, message = session.getModemPath()
+	if modem_path != None:
 
 		try:
 			# retrieve org.ofono.ConnectionManager.Attached property: Contains whether the Packet Radio Service is attached
 			# doc: "If this value changes to false, the user can assume that all contexts have been deactivated"
 			# doc: "If the modem is detached, certain features will not be available, e.g. receiving SMS over packet radio or network initiated PDP activation."
-			connection_manager_interface = dbus.Interface(bus.get_object('org.ofono', modem_path),'org.ofono.ConnectionManager')
-			gprs_attached = __dbus2py(connection_manager_interface.GetProperties()['Attached'])
-			if gprs_attached:
-				status = True
-				message = "Attached to GPRS/3G/4G network"
-			else:
-				message = "Not attached to any GPRS/3G/4G network"
+			status, message = _evaluateDataNetworkRegistered(__getProperties(session, 'org.ofono.ConnectionManager'))
 		except dbus.DBusException as e:
+			session.invalidate()
 			message = "DBus exception while checking for data network resgistration:%s" % (e)
 		except KeyError as e:
 			message = "KeyError exception: %s not present on Dbus" % (e)
@@ -884,10 +2212,19 @@ def __isDataNetworkRegistered(bus, verbose):
 		logger.info(message)
 	return status, message
 
-def isRoamingAllowed(bus, verbose=False, attempts=1, delay=5):
-	return __retryFunction(__isRoamingAllowed, bus, verbose, attempts, delay)
+def _evaluateRoamingAllowed(connection_manager_properties):
+	""" evaluate roaming allowed status from org.ofono.ConnectionManager properties, return tuple (allowed, message)
+	"""
+	# retrieve org.ofono.ConnectionManager.RoamingAllowed property
+	roaming_allowed = __dbus2py(connection_manager_properties['RoamingAllowed'])
+	if roaming_allowed:
+		return True, "Roaming is allowed"
+	return False, "Roaming is not allowed"
+
+def isRoamingAllowed(bus, verbose=False, attempts=1, delay=5, policy=None, modem=None):
+	return __retryFunction(lambda bus, verbose: __isRoamingAllowed(bus, verbose, modem), bus, verbose, attempts, delay, policy)
 
-def __isRoamingAllowed(bus, verbose):
+def __isRoamingAllowed(bus, verbose, modem=None):
 	""" retrieve roaming allowed status (roaming allowed or not)
 	"""
 
@@ -897,20 +2234,14 @@ def __isRoamingAllowed(bus, verbose):
 
 	status = False
 
-	modems, message = __getModemsFromDBus(bus)
-	if modems != None:
-		modem_path = modems[0][0]
+	session = getModemSession(bus, modem)
+	modem_path, message = session.getModemPath()
+	if modem_path != None:
 
 		try:
-			# retrieve org.ofono.ConnectionManager.RoamingAllowed property
-			connection_manager_interface = dbus.Interface(bus.get_object('org.ofono', modem_path),'org.ofono.ConnectionManager')
-			roaming_allowed = __dbus2py(connection_manager_interface.GetProperties()['RoamingAllowed'])
-			if roaming_allowed:
-				status = True
-				message = "Roaming is allowed"
-			else:
-				message = "Roaming is not allowed"
+			status, message = _evaluateRoamingAllowed(__getProperties(session, 'org.ofono.ConnectionManager'))
 		except dbus.DBusException as e:
+			session.invalidate()
 			message = "DBus exception while reading Roaming allowed status:%s" % (e)
 		except KeyError as e:
 			message = "KeyError exception: %s not present on Dbus" % (e)
@@ -922,13 +2253,15 @@ def __isRoamingAllowed(bus, verbose):
 	return status, message
 
 
-def setRoamingAllowed(bus, roamingAllowed=True):
+def setRoamingAllowed(bus, roamingAllowed=True, policy=None, modem=None):
 	"""
 	In ofono DBUS: "org.ofono.NetworkRegistration.Status == roaming" as soon as the SIM is not in the country of the service provider.
 	In this case the modem is attached to a local network for voice only.
 	It is necessary to set "org.ofono.ConnectionManager.RoamingAllowed to 1" to enable DATA roaming (GPRS, 3G, 4G)... this is the goal of this function
 	"""
+	return __callWithPolicy(policy, __setRoamingAllowed, bus, roamingAllowed, modem)
 
+def __setRoamingAllowed(bus, roamingAllowed=True, modem=None):
 	logger.info("")
 	if roamingAllowed:
 		logger.info("-Enable data roaming")
@@ -937,28 +2270,47 @@ def setRoamingAllowed(bus, roamingAllowed=True):
 
 	status = False
 
-	modems, message = __getModemsFromDBus(bus)
-	if modems != None:
-		modem_path = modems[0][0]
+	session = getModemSession(bus, modem)
+	modem_path, message = session.getModemPath()
+	if modem_path != None:
 
 		try:
 			# retrieve org.ofono.ConnectionManager.RoamingAllowed property
-			connection_manager_interface = dbus.Interface(bus.get_object('org.ofono', modem_path),'org.ofono.ConnectionManager')
+			connection_manager_interface = session.getInterface('org.ofono.ConnectionManager')
 			connection_manager_interface.SetProperty("RoamingAllowed", dbus.Boolean(roamingAllowed))
 			status = True
 		except dbus.DBusException as e:
+			session.invalidate()
 			message = "DBus exception while setting RoamingAllowed:%s" % (e)
 		except Exception as e:
 			message = "Generic exception while setting RoamingAllowed:%s" % (e)
 	return status, message
 
-def getSignalStrength(bus, verbose=False):
+def _evaluateRFStatus(rf_status):
+	""" extract tuple (rssi, rsrp, tech) from the answer of org.ofono.TelitDataNetwork.GetRFStatus(), -1 and 'none' when unknown
+	"""
+	rssi = -1
+	rsrp = -1
+	tech = 'none'
+	for key in rf_status.keys():
+		if key == 'RSSI':
+			rssi = int(rf_status[key])
+		if key == 'Tech':
+			tech = str(rf_status[key])
+		if key == 'RSRP':
+			rsrp = int(rf_status[key])
+	return rssi, rsrp, tech
+
+def getSignalStrength(bus, verbose=False, policy=None, modem=None):
 	"""
 	retrieve the signal strength of the connected modem.
 	based on the technologie used (Edge, 3G, 4G,...) the signal strength value
 	is stored in a different key, (RSSI = 3G, RSRP = 4G,...)
 	we therefore return appropriate the strength value based on the technologie but also the tech itself
 	"""
+	return __callWithPolicy(policy, __getSignalStrength, bus, verbose, modem)
+
+def __getSignalStrength(bus, verbose=False, modem=None):
 	if verbose:
 		logger.info("")
 		logger.info("-Get signal strength")
@@ -967,7 +2319,7 @@ def getSignalStrength(bus, verbose=False):
 	strength = -1
 	tech = 'none'
 	# it is mandatory to be registered to a network to have access to signal strength propertie in DBus
-	network_registered, message = isCellularNetworkRegistered(bus)
+	network_registered, message = isCellularNetworkRegistered(bus, modem=modem)
 	# the known signal strength value based on technologie
 	#3G
 	rssi = -1
@@ -975,24 +2327,17 @@ def getSignalStrength(bus, verbose=False):
 	rsrp = -1
 
 	if network_registered:
-		modems, message = __getModemsFromDBus(bus)
-		if modems != None:
-			modem_path = modems[0][0]
+		session = getModemSession(bus, modem)
+		modem_path, message = session.getModemPath()
+		if modem_path != None:
 
 			try:
 				#manager = dbus.Interface(bus.get_object('org.ofono', '/'), 'org.ofono.Manager')
 				#modems = manager.GetModems()
 				#path = modems[0][0]
 
-				tdn = dbus.Interface(bus.get_object('org.ofono', modem_path), 'org.ofono.TelitDataNetwork')
-				status = tdn.GetRFStatus()
-				for key in status.keys():
-					if key == 'RSSI':
-						rssi = int(status[key])
-					if key == 'Tech':
-						tech = str(status[key])
-					if key == 'RSRP':
-						rsrp = int(status[key])
+				tdn = session.getInterface('org.ofono.TelitDataNetwork')
+				rssi, rsrp, tech = _evaluateRFStatus(tdn.GetRFStatus())
 #				TO KEEP as this might be usefull again
 #				retrieve the interface containing the signal strength (org.ofono.NetworkRegistration)
 #				network_registration_interface = dbus.Interface(bus.get_object('org.ofono', modem_path),'org.ofono.NetworkRegistration')
@@ -1025,6 +2370,7 @@ def getSignalStrength(bus, verbose=False):
 #				#strength = __dbus2py(network_registration_properties['Strength'])
 #				#message = "Signal strength is %d%%" % (strength)
 			except dbus.DBusException as e:
+				session.invalidate()
 				message = "DBus exception while getting signal strength:%s" % (e)
 			except KeyError as e:
 				message = "Impossible to get signal strength right now"
@@ -1039,10 +2385,133 @@ def getSignalStrength(bus, verbose=False):
 
 	return strength, message, tech
 
-def clearInternetContext(bus):
+class ModemSnapshot(object):
+	"""Properties of the modem and of its main ofono interfaces, all read once by getModemSnapshot().
+
+	Its methods answer like the functions of this library with the same name, but from the snapshot only:
+	a diagnostic built on them does not call DBus anymore and is consistent (no state change between two steps).
+	"""
+
+	def __init__(self):
+		self.modem_path = None		# path of the modem on DBus, None when no modem is found
+		self.message = ""		# message of the modem lookup on DBus
+		self.properties = {}		# properties of each interface read, indexed by interface name
+		self.errors = {}		# message explaining why properties of an interface are missing, indexed by interface name
+		self.contexts = None		# contexts of org.ofono.ConnectionManager, list of (path, properties)
+		self.rf_status = None		# answer of org.ofono.TelitDataNetwork.GetRFStatus()
+		self.dbus_calls = 0		# number of DBus calls done to build the snapshot
+
+	def _getProperties(self, interface_name):
+		"""return properties of an interface, raise KeyError with an explicit message when they are missing
+		"""
+		properties = self.properties.get(interface_name)
+		if properties == None:
+			raise KeyError(self.errors.get(interface_name, "%s" % (interface_name)))
+		return properties
+
+	def _evaluate(self, default_status, evaluator, *interface_names):
+		if self.modem_path == None:
+			return default_status, self.message
+		for interface_name in interface_names:
+			if interface_name not in self.properties:
+				return default_status, self.errors.get(interface_name, "%s is not available" % (interface_name))
+		try:
+			return evaluator(*[self._getProperties(interface_name) for interface_name in interface_names])
+		except KeyError as e:
+			return default_status, "KeyError exception: %s not present on Dbus" % (e)
+		except Exception as e:
+			return default_status, "Generic exception while reading modem snapshot:%s" % (e)
+
+	def isModemOnDBus(self):
+		return self.modem_path != None, self.message
+
+	def isSimPresent(self):
+		return self._evaluate(False, _evaluateSimPresent, 'org.ofono.SimManager')
+
+	def getPinStatus(self):
+		return self._evaluate(PinStatus.Unknown, _evaluatePinStatus, 'org.ofono.SimManager')
+
+	def isCellularNetworkRegistered(self):
+		return self._evaluate(False, lambda properties: _evaluateCellularNetworkRegistered(properties,
+			lambda: self._getProperties('org.ofono.ConnectionManager')), 'org.ofono.NetworkRegistration')
+
+	def isDataNetworkRegistered(self):
+		return self._evaluate(False, _evaluateDataNetworkRegistered, 'org.ofono.ConnectionManager')
+
+	def isInternetContextActive(self):
+		if self.modem_path != None and self.contexts == None:
+			return False, self.errors.get('contexts', "No Internet context found")
+		return self._evaluate(False, lambda: _evaluateInternetContextActive(self.contexts))
+
+	def getSignalStrength(self):
+		"""return tuple (strength, message, tech) like getSignalStrength()
+		"""
+		network_registered, message = self.isCellularNetworkRegistered()
+		if not network_registered:
+			return -1, message, 'none'
+		if self.rf_status == None:
+			return -1, self.errors.get('rf_status', "Impossible to get signal strength right now"), 'none'
+		rssi, rsrp, tech = _evaluateRFStatus(self.rf_status)
+		# if the current tech used is 4G we use for strength the rsrp
+		# else we will use the rssi
+		return (rsrp if tech == "4G" else rssi), message, tech
+
+def getModemSnapshot(bus, policy=None, modem=None):
+	"""Read at once everything needed to diagnose the modem: properties of the modem, of its SimManager, NetworkRegistration
+	and ConnectionManager interfaces, its contexts and its RF status. Return a ModemSnapshot
+	"""
+	return __callWithPolicy(policy, __getModemSnapshot, bus, modem)
+
+def __getModemSnapshot(bus, modem=None):
+	snapshot = ModemSnapshot()
+	session = getModemSession(bus, modem)
+
+	modems, modem_path, snapshot.message = session.resolveModems()
+	snapshot.dbus_calls += 1
+	if modem_path == None:
+		return snapshot
+
+	modem_properties = next((properties for path, properties in modems if path == modem_path), None)
+	if modem_properties == None:
+		snapshot.message = "Modem %s not found among the modems on DBus" % (modem_path)
+		return snapshot
+	snapshot.modem_path = str(modem_path)
+	snapshot.properties['org.ofono.Modem'] = modem_properties
+	interfaces = modem_properties.get('Interfaces', [])
+
+	def read(key, interface_name, function):
+		if interface_name not in interfaces:
+			snapshot.errors[key] = "%s is not available" % (interface_name)
+			return None
+		try:
+			snapshot.dbus_calls += 1
+			return function(session.getInterface(interface_name, modem_path))
+		except dbus.DBusException as e:
+			session.invalidate()
+			snapshot.errors[key] = "DBus exception while reading %s:%s" % (interface_name, e)
+		except Exception as e:
+			snapshot.errors[key] = "Generic exception while reading %s:%s" % (interface_name, e)
+		return None
+
+	for interface_name in ['org.ofono.SimManager', 'org.ofono.NetworkRegistration', 'org.ofono.ConnectionManager']:
+		properties = read(interface_name, interface_name, lambda interface: interface.GetProperties())
+		if properties != None:
+			snapshot.properties[interface_name] = properties
+
+	snapshot.contexts = read('contexts', 'org.ofono.ConnectionManager', lambda interface: interface.GetContexts())
+
+	# it is mandatory to be registered to a network to have access to the RF status
+	if snapshot.isCellularNetworkRegistered()[0]:
+		snapshot.rf_status = read('rf_status', 'org.ofono.TelitDataNetwork', lambda interface: interface.GetRFStatus())
+
+	return snapshot
+
+def clearInternetContext(bus, policy=None, modem=None):
 	""" Clear existing internet context in Sim.
 	"""
+	return __callWithPolicy(policy, __clearInternetContext, bus, modem)
 
+def __clearInternetContext(bus, modem=None):
 	logger.info("")
 	logger.info("-Clear existing internet context")
 
@@ -1050,13 +2519,16 @@ def clearInternetContext(bus):
 	if modems == None:
 		logger.info(message)
 		return
+	if modem != None:
+		modem_path, message = getModemSession(bus, modem).getModemPath()
+		modems = [(path, properties) for path, properties in modems if path == modem_path]
 
 	try:
 		for path, properties in modems:
 			if "org.ofono.ConnectionManager" not in properties["Interfaces"]:
 				continue
 
-			connman = dbus.Interface(bus.get_object('org.ofono', path), 'org.ofono.ConnectionManager')
+			connman = getModemSession(bus, modem).getInterface('org.ofono.ConnectionManager', path)
 			contexts = connman.GetContexts()
 
 			# remove existings contexts
@@ -1070,10 +2542,12 @@ def clearInternetContext(bus):
 	except Exception as e:
 		message = "Generic exception while clearing internet contexts:%s" % (e)
 
-def setInternetContext(bus, apn, user_name, password):
+def setInternetContext(bus, apn, user_name, password, policy=None, modem=None):
 	""" Configure APN settings by creating an "Internet context" (stored in Sim)
 	"""
+	return __callWithPolicy(policy, __setInternetContext, bus, apn, user_name, password, modem)
 
+def __setInternetContext(bus, apn, user_name, password, modem=None):
 	logger.info("")
 	if len(apn) > 0:
 		logger.info("-Configure internet context using %s" % (apn))
@@ -1084,13 +2558,16 @@ def setInternetContext(bus, apn, user_name, password):
 	if modems == None:
 		logger.info(message)
 		return
+	if modem != None:
+		modem_path, message = getModemSession(bus, modem).getModemPath()
+		modems = [(path, properties) for path, properties in modems if path == modem_path]
 
 	try:
 		for path, properties in modems:
 			if "org.ofono.ConnectionManager" not in properties["Interfaces"]:
 				continue
 
-			connman = dbus.Interface(bus.get_object('org.ofono', path), 'org.ofono.ConnectionManager')
+			connman = getModemSession(bus, modem).getInterface('org.ofono.ConnectionManager', path)
 			contexts = connman.GetContexts()
 
 			path = ""
@@ -1105,7 +2582,7 @@ def setInternetContext(bus, apn, user_name, password):
 			else:
 				logger.info(("Found context %s" % (path)))
 
-			context = dbus.Interface(bus.get_object('org.ofono', path),	'org.ofono.ConnectionContext')
+			context = getModemSession(bus, modem).getInterface('org.ofono.ConnectionContext', path)
 
 			if len(apn) > 0:
 				context.SetProperty("AccessPointName", apn)
@@ -1118,19 +2595,96 @@ def setInternetContext(bus, apn, user_name, password):
 			if len(password) > 0:
 				context.SetProperty("Password", password)
 				logger.info(("Setting password to %s" % (password)))
-
-			#Necessary to wait a bit after context creation
-			time.sleep(3)
 	except dbus.DBusException as e:
 		message = "DBus exception while setting internet contexts:%s" % (e)
 	except Exception as e:
 		message = "Generic exception while setting internet contexts:%s" % (e)
 
-def isInternetContextActive(bus, verbose=False, attempts=1, delay=5):
-	return __retryFunction(__isInternetContextActive, bus, verbose, attempts, delay)
+def isInternetContextConfigured(bus, apn, user_name, password, verbose=False, policy=None, modem=None):
+	""" check if an internet context of the modem is already configured with apn, user_name and password (empty values
+	are not checked, like in setInternetContext), return tuple (status, message)
+	"""
+	return __callWithPolicy(policy, __isInternetContextConfigured, bus, apn, user_name, password, verbose, modem)
+
+def __isInternetContextConfigured(bus, apn, user_name, password, verbose=False, modem=None):
+	if verbose:
+		logger.info("")
+		logger.info("-Check internet context configuration")
+
+	status = False
+
+	session = getModemSession(bus, modem)
+	modem_path, message = session.getModemPath()
+	if modem_path != None:
+
+		try:
+			message = "No internet context found"
+			for path, properties in __getContexts(session):
+				if __dbus2py(properties["Type"]) != "internet":
+					continue
+				expected = { "AccessPointName": apn, "Username": user_name, "Password": password }
+				differences = [ key for key, value in expected.items() if len(value) > 0 and __dbus2py(properties.get(key, "")) != value ]
+				if len(differences) == 0:
+					status = True
+					message = "Internet context %s is already configured" % (path)
+				else:
+					message = "Internet context %s differs by %s" % (path, ", ".join(sorted(differences)))
+				break
+
+		except dbus.DBusException as e:
+			session.invalidate()
+			message = "DBus exception while checking internet context configuration:%s" % (e)
+		except Exception as e:
+			message = "Generic exception while checking internet context configuration:%s" % (e)
+
+	if verbose:
+		logger.info(message)
+	return status, message
+
+def hasInternetContext(bus, policy=None, modem=None):
+	""" check if the modem has an internet context, return tuple (status, message). status is None when it cannot be
+	told: modem not on DBus, contexts not readable (no ConnectionManager, e.g. Sim absent or Pin locked), DBus error
+	"""
+	return __callWithPolicy(policy, __hasInternetContext, bus, modem)
+
+def __hasInternetContext(bus, modem=None):
+	status = None
+
+	session = getModemSession(bus, modem)
+	modem_path, message = session.getModemPath()
+	if modem_path != None:
+
+		try:
+			contexts = [path for path, properties in __getContexts(session) if __dbus2py(properties["Type"]) == "internet"]
+			status = len(contexts) > 0
+			message = "Internet context %s found" % (contexts[0]) if status else "No internet context found"
+		except dbus.DBusException as e:
+			session.invalidate()
+			message = "DBus exception while reading internet contexts:%s" % (e)
+		except Exception as e:
+			message = "Generic exception while reading internet contexts:%s" % (e)
 
-def __isInternetContextActive(bus, verbose):
-	""" retrieve Internet context status in Ofono (active or not). An active Internet context means ppp0 is mounted
+	return status, message
+
+def _evaluateInternetContextActive(contexts):
+	""" evaluate Internet context status from the contexts of org.ofono.ConnectionManager (list of (path, properties)), return tuple (active, message)
+	"""
+	# use first context
+	if len(contexts) == 0:
+		return False, "No Internet context found"
+
+	# ofono.ConnectionContext contains information about ppp connection
+	status = __dbus2py(contexts[0][1]['Active'])
+	if status:
+		return status, "Internet context is active"
+	return status, "Internet context is not active"
+
+def isInternetContextActive(bus, verbose=False, attempts=1, delay=5, policy=None, modem=None):
+	return __retryFunction(lambda bus, verbose: __isInternetContextActive(bus, verbose, modem), bus, verbose, attempts, delay, policy)
+
+def __isInternetContextActive(bus, verbose, modem=None):
+	""" retrieve Internet context status in Ofono (active or not). An active Internet context means the network interface
+	of the data connection is up (ppp0, or usb0/wwan0 over NCM/ECM, see getDataInterfaceName)
 	"""
 
 	if verbose:
@@ -1139,29 +2693,16 @@ def __isInternetContextActive(bus, verbose):
 
 	status = False
 
-	modems, message = __getModemsFromDBus(bus)
-	if modems != None:
-		modem_path = modems[0][0]
+	session = getModemSession(bus, modem)
+	modem_path, message = session.getModemPath()
+	if modem_path != None:
 
 		try:
-			connection_manager_interface = dbus.Interface(bus.get_object('org.ofono', modem_path),'org.ofono.ConnectionManager')
-
 			# retrieve internet context
-			contexts = connection_manager_interface.GetContexts()
-			# use first context
-			if len(contexts) == 0:
-				message = "No Internet context found"
-
-			# ofono.ConnectionContext contains information about ppp connection
-			the_context = contexts[0][0]
-			connection_context = dbus.Interface(bus.get_object('org.ofono', the_context),'org.ofono.ConnectionContext')
-			status = __dbus2py(connection_context.GetProperties()['Active'])
-			if status:
-				message = "Internet context is active"
-			else:
-				message = "Internet context is not active"
+			status, message = _evaluateInternetContextActive(__getContexts(session))
 
 		except dbus.DBusException as e:
+			session.invalidate()
 			message = "DBus exception while checking Internet context status:%s" % (e)
 		except KeyError as e:
 			message = "KeyError exception: %s not present on Dbus" % (e)
@@ -1172,11 +2713,43 @@ def __isInternetContextActive(bus, verbose):
 		logger.info(message)
 	return status, message
 
-def contactServer(verbose=False, attempts=1, delay=5):
-	return __retryFunction(__contactServer, None, verbose, attempts, delay)
+def getInternetContextInterface(bus, policy=None, modem=None):
+	""" Return the name of the network interface of the Internet context of the modem (e.g. "ppp0"), from the "Settings"
+	of the context, None when the context is not active
+	"""
+	return __callWithPolicy(policy, __getInternetContextInterface, bus, modem)
+
+def __getInternetContextInterface(bus, modem=None):
+	session = getModemSession(bus, modem)
+	modem_path, message = session.getModemPath()
+	if modem_path != None:
+
+		try:
+			# use first context, like isInternetContextActive
+			contexts = __getContexts(session)
+			if len(contexts) > 0 and __dbus2py(contexts[0][1]['Active']):
+				return __dbus2py(contexts[0][1]['Settings']).get("Interface")
+		except dbus.DBusException as e:
+			session.invalidate()
+		except Exception as e:
+			pass
+	return None
+
+def getDataInterfaceName(bus, policy=None, modem=None):
+	""" Return the name of the network interface of the cellular data connection: the interface of the Internet context
+	of the modem (see getInternetContextInterface), e.g. "ppp0" over PPP, "usb0" or "wwan0" over NCM/ECM.
+	CELLULAR_INTERFACE_NAME when the context is not active
+	"""
+	interface_name = getInternetContextInterface(bus, policy, modem)
+	if interface_name == None:
+		return CELLULAR_INTERFACE_NAME
+	return interface_name
+
+def contactServer(verbose=False, attempts=1, delay=5, policy=None, interface_name=CELLULAR_INTERFACE_NAME):
+	return __retryFunction(lambda verbose: __contactServer(verbose, interface_name), None, verbose, attempts, delay, policy)
 
-def __contactServer(verbose=False):
-	"""try to establish a connection to a server
+def __contactServer(verbose=False, interface_name=CELLULAR_INTERFACE_NAME):
+	"""try to establish a connection to a server through interface_name
 	Two reference servers are used; return True if a least one server is reachable
 	"""
 	status = False
@@ -1188,7 +2761,7 @@ def __contactServer(verbose=False):
 			logger.info("")
 			logger.info("-Contact %s" % (server_url))
 
-		if lib_network.contact_server(interface_name=CELLULAR_INTERFACE_NAME, server_urls=[server_url]):
+		if lib_network.contact_server(interface_name=interface_name, server_urls=[server_url]):
 			status = True
 			loop_msg = "Contact to %s successful" % (server_url)
 		else:
@@ -1208,8 +2781,8 @@ def __contactServer(verbose=False):
 
 	return status, message
 
-def getCellularServiceInConnman(bus, verbose=False, attempts=3, delay=5):
-	return __retryFunction(__getCellularServiceInConnman, bus, verbose, attempts, delay)
+def getCellularServiceInConnman(bus, verbose=False, attempts=3, delay=5, policy=None):
+	return __retryFunction(__getCellularServiceInConnman, bus, verbose, attempts, delay, policy)
 
 def __getCellularServiceInConnman(bus, verbose):
 	""" Wait until a cellular service is listed by Connman
@@ -1228,7 +2801,8 @@ def __getCellularServiceInConnman(bus, verbose):
 				message = path
 				#the service is listed but not really ready to be connected... wait a bit for it
 				#this timing differs from one provider to another...
-				time.sleep(5)
+				if not __isCellularServiceReady(properties):
+					waitFor(bus, lambda: __isCellularServiceReady(__getConnmanServiceProperties(bus, path)), 5)
 				break
 		if not status:
 			message = "No cellular service seen by Connman"
@@ -1240,20 +2814,56 @@ def __getCellularServiceInConnman(bus, verbose):
 		logger.info(message)
 	return status, message
 
-def connectToCellularServiceInConnman(bus, cellular_service_path, verbose=False, attempts=2, delay=5):
-	"""Connect connman to a cellular service, with retries
+def __getConnmanServiceProperties(bus, service_path):
+	"""return properties of a connman service ({} if the service does not exist anymore)
 	"""
-	for attempt in range(0,attempts):
-		if attempt > 0:
-			time.sleep(delay)
-			if verbose:
-				logger.info("")
-				logger.info("-Attempt #%d->" % (attempt+1))
-		status, message = __connectToCellularServiceInConnman(bus, cellular_service_path, verbose)
-		if status:
-			break	#success, no need to retry anymore
+	try:
+		service = dbus.Interface(bus.get_object("net.connman", service_path), "net.connman.Service")
+		return service.GetProperties()
+	except dbus.DBusException:
+		return {}
+
+def __isCellularServiceReady(properties):
+	"""A cellular service can be connected once connman knows the network behind it, i.e. once it is named after the operator
+	"""
+	return __dbus2py(properties.get("State", "")) in ["ready", "online"] or len(__dbus2py(properties.get("Name", ""))) > 0
+
+def isCellularServiceConnected(bus, verbose=False, policy=None):
+	""" check if connman is connected to a cellular service that is automatically connected at startup
+	return tuple (status, path of the service or message)
+	"""
+	return __callWithPolicy(policy, __isCellularServiceConnected, bus, verbose)
+
+def __isCellularServiceConnected(bus, verbose=False):
+	if verbose:
+		logger.info("")
+		logger.info("-Check cellular service connection in connman")
+	status = False
+	try:
+		manager = dbus.Interface(bus.get_object("net.connman", "/"), "net.connman.Manager")
+		message = "No cellular service seen by Connman"
+		for path, properties in manager.GetServices():
+			if path.find("cellular_") != -1:
+				state = __dbus2py(properties.get("State", ""))
+				if state in ["ready", "online"] and __dbus2py(properties.get("AutoConnect", False)):
+					status = True
+					message = str(path)
+				else:
+					message = "Cellular service %s is %s" % (path, state)
+				break
+	except dbus.DBusException as e:
+		message = "DBus exception while checking cellular service in Connman:%s" % (e)
+	except Exception as e:
+		message = "Generic exception while checking cellular service in Connman:%s" % (e)
+	if verbose:
+		logger.info(message)
 	return status, message
 
+def connectToCellularServiceInConnman(bus, cellular_service_path, verbose=False, attempts=2, delay=5, policy=None):
+	"""Connect connman to a cellular service, with retries
+	"""
+	return __retryFunction(lambda verbose: __connectToCellularServiceInConnman(bus, cellular_service_path, verbose), None, verbose, attempts, delay, policy)
+
 def __connectToCellularServiceInConnman(bus, cellular_service_path, verbose):
 	"""Connect connman to a cellular service.
 	"""
@@ -1264,7 +2874,10 @@ def __connectToCellularServiceInConnman(bus, cellular_service_path, verbose):
 	status = False
 	try:
 		service = dbus.Interface(bus.get_object("net.connman", cellular_service_path), "net.connman.Service")
-		service.Connect(timeout=10000)	#ask for connection, use long timeout
+		# ask for connection, use long timeout (the time left before the deadline of the current policy)
+		policy = getCurrentPolicy()
+		timeout = CONNMAN_CONNECT_TIMEOUT if policy == None else max(MIN_DBUS_CALL_TIMEOUT, policy.limit(CONNMAN_CONNECT_TIMEOUT))
+		service.Connect(timeout=timeout)
 		service.SetProperty("AutoConnect", True)	#mandatory: this cellular service will automatically be connected at next startup
 		status = True
 		message = "Successful connection"
@@ -1283,33 +2896,40 @@ def isOfonodRunning():
 	return (status, message)
 
 
-def getProviderMode(bus):
+def getProviderMode(bus, policy=None, modem=None):
 	""" Returns provider mode
 		"att"     - AT&T
 		"verizon" - Verizon
 		"unknown" - Error
 	"""
+	return __callWithPolicy(policy, __getProviderMode, bus, modem)
 
-	modems, message = __getModemsFromDBus(bus)
-	if modems != None:
-		modem_path = modems[0][0]
+def __getProviderMode(bus, modem=None):
+	session = getModemSession(bus, modem)
+	modem_path, message = session.getModemPath()
+	if modem_path != None:
 
 		try:
-			provider = dbus.Interface(bus.get_object('org.ofono', modem_path), 'org.ofono.TelitProvider')
+			provider = session.getInterface('org.ofono.TelitProvider')
 			return "att" if provider.GetProperties()["VerizonMode"] == 0 else "verizon"
+		except dbus.DBusException as e:
+			session.invalidate()
+			return "unknown"
 		except Exception as e:
 			return "unknown"
 
 	return "unknown"
 
-def configureProviderMode(bus, mode, verbose = False):
+def configureProviderMode(bus, mode, verbose = False, policy=None, modem=None):
 	""" switches modem to the selected provider/firmware mode
 		Supported modes are "verizon" and "att"
 	"""
+	return __callWithPolicy(policy, __configureProviderMode, bus, mode, verbose, modem)
 
-	modems, message = __getModemsFromDBus(bus)
-	if modems != None:
-		modem_path = modems[0][0]
+def __configureProviderMode(bus, mode, verbose = False, modem=None):
+	session = getModemSession(bus, modem)
+	modem_path, message = session.getModemPath()
+	if modem_path != None:
 
 		try:
 			if mode == "verizon":
@@ -1319,13 +2939,15 @@ def configureProviderMode(bus, mode, verbose = False):
 			else:
 				return False, "Unsupported mode"
 
-			if mode == getProviderMode(bus):
+			if mode == getProviderMode(bus, modem=modem):
 				return True, "Already in the selected mode"
 
-			provider = dbus.Interface(bus.get_object('org.ofono', modem_path), 'org.ofono.TelitProvider')
+			provider = session.getInterface('org.ofono.TelitProvider')
 			provider.SetProperty("VerizonMode", dbus.Boolean(fwswitch_config))
+			__invalidateModemIdentity(modem)
 			return True, "Success"
 		except dbus.DBusException as e:
+			session.invalidate()
 			message = "DBus exception while configuring provider mode:%s" % (e)
 		except Exception as e:
 			message = "Generic exception while configuring provider mode:%s" % (e)
@@ -1335,7 +2957,64 @@ def configureProviderMode(bus, mode, verbose = False):
 
 	return False, message
 
-def isNorthAmericaModemViaDBus(bus):
+def switchProviderMode(bus, mode, timeout=FIRMWARE_SWITCH_TIMEOUT, verbose = False, policy=None, modem=None):
+	""" switches modem to the selected provider/firmware mode (see configureProviderMode) and wait for the modem to
+	be back on DBus with this mode: the modem reboots on the new firmware, it leaves the USB bus (ofono signals
+	ModemRemoved) then comes back (ofono signals ModemAdded and exposes org.ofono.TelitProvider again).
+	return tuple (status, message)
+	"""
+	return __callWithPolicy(policy, __switchProviderMode, bus, mode, timeout, verbose, modem)
+
+def __switchProviderMode(bus, mode, timeout=FIRMWARE_SWITCH_TIMEOUT, verbose = False, modem=None):
+	if mode == getProviderMode(bus, modem=modem):
+		return True, "Already in the selected mode"
+
+	# subscribe before switching to not miss the removal of the modem (any modem when the modem is not known)
+	modem_path, _ = getModemSession(bus, modem).getModemPath()
+	removed = []
+	match = bus.add_signal_receiver(lambda path: removed.append(str(path)), bus_name='org.ofono',
+		dbus_interface='org.ofono.Manager', signal_name='ModemRemoved')
+	try:
+		start = time.monotonic()
+		status, message = configureProviderMode(bus, mode, verbose, modem=modem)
+		if not status:
+			return status, message
+
+		status = False
+		if not waitFor(bus, lambda: len(removed) > 0 and (modem_path == None or str(modem_path) in removed), timeout):
+			message = "Modem did not reboot within %d s after firmware switch" % (timeout)
+		elif not waitFor(bus, lambda: getProviderMode(bus, modem=modem) == mode, timeout - (time.monotonic() - start)):
+			message = "Modem is not back with firmware mode '%s' within %d s" % (mode, timeout)
+		else:
+			status = True
+			message = "Modem is back with firmware mode '%s' after %.1f s" % (mode, time.monotonic() - start)
+			__invalidateModemIdentity(modem)
+	finally:
+		match.remove()
+
+	if verbose:
+		logger.info(message)
+	return status, message
+
+def getModemInterfaces(bus, policy=None, modem=None):
+	"""return the list of interfaces currently exposed by the modem on ofono DBus (empty list on error)
+	Interfaces are added by ofono while it discovers the modem and the SIM
+	"""
+	return __callWithPolicy(policy, __getModemInterfaces, bus, modem)
+
+def __getModemInterfaces(bus, modem=None):
+	session = getModemSession(bus, modem)
+	modem_path, _ = session.getModemPath()
+	if modem_path != None:
+		try:
+			return __dbus2py(__getProperties(session, 'org.ofono.Modem')["Interfaces"])
+		except dbus.DBusException as e:
+			session.invalidate()
+		except Exception as e:
+			pass
+	return []
+
+def isNorthAmericaModemViaDBus(bus, policy=None, modem=None):
 	"""
 	Determine if the first modem seen on DBus is a North America modem.
 
@@ -1343,42 +3022,188 @@ def isNorthAmericaModemViaDBus(bus):
 		True:  the first modem found is made for North America cellular networks
 		False: the first modem found is not made for North America cellular networks
 	"""
+	return __callWithPolicy(policy, __isNorthAmericaModemViaDBus, bus, modem)
 
-	modems, _ = __getModemsFromDBus(bus)
-	if modems != None:
-		modem_path = modems[0][0]
+def __isNorthAmericaModemViaDBus(bus, modem=None):
+	session = getModemSession(bus, modem)
+	modem_path, _ = session.getModemPath()
+	if modem_path != None:
 
 		try:
-			modem = dbus.Interface(bus.get_object('org.ofono', modem_path), 'org.ofono.Modem')
-			model = modem.GetProperties()["Model"]
+			model = __getProperties(session, 'org.ofono.Modem')["Model"]
 			#LE910-EU for Europe, LE910-NA for North America
 			if (type(model) == dbus.String) and ("NA" in model):
 				return True
+		except dbus.DBusException as e:
+			session.invalidate()
+			return False
 		except Exception as e:
 			return False
 	return False
 
-def isNorthAmericaModemViaSerial():
+def isNorthAmericaModemViaSerial(channel = None):
 	"""
 	Determine if the modem connected to serial is a North America modem.
-	This function shouldn't be called when some process uses the modem serial
-	console (/dev/ttyACM0); i.e. ofono should not be running.
+	Without channel, the command is sent on the port of ofono when ofono is
+	not running, on a secondary serial port of the modem otherwise.
 
 	Result:
 		True:  the modem is made for North America cellular networks
 		False: the modem is not made for North America cellular networks
+		None:  unknown, no serial port of the modem is free or the modem did not answer
 	"""
 
 	modem_count, _, _ = listUSBModems(False)
 	if modem_count > 0:
-		status, answer = sendSerialCommandToModem("AT#FWSWITCH?\r\n")
+		own_channel = channel == None
+		if own_channel:
+			channel, _ = openModemATChannel()
+			if channel == None:
+				return None
+
+		try:
+			status, answer = channel.sendCommand("AT#FWSWITCH?", 1)
+		finally:
+			if own_channel:
+				channel.close()
 
-		if status and "OK" in answer:
+		if not status:
+			return None
+		if "OK" in answer:
 			return True
 
 	return False
 
-def configureTechnologyPreference(bus, technologies, verbose = False):
+# Persistent cache of the identity of the modem (see getModemIdentity)
+MODEM_IDENTITY_CACHE_FILE_PATH = "/media/persistent/system/modem_identity.json"
+
+def __getModemUSBKey(modem=None):
+	""" Return the key of the USB modem currently mounted ("vid:pid serial"), None when there is not a single modem
+	"""
+	if modem != None:
+		return "%s %s" % (modem.VidPid, modem.Serial) if modem.UsbPath != None else None
+	devices = lib_usb.listRegisteredUSBDevices()
+	modems = [device for supported_modem in lib_usb.findSupportedDevices(__supported_modems, devices) for device in devices[supported_modem.VidPid]]
+	if len(modems) != 1:
+		return None
+	return "%s %s" % (modems[0].VidPid, modems[0].Serial)
+
+def __collectModemIdentityViaDBus(bus, modem=None):
+	session = getModemSession(bus, modem)
+	modem_path, _ = session.getModemPath()
+	if modem_path == None:
+		return None
+	try:
+		properties = __getProperties(session, 'org.ofono.Modem')
+		identity = { "model": str(properties.get("Model", "")), "imei": str(properties.get("Serial", "")), "firmware": str(properties.get("Revision", "")) }
+	except dbus.DBusException as e:
+		session.invalidate()
+		return None
+	#LE910-EU for Europe, LE910-NA for North America
+	identity["north_america"] = "NA" in identity["model"]
+	identity["provider_mode"] = getProviderMode(bus, modem=modem) if identity["north_america"] else None
+	return identity
+
+def __collectModemIdentityViaSerial(modem=None):
+	channel, _ = openModemATChannel(modem)
+	if channel == None:
+		return None
+	with channel:
+		answers = [channel.sendCommand(command, 1) for command in ("AT+CGMM", "AT+CGSN", "AT+CGMR", "AT#FWSWITCH?")]
+	values = [parseATAnswer(command, answer) for command, (status, answer) in zip(("AT+CGMM", "AT+CGSN", "AT+CGMR"), answers)]
+	if not all([answers[index][0] and "value" in values[index] for index in range(3)]):
+		return None
+	identity = { "model": values[0]["value"], "imei": values[1]["value"], "firmware": values[2]["value"] }
+
+	# only North America modems support firmware switch: "#FWSWITCH: <image>,..." image 0 being AT&T, 1 Verizon
+	status, answer = answers[3]
+	if not status:
+		return None
+	identity["north_america"] = "OK" in answer
+	identity["provider_mode"] = None
+	match = re.search(r"#FWSWITCH:\s*(\d+)", answer)
+	if identity["north_america"] and match:
+		identity["provider_mode"] = "verizon" if match.group(1) == "1" else "att"
+	return identity
+
+def __loadModemIdentities():
+	""" Return the cached identities of the modems, indexed by USB key
+	"""
+	try:
+		with open(MODEM_IDENTITY_CACHE_FILE_PATH, "r") as identity_file:
+			identities = json.load(identity_file)
+	except Exception:
+		return {}
+	# the cache of a single modem is the identity itself
+	if "usb" in identities:
+		return { identities["usb"]: identities }
+	return identities
+
+def __saveModemIdentity(identity):
+	# identities of the modems not mounted anymore are dropped
+	devices = lib_usb.listRegisteredUSBDevices()
+	mounted = ["%s %s" % (device.VidPid, device.Serial) for supported_modem in lib_usb.findSupportedDevices(__supported_modems, devices) for device in devices[supported_modem.VidPid]]
+	identities = dict([(usb_key, other) for usb_key, other in __loadModemIdentities().items() if usb_key in mounted])
+	identities[identity["usb"]] = identity
+	__writeModemIdentities(identities)
+
+def __writeModemIdentities(identities):
+	# the cache of a single modem is kept as the identity itself
+	if len(identities) == 1:
+		identities = list(identities.values())[0]
+	try:
+		# the cache is replaced at once so that readers never get a partial file
+		temporary_file_path = MODEM_IDENTITY_CACHE_FILE_PATH + ".tmp"
+		with open(temporary_file_path, "w") as identity_file:
+			json.dump(identities, identity_file)
+		os.replace(temporary_file_path, MODEM_IDENTITY_CACHE_FILE_PATH)
+		lib_system.sync()
+	except Exception as e:
+		logger.warning("Failed to save modem identity: %s" % (e))
+
+def getModemIdentity(bus=None, refresh=False, modem=None):
+	""" Return the identity of the USB modem currently mounted (of modem, when given): dict { "usb": "vid:pid serial",
+	"model": "LE910-EU V2", "imei", "firmware", "north_america": bool, "provider_mode": "att"|"verizon"|None }.
+	The identity is kept in a persistent cache until another USB modem is mounted: the modem is only queried on the first
+	call for a modem (or with refresh), via ofono when bus is given, with AT commands otherwise. The identity of a modem
+	without USB serial number is never cached: it cannot be told apart from another modem of the same model.
+	return None when there is not a single modem (and no modem is given) or when it did not answer
+	"""
+	usb_key = __getModemUSBKey(modem)
+	if usb_key == None:
+		return None
+	# the key is "vid:pid serial"
+	cacheable = len(usb_key.split(" ", 1)[1]) > 0
+
+	if cacheable and not refresh:
+		identity = __loadModemIdentities().get(usb_key)
+		if identity != None:
+			return identity
+
+	identity = __collectModemIdentityViaDBus(bus, modem) if bus != None else __collectModemIdentityViaSerial(modem)
+	if identity == None:
+		return None
+	identity["usb"] = usb_key
+	if cacheable:
+		__saveModemIdentity(identity)
+	return identity
+
+def __invalidateModemIdentity(modem=None):
+	""" Drop the cached identity of the modem (of modem, when given), e.g. after a firmware switch changing the provider
+	mode and the firmware. The identities of all the modems are dropped when the modem cannot be told apart
+	"""
+	usb_key = __getModemUSBKey(modem)
+	identities = __loadModemIdentities()
+	if usb_key != None and usb_key in identities and len(identities) > 1:
+		del identities[usb_key]
+		__writeModemIdentities(identities)
+		return
+	try:
+		os.remove(MODEM_IDENTITY_CACHE_FILE_PATH)
+	except OSError:
+		pass
+
+def configureTechnologyPreference(bus, technologies, verbose = False, policy=None, modem=None):
 	"""
 	Configure what cellular network technologies the modem should use.
 	Possible values for the parameter "technologies" are:
@@ -1393,20 +3218,23 @@ def configureTechnologyPreference(bus, technologies, verbose = False):
 	This function should be called only when a SIM card is detected in the modem.
 	Therefore, one must ensure that this condition fulfilled before calling it.
 	"""
+	return __callWithPolicy(policy, __configureTechnologyPreference, bus, technologies, verbose, modem)
 
+def __configureTechnologyPreference(bus, technologies, verbose = False, modem=None):
 	success = False
 
-	modems, message = __getModemsFromDBus(bus)
-	if modems != None:
-		modem_path = modems[0][0]
+	session = getModemSession(bus, modem)
+	modem_path, message = session.getModemPath()
+	if modem_path != None:
 
 		try:
-			radiosettings = dbus.Interface(bus.get_object('org.ofono', modem_path), 'org.ofono.RadioSettings')
+			radiosettings = session.getInterface('org.ofono.RadioSettings')
 			radiosettings.SetProperty("TechnologyPreference", technologies);
 
 			message = "Cellular technology preferences set to '%s'" % (technologies)
 			success = True
 		except dbus.exceptions.DBusException as e:
+			session.invalidate()
 			if e.get_dbus_name() == "org.ofono.Error.InvalidArguments":
 				message = "'%s' is not a valid cellular technology name" % (technologies)
 			else:
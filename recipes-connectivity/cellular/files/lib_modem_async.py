@@ -0,0 +1,369 @@
+#!/usr/bin/python3
+
+#########################################################################
+'''
+asyncio flavour of lib_modem.
+
+DBus methods are called with reply handlers instead of blocking: replies are dispatched by the GObject main loop
+of lib_modem (see lib_modem.startSignalLoop) and handed over to the asyncio event loop. Independent queries can
+therefore be gathered and run concurrently, and be cancelled (e.g. by asyncio.wait_for) without waiting for ofono.
+
+Functions return the same tuples and messages as their lib_modem counterparts, e.g.
+	loop = asyncio.get_event_loop()
+	(sim_present, message), (pin_status, message) = loop.run_until_complete(asyncio.gather(
+		lib_modem_async.isSimPresent(bus), lib_modem_async.getPinStatus(bus)))
+'''
+#########################################################################
+
+import asyncio
+import dbus
+import json
+import logging
+import lib_modem
+
+logger = logging.getLogger(__name__)
+# Add default empty logger to let the user of the library use it without logger defined
+logger.addHandler(logging.NullHandler())
+
+# Timeout (seconds) of a DBus call, same as the default of the DBus library
+DBUS_CALL_TIMEOUT = 25
+
+# Timeout (seconds) of GetProperties on one interface when enumerating modems
+ENUMERATION_INTERFACE_TIMEOUT = 3
+
+def __resolve(future, result):
+	if not future.done():
+		future.set_result(result)
+
+def __reject(future, exception):
+	if not future.done():
+		future.set_exception(exception)
+
+def callMethod(method, *args, timeout=DBUS_CALL_TIMEOUT):
+	"""Call a method of a DBus interface without blocking. Return an asyncio future resolved with its answer
+	(None when the method returns nothing, a tuple when it returns several values) or with its DBus exception
+	The future may be cancelled: the answer of the method is then ignored
+	"""
+	loop = asyncio.get_event_loop()
+	future = asyncio.Future(loop=loop)
+
+	# reply and error handlers are called in the thread of the GObject main loop
+	def reply_handler(*values):
+		result = None
+		if len(values) == 1:
+			result = values[0]
+		elif len(values) > 1:
+			result = values
+		loop.call_soon_threadsafe(__resolve, future, result)
+
+	def error_handler(exception):
+		loop.call_soon_threadsafe(__reject, future, exception)
+
+	lib_modem.startSignalLoop()
+	method(*args, reply_handler=reply_handler, error_handler=error_handler, timeout=timeout)
+	return future
+
+async def getModemPath(bus, timeout=DBUS_CALL_TIMEOUT, modem=None):
+	"""return tuple (path of the modem or None, message), from the ModemSession of lib_modem when already resolved.
+	The modem is the first one found on DBus when modem (lib_modem.ModemHandle) is not given
+	"""
+	session = lib_modem.getModemSession(bus, modem)
+	modem_path = session.getCachedModemPath()
+	if modem_path != None:
+		return str(modem_path), "1 modem(s) found on DBus"
+
+	try:
+		modems = await callMethod(session.getInterface('org.ofono.Manager', '/').GetModems, timeout=timeout)
+	except dbus.DBusException as e:
+		session.invalidate()
+		return None, "DBus exception while getting modems on DBus:%s" % (e)
+	modem_path, message = session.updateModems(modems)
+	return (str(modem_path) if modem_path != None else None), message
+
+async def getProperties(bus, interface_name, path=None, timeout=DBUS_CALL_TIMEOUT, modem=None):
+	"""return properties of an ofono interface (of the modem by default). DBus exceptions are raised to the caller
+	"""
+	session = lib_modem.getModemSession(bus, modem)
+	return await callMethod(session.getInterface(interface_name, path).GetProperties, timeout=timeout)
+
+async def __evaluate(bus, default_status, action, evaluator, *interface_names, timeout=DBUS_CALL_TIMEOUT, modem=None):
+	"""read properties of interface_names concurrently and return evaluator(properties...), a tuple (status, message)
+	action names what is evaluated in messages of exceptions
+	"""
+	modem_path, message = await getModemPath(bus, timeout, modem)
+	if modem_path == None:
+		return default_status, message
+
+	try:
+		properties = await asyncio.gather(*[getProperties(bus, interface_name, modem_path, timeout, modem) for interface_name in interface_names])
+		return evaluator(*properties)
+	except dbus.DBusException as e:
+		lib_modem.getModemSession(bus, modem).invalidate()
+		return default_status, "DBus exception while %s:%s" % (action, e)
+	except KeyError as e:
+		return default_status, "KeyError exception: %s not present on Dbus" % (e)
+	except Exception as e:
+		return default_status, "Generic exception while %s:%s" % (action, e)
+
+async def isModemOnDBus(bus, timeout=DBUS_CALL_TIMEOUT, modem=None):
+	modem_path, message = await getModemPath(bus, timeout, modem)
+	return modem_path != None, message
+
+async def isSimPresent(bus, timeout=DBUS_CALL_TIMEOUT, modem=None):
+	return await __evaluate(bus, False, "checking presence of Sim card", lib_modem._evaluateSimPresent,
+		'org.ofono.SimManager', timeout=timeout, modem=modem)
+
+async def getPinStatus(bus, timeout=DBUS_CALL_TIMEOUT, modem=None):
+	return await __evaluate(bus, lib_modem.PinStatus.Unknown, "getting Pin status", lib_modem._evaluatePinStatus,
+		'org.ofono.SimManager', timeout=timeout, modem=modem)
+
+async def getServiceProviderName(bus, timeout=DBUS_CALL_TIMEOUT, modem=None):
+	def evaluator(sim_properties):
+		service_provider_name = lib_modem.dbus2py(sim_properties['ServiceProviderName'])
+		return service_provider_name, "Service Provider Name is \'%s\'" % (service_provider_name)
+	return await __evaluate(bus, "", "getting Service Provider Name", evaluator, 'org.ofono.SimManager', timeout=timeout, modem=modem)
+
+class _ConnectionManagerPropertiesNeeded(Exception):
+	pass
+
+def __requireConnectionManagerProperties():
+	raise _ConnectionManagerPropertiesNeeded()
+
+async def isCellularNetworkRegistered(bus, timeout=DBUS_CALL_TIMEOUT, modem=None):
+	modem_path, message = await getModemPath(bus, timeout, modem)
+	if modem_path == None:
+		return False, message
+
+	try:
+		network_registration_properties = await getProperties(bus, 'org.ofono.NetworkRegistration', modem_path, timeout, modem)
+		try:
+			return lib_modem._evaluateCellularNetworkRegistered(network_registration_properties, __requireConnectionManagerProperties)
+		except _ConnectionManagerPropertiesNeeded:
+			# like lib_modem, ConnectionManager properties are only read when the modem is not registered: they are
+			# needed when it is registered via native LTE
+			connection_manager_properties = await getProperties(bus, 'org.ofono.ConnectionManager', modem_path, timeout, modem)
+			return lib_modem._evaluateCellularNetworkRegistered(network_registration_properties, lambda: connection_manager_properties)
+	except dbus.DBusException as e:
+		lib_modem.getModemSession(bus, modem).invalidate()
+		return False, "DBus exception while checking for network resgistration:%s" % (e)
+	except KeyError as e:
+		return False, "KeyError exception: %s not present on Dbus" % (e)
+	except Exception as e:
+		return False, "Generic exception while checking for network resgistration:%s" % (e)
+
+async def isDataNetworkRegistered(bus, timeout=DBUS_CALL_TIMEOUT, modem=None):
+	return await __evaluate(bus, False, "checking for data network resgistration", lib_modem._evaluateDataNetworkRegistered,
+		'org.ofono.ConnectionManager', timeout=timeout, modem=modem)
+
+async def isRoamingAllowed(bus, timeout=DBUS_CALL_TIMEOUT, modem=None):
+	return await __evaluate(bus, False, "reading Roaming allowed status", lib_modem._evaluateRoamingAllowed,
+		'org.ofono.ConnectionManager', timeout=timeout, modem=modem)
+
+async def isInternetContextActive(bus, timeout=DBUS_CALL_TIMEOUT, modem=None):
+	modem_path, message = await getModemPath(bus, timeout, modem)
+	if modem_path == None:
+		return False, message
+
+	session = lib_modem.getModemSession(bus, modem)
+	try:
+		contexts = await callMethod(session.getInterface('org.ofono.ConnectionManager', modem_path).GetContexts, timeout=timeout)
+		return lib_modem._evaluateInternetContextActive(contexts)
+	except dbus.DBusException as e:
+		session.invalidate()
+		return False, "DBus exception while checking Internet context status:%s" % (e)
+	except KeyError as e:
+		return False, "KeyError exception: %s not present on Dbus" % (e)
+	except Exception as e:
+		return False, "Generic exception while checking Internet context status:%s" % (e)
+
+async def getSignalStrength(bus, timeout=DBUS_CALL_TIMEOUT, modem=None):
+	"""return tuple (strength, message, tech) like lib_modem.getSignalStrength()
+	"""
+	# it is mandatory to be registered to a network to have access to signal strength
+	network_registered, message = await isCellularNetworkRegistered(bus, timeout, modem)
+	if not network_registered:
+		return -1, message, 'none'
+
+	session = lib_modem.getModemSession(bus, modem)
+	try:
+		rf_status = await callMethod(session.getInterface('org.ofono.TelitDataNetwork').GetRFStatus, timeout=timeout)
+		rssi, rsrp, tech = lib_modem._evaluateRFStatus(rf_status)
+		# if the current tech used is 4G we use for strength the rsrp
+		# else we will use the rssi
+		return (rsrp if tech == "4G" else rssi), message, tech
+	except dbus.DBusException as e:
+		session.invalidate()
+		return -1, "DBus exception while getting signal strength:%s" % (e), 'none'
+	except Exception as e:
+		return -1, "Generic exception while getting signal strength:%s" % (e), 'none'
+
+async def setRoamingAllowed(bus, roamingAllowed=True, timeout=DBUS_CALL_TIMEOUT, modem=None):
+	"""Enable/disable data roaming, see lib_modem.setRoamingAllowed(). return tuple (status, message)
+	"""
+	modem_path, message = await getModemPath(bus, timeout, modem)
+	if modem_path == None:
+		return False, message
+
+	session = lib_modem.getModemSession(bus, modem)
+	try:
+		await callMethod(session.getInterface('org.ofono.ConnectionManager', modem_path).SetProperty, "RoamingAllowed", dbus.Boolean(roamingAllowed), timeout=timeout)
+		return True, "Roaming is allowed" if roamingAllowed else "Roaming is not allowed"
+	except dbus.DBusException as e:
+		session.invalidate()
+		return False, "DBus exception while setting RoamingAllowed:%s" % (e)
+	except Exception as e:
+		return False, "Generic exception while setting RoamingAllowed:%s" % (e)
+
+async def disablePin(bus, pin, timeout=DBUS_CALL_TIMEOUT, modem=None):
+	"""Enter a Pin and disable it, see lib_modem.disablePin(). return tuple (DisablePinAnswer, message)
+	"""
+	modem_path, message = await getModemPath(bus, timeout, modem)
+	if modem_path == None:
+		return lib_modem.DisablePinAnswer.Unknown, message
+
+	session = lib_modem.getModemSession(bus, modem)
+	try:
+		sim_manager = session.getInterface('org.ofono.SimManager', modem_path)
+		await callMethod(sim_manager.EnterPin, "pin", pin, timeout=timeout)
+		await callMethod(sim_manager.UnlockPin, "pin", pin, timeout=timeout)
+		return lib_modem.DisablePinAnswer.Success, "Pin entered and disabled"
+	except dbus.DBusException as e:
+		#In case of wrong pin e is: "org.ofono.Error.Failed: Operation failed"
+		if str(e) == "org.ofono.Error.Failed: Operation failed":
+			return lib_modem.DisablePinAnswer.WrongPin, "Wrong Pin"
+		return lib_modem.DisablePinAnswer.Unknown, "DBus exception while entering/disabling pin:%s" % (e)
+	except Exception as e:
+		return lib_modem.DisablePinAnswer.Unknown, "Generic exception while entering/disabling pin:%s" % (e)
+
+async def getModemSnapshot(bus, timeout=DBUS_CALL_TIMEOUT, modem=None):
+	"""Same as lib_modem.getModemSnapshot() but the properties of all interfaces and the contexts are read concurrently
+	"""
+	snapshot = lib_modem.ModemSnapshot()
+	session = lib_modem.getModemSession(bus, modem)
+
+	snapshot.dbus_calls += 1
+	try:
+		modems = await callMethod(session.getInterface('org.ofono.Manager', '/').GetModems, timeout=timeout)
+	except dbus.DBusException as e:
+		session.invalidate()
+		snapshot.message = "DBus exception while getting modems on DBus:%s" % (e)
+		return snapshot
+	modem_path, snapshot.message = session.updateModems(modems)
+	if modem_path == None:
+		return snapshot
+	modem_properties = next((properties for path, properties in modems if path == modem_path), None)
+	if modem_properties == None:
+		snapshot.message = "Modem %s not found among the modems on DBus" % (modem_path)
+		return snapshot
+	snapshot.modem_path = str(modem_path)
+	snapshot.properties['org.ofono.Modem'] = modem_properties
+	interfaces = modem_properties.get('Interfaces', [])
+
+	async def read(key, interface_name, method_name):
+		if interface_name not in interfaces:
+			snapshot.errors[key] = "%s is not available" % (interface_name)
+			return None
+		try:
+			snapshot.dbus_calls += 1
+			return await callMethod(getattr(session.getInterface(interface_name, modem_path), method_name), timeout=timeout)
+		except dbus.DBusException as e:
+			session.invalidate()
+			snapshot.errors[key] = "DBus exception while reading %s:%s" % (interface_name, e)
+		except Exception as e:
+			snapshot.errors[key] = "Generic exception while reading %s:%s" % (interface_name, e)
+		return None
+
+	interface_names = ['org.ofono.SimManager', 'org.ofono.NetworkRegistration', 'org.ofono.ConnectionManager']
+	results = await asyncio.gather(
+		read('contexts', 'org.ofono.ConnectionManager', 'GetContexts'),
+		*[read(interface_name, interface_name, 'GetProperties') for interface_name in interface_names])
+	snapshot.contexts = results[0]
+	for interface_name, properties in zip(interface_names, results[1:]):
+		if properties != None:
+			snapshot.properties[interface_name] = properties
+
+	# it is mandatory to be registered to a network to have access to the RF status
+	if snapshot.isCellularNetworkRegistered()[0]:
+		snapshot.rf_status = await read('rf_status', 'org.ofono.TelitDataNetwork', 'GetRFStatus')
+
+	return snapshot
+
+async def enumerateModems(bus, interface_timeout=ENUMERATION_INTERFACE_TIMEOUT):
+	"""Read all information accessible from ofono DBus regarding modems and their interfaces. GetProperties is called
+	on all interfaces concurrently (except the slow Call* interfaces), an interface not answering within interface_timeout
+	is reported but does not delay the others. Return a dict (JSON serializable):
+		{ "modems": { path: { "properties": {...}, "interfaces": { interface: {...} } } }, "errors": { name: message } }
+	"""
+	document = { "modems": {}, "errors": {} }
+	session = lib_modem.getModemSession(bus)
+
+	try:
+		modems = await callMethod(session.getInterface('org.ofono.Manager', '/').GetModems, timeout=interface_timeout)
+	except dbus.DBusException as e:
+		session.invalidate()
+		document["errors"]["org.ofono.Manager"] = "DBus exception while getting modems on DBus:%s" % (e)
+		return document
+
+	async def read(path, interface_name):
+		try:
+			properties = await asyncio.wait_for(callMethod(session.getInterface(interface_name, path).GetProperties,
+				timeout=interface_timeout), interface_timeout)
+			return lib_modem.dbus2py(properties)
+		except asyncio.TimeoutError:
+			document["errors"]["%s %s" % (path, interface_name)] = "no answer within %d seconds" % (interface_timeout)
+		except dbus.DBusException as e:
+			document["errors"]["%s %s" % (path, interface_name)] = "DBus exception:%s" % (e)
+		except Exception as e:
+			document["errors"]["%s %s" % (path, interface_name)] = "Generic exception:%s" % (e)
+		return None
+
+	requests = []
+	for path, properties in modems:
+		path = str(path)
+		modem = { "properties": lib_modem.dbus2py(properties), "interfaces": {} }
+		document["modems"][path] = modem
+		for interface_name in modem["properties"].get("Interfaces", []):
+			# Skip requesting of properties for (slow) Call* interfaces
+			if 'Call' in interface_name:
+				continue
+			requests.append((modem, interface_name, read(path, interface_name)))
+
+	results = await asyncio.gather(*[request for modem, interface_name, request in requests])
+	for (modem, interface_name, request), properties in zip(requests, results):
+		if properties != None:
+			modem["interfaces"][interface_name] = properties
+
+	return document
+
+def dumpModems(bus, file_path=None, interface_timeout=ENUMERATION_INTERFACE_TIMEOUT):
+	"""Enumerate modems (see enumerateModems()), log the resulting JSON document and write it to file_path when given.
+	Return the document
+	"""
+	logger.info("")
+	logger.info("-Enumerate modems")
+
+	document = run(enumerateModems(bus, interface_timeout))
+	content = json.dumps(document, indent=2, sort_keys=True)
+	logger.info(content)
+
+	if file_path != None:
+		try:
+			with open(file_path, "w") as enumeration_file:
+				enumeration_file.write(content + "\n")
+		except OSError as e:
+			logger.info("Failed to write modems enumeration to %s: %s" % (file_path, e))
+	return document
+
+def run(coroutine, timeout=None):
+	"""Run a coroutine of this library from synchronous code and return its result.
+	With a timeout, the coroutine is cancelled when it is not done in time and asyncio.TimeoutError is raised
+	"""
+	try:
+		loop = asyncio.get_event_loop()
+	except RuntimeError:
+		# only the main thread has an event loop by default, e.g. each modem is supervised in its own thread
+		loop = asyncio.new_event_loop()
+		asyncio.set_event_loop(loop)
+	if timeout != None:
+		coroutine = asyncio.wait_for(coroutine, timeout)
+	return loop.run_until_complete(coroutine)
@@ -0,0 +1,53 @@
+#!/usr/bin/python3
+
+#########################################################################
+'''
+Definitions shared by the cellular scripts: USB modems supported by the system and diagnostic codes of the modem.
+It has no dependency (DBus, GObject...) so that processes not talking to ofono can use it, e.g. usb_device_registry.py.
+lib_modem re-exports them.
+'''
+#########################################################################
+
+from enum import Enum
+from collections import namedtuple
+
+# all stuff containing information on USB modems
+USBModemInfo = namedtuple("USBModemInfo", "Name VidPid")
+
+"""List of all USB modems supported by the system. Add here any further amazing modem.
+
+On USBCFG the ProductId of a telit modem can change.
+Per default/factory-config, telit modems will report as productId 0x0036 (ACM + NCM).
+USBCFG value of '2' will be set automatically for Multitech modems by ofono, which
+will put the modem into 'enterprise'-/acm-only mode which reports as 0x0035.
+USBCFG value of '4' actually sets the Modems into ACM + NCM + Suspend mode, which
+reports as 0x0037.
+"""
+supported_modems = [
+	USBModemInfo("Multitech/Telit", "1bc7:0035"),
+	USBModemInfo("Multitech/Telit", "1bc7:0036"),
+	USBModemInfo("Multitech/Telit", "1bc7:0037"),
+]
+
+def isSupportedModem(vid_pid):
+	""" Return True when the USB device identified by vid_pid (e.g. "1bc7:0036") is a supported modem
+	"""
+	return vid_pid in [supported_modem.VidPid for supported_modem in supported_modems]
+
+class ModemDiagnosticCode(Enum):
+	WellConfigured = 0
+	ModemIsAbsent = 10
+	SeveralModemsArePresent = 11
+	OfonodNotRunning = 15
+	ModemIsNotRecognized = 20
+	SimIsAbsent = 25
+	SimIsPinLocked = 30
+	SimIsPukLocked = 35
+	SimError = 40
+	NetworkIsUnregistered = 45
+	GPRSNetworkNotRegistered = 50
+	APNConnectionFailed = 55
+	InternetContextFailed = 60
+	ContactServerFailed = 65
+	SwitchFirmwareFailed = 70
+	ConfigureTechnologyFailed = 75
@@ -1,5 +1,6 @@
 #!/usr/bin/python3
 import lib_cellular_stats
+import lib_usb
 import logging
 import sys
 
@@ -10,4 +11,6 @@ if __name__ == '__main__':
 	logger.addHandler(logging.StreamHandler(sys.stdout))
 	logger.setLevel(logging.INFO)
 
-	lib_cellular_stats.logModemDetection()
+	# the detection is already logged by usb_device_registry.py when it runs
+	if lib_usb.loadRegistry() == None:
+		lib_cellular_stats.logModemDetection()
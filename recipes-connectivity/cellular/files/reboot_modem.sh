@@ -1,6 +1,7 @@
 #!/bin/sh
 # perform hard reboot on modem connected to external USB box
 # it acts on pin "Enable" of chipset reponsible for power management of external USB box
+# it waits 10 s for the modem to come back, unless called with "--no-wait" (the caller waits for the modem itself)
 
 echo 101 > /sys/class/gpio/export
 echo out > /sys/class/gpio/gpio101/direction
@@ -11,6 +12,8 @@ sleep 1
 echo 1 > /sys/class/gpio/gpio101/value
 echo 101 > /sys/class/gpio/unexport
 
-sleep 10
+if [ "$1" != "--no-wait" ]; then
+	sleep 10
+fi
 
 exit 0
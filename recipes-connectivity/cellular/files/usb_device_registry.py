@@ -0,0 +1,116 @@
+#!/usr/bin/python3
+
+#########################################################################
+'''
+The role of this script is to keep the registry of the USB devices (modems, Wi-Fi dongles...) up to date with the
+attach and detach events sent by the kernel on a netlink socket. The registry is read through lib_usb (see
+lib_usb.loadRegistry) instead of scanning the USB devices, and the detection of supported modems is logged in
+cellular stats
+'''
+#########################################################################
+
+import os
+import sys
+import json
+import signal
+import logging
+from datetime import datetime
+import lib_usb
+import lib_modem_definitions
+import lib_cellular_stats
+
+# number of attach/detach events kept in the registry
+MAX_REGISTRY_EVENTS = 50
+
+class USBDeviceRegistry(object):
+	"""Registry of the USB devices attached to the system, indexed by kernel device path (e.g. "/devices/soc0/.../1-1"),
+	saved to lib_usb.USB_REGISTRY_FILE_PATH on each change
+	"""
+
+	def __init__(self):
+		self.devices = {}
+		self.events = []
+
+	def load(self):
+		"""register the devices already attached
+		"""
+		date = datetime.now().strftime(lib_cellular_stats.date_format)
+		for vid_pid, devices in lib_usb.listUSBDevices().items():
+			for device in devices:
+				device_path = os.path.realpath(device.Path)[len("/sys"):]
+				self.devices[device_path] = { "vid_pid": vid_pid, "serial": device.Serial, "attached": date }
+		self.save()
+
+	def save(self):
+		registry = { "pid": os.getpid(), "devices": self.devices, "events": self.events }
+		# the registry is replaced at once so that readers never get a partial file
+		temporary_file_path = lib_usb.USB_REGISTRY_FILE_PATH + ".tmp"
+		with open(temporary_file_path, "w") as registry_file:
+			json.dump(registry, registry_file, indent=1)
+		os.replace(temporary_file_path, lib_usb.USB_REGISTRY_FILE_PATH)
+
+	def remove(self):
+		try:
+			os.remove(lib_usb.USB_REGISTRY_FILE_PATH)
+		except OSError:
+			pass
+
+	def processUevent(self, properties):
+		"""update the registry with a kernel uevent (see lib_usb.parseUevent), return the event registered, None when the
+		uevent is not the attach/detach of an USB device
+		"""
+		if properties.get("SUBSYSTEM") != "usb" or properties.get("DEVTYPE") != "usb_device":
+			return None
+
+		action = properties.get("ACTION")
+		device_path = properties.get("DEVPATH")
+		date = datetime.now().strftime(lib_cellular_stats.date_format)
+		if action == "add":
+			# PRODUCT is "vid/pid/bcdDevice" in hexadecimal without leading zeros, e.g. "1bc7/36/318"
+			vid, pid = properties.get("PRODUCT", "0/0").split("/")[:2]
+			device = { "vid_pid": "%04x:%04x" % (int(vid, 16), int(pid, 16)), "serial": "", "attached": date }
+			try:
+				with open("/sys" + device_path + "/serial") as serial_file:
+					device["serial"] = serial_file.read().strip()
+			except (IOError, OSError):
+				pass
+			self.devices[device_path] = device
+		elif action == "remove" and device_path in self.devices:
+			device = self.devices.pop(device_path)
+		else:
+			return None
+
+		event = { "action": action, "vid_pid": device["vid_pid"], "serial": device["serial"], "date": date }
+		self.events = (self.events + [event])[-MAX_REGISTRY_EVENTS:]
+		self.save()
+		return event
+
+def exitGracefully(signum, frame):
+	registry.remove()
+	exit(0)
+
+if __name__ == '__main__':
+
+	# Redirect logging messages to stdout
+	logger = logging.getLogger(__name__)
+	logger.addHandler(logging.StreamHandler(sys.stdout))
+	logger.setLevel(logging.INFO)
+
+	logger.info("Start USB device registry")
+
+	registry = USBDeviceRegistry()
+	signal.signal(signal.SIGINT, exitGracefully)
+	signal.signal(signal.SIGTERM, exitGracefully)
+
+	# the socket is bound before reading the attached devices so that no event is missed in between
+	uevent_socket = lib_usb.openUeventSocket()
+	registry.load()
+	logger.info("%d USB device(s) attached" % (len(registry.devices)))
+
+	while True:
+		event = registry.processUevent(lib_usb.readUevent(uevent_socket))
+		if event == None:
+			continue
+		logger.info("USB device %s (serial \"%s\"): %s" % (event["vid_pid"], event["serial"], "attached" if event["action"] == "add" else "detached"))
+		if event["action"] == "add" and lib_modem_definitions.isSupportedModem(event["vid_pid"]):
+			lib_cellular_stats.logModemDetection()
@@ -0,0 +1,176 @@
+#!/usr/bin/python3
+#
+# Micro-benchmark of the DBus to Python conversion of lib_modem (dbus2py).
+# It is a development tool, not installed on the controller image. It must be run on a system providing
+# dbus-python and the other imports of lib_modem (e.g. on the controller itself):
+#     python3 benchmark_dbus2py.py [iterations]
+#
+# Payloads are copies of values returned by ofono on a controller equipped with a Telit LE910 modem:
+# the answer of GetModems, of GetProperties on each interface listed by enumerateModems and of GetRFStatus.
+
+import os
+import sys
+import timeit
+import dbus
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "files"))
+import lib_modem
+
+dbus2py = lib_modem.dbus2py
+
+def strings(values):
+	return dbus.Array([dbus.String(v) for v in values], signature="s")
+
+def properties(values):
+	return dbus.Dictionary(values, signature="sv")
+
+MODEM_PATH = dbus.ObjectPath("/telit_0")
+
+GET_MODEMS = dbus.Array([
+	dbus.Struct((MODEM_PATH, properties({
+		dbus.String("Online"): dbus.Boolean(True),
+		dbus.String("Powered"): dbus.Boolean(True),
+		dbus.String("Lockdown"): dbus.Boolean(False),
+		dbus.String("Emergency"): dbus.Boolean(False),
+		dbus.String("Manufacturer"): dbus.String("Telit"),
+		dbus.String("Model"): dbus.String("LE910-EU V2"),
+		dbus.String("Revision"): dbus.String("20.00.403"),
+		dbus.String("Serial"): dbus.String("357164090123456"),
+		dbus.String("Interfaces"): strings(["org.ofono.TelitDataNetwork", "org.ofono.TelitProvider", "org.ofono.ConnectionManager",
+			"org.ofono.NetworkRegistration", "org.ofono.RadioSettings", "org.ofono.SimManager", "org.ofono.CallBarring",
+			"org.ofono.CallSettings", "org.ofono.SupplementaryServices", "org.ofono.MessageManager"]),
+		dbus.String("Features"): strings(["gprs", "net", "rat", "sms", "ussd", "sim"]),
+		dbus.String("Type"): dbus.String("hardware"),
+	})), signature="oa{sv}")
+], signature="(oa{sv})")
+
+SIM_MANAGER = properties({
+	dbus.String("Present"): dbus.Boolean(True),
+	dbus.String("CardIdentifier"): dbus.String("8941120000123456789"),
+	dbus.String("SubscriberIdentity"): dbus.String("228012345678901"),
+	dbus.String("ServiceProviderName"): dbus.String("Swisscom"),
+	dbus.String("MobileCountryCode"): dbus.String("228"),
+	dbus.String("MobileNetworkCode"): dbus.String("01"),
+	dbus.String("MobileNetworkCodeLength"): dbus.Byte(2),
+	dbus.String("SubscriberNumbers"): strings([]),
+	dbus.String("PreferredLanguages"): strings(["de", "fr", "it", "en"]),
+	dbus.String("LockedPins"): strings(["pin"]),
+	dbus.String("PinRequired"): dbus.String("none"),
+	dbus.String("Retries"): dbus.Dictionary({dbus.String("pin"): dbus.Byte(3), dbus.String("puk"): dbus.Byte(10)}, signature="sy"),
+	dbus.String("FixedDialing"): dbus.Boolean(False),
+	dbus.String("BarredDialing"): dbus.Boolean(False),
+	dbus.String("ServiceNumbers"): dbus.Dictionary({dbus.String("Customer care"): dbus.String("0800800800")}, signature="ss"),
+	dbus.String("CardSlotCount"): dbus.UInt32(1),
+	dbus.String("ActiveCardSlot"): dbus.UInt32(1),
+})
+
+NETWORK_REGISTRATION = properties({
+	dbus.String("Mode"): dbus.String("auto"),
+	dbus.String("Status"): dbus.String("registered"),
+	dbus.String("LocationAreaCode"): dbus.UInt16(2101),
+	dbus.String("CellId"): dbus.UInt32(23456789),
+	dbus.String("MobileCountryCode"): dbus.String("228"),
+	dbus.String("MobileNetworkCode"): dbus.String("01"),
+	dbus.String("Technology"): dbus.String("lte"),
+	dbus.String("Name"): dbus.String("Swisscom"),
+	dbus.String("Strength"): dbus.Byte(67),
+})
+
+CONNECTION_MANAGER = properties({
+	dbus.String("Attached"): dbus.Boolean(True),
+	dbus.String("Bearer"): dbus.String("lte"),
+	dbus.String("Suspended"): dbus.Boolean(False),
+	dbus.String("RoamingAllowed"): dbus.Boolean(True),
+	dbus.String("Powered"): dbus.Boolean(True),
+})
+
+CONTEXTS = dbus.Array([
+	dbus.Struct((dbus.ObjectPath("/telit_0/context1"), properties({
+		dbus.String("Active"): dbus.Boolean(True),
+		dbus.String("Type"): dbus.String("internet"),
+		dbus.String("Protocol"): dbus.String("ip"),
+		dbus.String("AccessPointName"): dbus.String("gprs.swisscom.ch"),
+		dbus.String("Username"): dbus.String(""),
+		dbus.String("Password"): dbus.String(""),
+		dbus.String("AuthenticationMethod"): dbus.String("chap"),
+		dbus.String("Name"): dbus.String("Internet"),
+		dbus.String("Settings"): properties({
+			dbus.String("Interface"): dbus.String("ppp0"),
+			dbus.String("Method"): dbus.String("static"),
+			dbus.String("Address"): dbus.String("10.123.45.67"),
+			dbus.String("Netmask"): dbus.String("255.255.255.255"),
+			dbus.String("DomainNameServers"): strings(["193.247.204.1", "193.247.204.2"]),
+		}),
+		dbus.String("IPv6.Settings"): properties({}),
+	})), signature="oa{sv}")
+], signature="(oa{sv})")
+
+RF_STATUS = properties({
+	dbus.String("Tech"): dbus.String("4G"),
+	dbus.String("RSSI"): dbus.Int32(-67),
+	dbus.String("RSRP"): dbus.Int32(-97),
+	dbus.String("RSRQ"): dbus.Int32(-11),
+	dbus.String("SINR"): dbus.Double(12.4),
+	dbus.String("Band"): dbus.String("B3"),
+	dbus.String("Channel"): dbus.UInt32(1300),
+})
+
+ICCID_BYTES = dbus.Array([dbus.Byte(b) for b in b"8941120000123456789"], signature="y")
+
+PAYLOADS = [
+	("GetModems", GET_MODEMS),
+	("SimManager.GetProperties", SIM_MANAGER),
+	("NetworkRegistration.GetProperties", NETWORK_REGISTRATION),
+	("ConnectionManager.GetProperties", CONNECTION_MANAGER),
+	("ConnectionManager.GetContexts", CONTEXTS),
+	("TelitDataNetwork.GetRFStatus", RF_STATUS),
+	("Byte array", ICCID_BYTES),
+]
+
+# Recursive implementation used up to now, kept as reference
+_reference_dbus2py = {
+	dbus.String : str,
+	dbus.UInt32 : int,
+	dbus.Int32 : int,
+	dbus.Int16 : int,
+	dbus.UInt16 : int,
+	dbus.UInt64 : int,
+	dbus.Int64 : int,
+	dbus.Byte : int,
+	dbus.Boolean : bool,
+	dbus.ByteArray : str,
+	dbus.ObjectPath : str
+}
+
+def reference_dbus2py(d):
+	t = type(d)
+	if t in _reference_dbus2py:
+		return _reference_dbus2py[t](d)
+	if t is dbus.Dictionary:
+		return dict([(reference_dbus2py(k), reference_dbus2py(v)) for k, v in list(d.items())])
+	if t is dbus.Array and d.signature == "y":
+		return "".join([chr(b) for b in d])
+	if t is dbus.Array or t is list:
+		return [reference_dbus2py(v) for v in d]
+	if t is dbus.Struct or t is tuple:
+		return tuple([reference_dbus2py(v) for v in d])
+	return d
+
+if __name__ == '__main__':
+	iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+
+	print("%-36s %14s %14s %8s" % ("payload", "reference (us)", "lib_modem (us)", "speedup"))
+	total_reference = 0
+	total_current = 0
+	for name, payload in PAYLOADS:
+		# both implementations must agree, except for the types the reference does not convert (e.g. dbus.Double)
+		if dbus2py(payload) != reference_dbus2py(payload):
+			print("%s: converted values differ" % (name))
+
+		reference = timeit.timeit(lambda: reference_dbus2py(payload), number=iterations) / iterations * 1e6
+		current = timeit.timeit(lambda: dbus2py(payload), number=iterations) / iterations * 1e6
+		total_reference += reference
+		total_current += current
+		print("%-36s %14.1f %14.1f %7.2fx" % (name, reference, current, reference / current))
+
+	print("%-36s %14.1f %14.1f %7.2fx" % ("total", total_reference, total_current, total_reference / total_current))
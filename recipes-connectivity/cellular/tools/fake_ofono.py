@@ -0,0 +1,216 @@
+#!/usr/bin/python3
+#
+# Fake ofono daemon serving a single registered Telit modem with an active Internet context on DBus, to exercise the
+# data path functions of lib_modem (getInternetContextInterface, getDataInterfaceName, isInternetContextActive...)
+# without hardware. It is a development tool, not installed on the controller image:
+#     python3 fake_ofono.py serve [interface]   serve org.ofono on the system bus until Ctrl-C, the context reporting
+#                                               the network interface given ("usb0" by default, "none": inactive context,
+#                                               "nocontext": no context at all, i.e. a modem never configured)
+#     python3 fake_ofono.py check               check the data path functions of lib_modem and the choice of the modems
+#                                               supervised by cellular_data_supervisor against the fake ofono
+# The check starts its own bus (dbus-daemon) and points DBUS_SYSTEM_BUS_ADDRESS to it, the system bus is left alone.
+# It needs the imports of lib_modem (dbus-python, GObject...), e.g. on the controller itself.
+#
+# Only the calls made by lib_modem to read the state of the modem are served (GetModems, GetProperties, GetContexts).
+# A modem with a NCM/ECM data path reports an Ethernet-style interface (e.g. "usb0", "wwan0") configured with DHCP in
+# the "Settings" of its context, a modem with a PPP data path reports "ppp0" with a static configuration.
+
+import os
+import sys
+import time
+import subprocess
+import dbus
+import dbus.service
+import dbus.mainloop.glib
+from gi.repository import GObject
+
+MODEM_PATH = "/telit_0"
+CONTEXT_PATH = MODEM_PATH + "/context1"
+
+def variantDict(properties):
+	return dbus.Dictionary(properties, signature="sv")
+
+def getContextSettings(interface_name):
+	""" Return the "Settings" of the Internet context reported by ofono for a network interface of the data connection
+	"""
+	if interface_name.startswith("ppp"):
+		return variantDict({ "Interface": interface_name, "Method": "static", "Address": "10.64.64.64",
+			"Netmask": "255.255.255.255", "DomainNameServers": dbus.Array(["8.8.8.8"], signature="s") })
+	return variantDict({ "Interface": interface_name, "Method": "dhcp" })
+
+class OfonoManager(dbus.service.Object):
+	@dbus.service.method("org.ofono.Manager", out_signature="a(oa{sv})")
+	def GetModems(self):
+		return [(dbus.ObjectPath(MODEM_PATH), self.modem.properties["org.ofono.Modem"])]
+
+# The interfaces of the modem are served by a single object: each interface is declared by its own class, so that the
+# methods sharing a name (GetProperties) are dispatched by interface
+class ModemInterface(dbus.service.Object):
+	@dbus.service.method("org.ofono.Modem", out_signature="a{sv}")
+	def GetProperties(self):
+		return self.properties["org.ofono.Modem"]
+
+class SimManagerInterface(dbus.service.Object):
+	@dbus.service.method("org.ofono.SimManager", out_signature="a{sv}")
+	def GetProperties(self):
+		return self.properties["org.ofono.SimManager"]
+
+class NetworkRegistrationInterface(dbus.service.Object):
+	@dbus.service.method("org.ofono.NetworkRegistration", out_signature="a{sv}")
+	def GetProperties(self):
+		return self.properties["org.ofono.NetworkRegistration"]
+
+class ConnectionManagerInterface(dbus.service.Object):
+	@dbus.service.method("org.ofono.ConnectionManager", out_signature="a{sv}")
+	def GetProperties(self):
+		return self.properties["org.ofono.ConnectionManager"]
+
+	@dbus.service.method("org.ofono.ConnectionManager", out_signature="a(oa{sv})")
+	def GetContexts(self):
+		if self.context == None:
+			return []
+		return [(dbus.ObjectPath(CONTEXT_PATH), self.context.properties)]
+
+class FakeModem(ModemInterface, SimManagerInterface, NetworkRegistrationInterface, ConnectionManagerInterface):
+	def __init__(self, bus, context):
+		self.context = context
+		self.properties = {
+			"org.ofono.Modem": variantDict({ "Powered": True, "Online": True, "Manufacturer": "Telit",
+				"Model": "LE910-EU V2", "Serial": "357164090123456", "Revision": "20.00.403",
+				"SystemPath": "/sys/devices/soc0/soc/2100000.aips-bus/2184200.usb/ci_hdrc.1/usb1/1-1",
+				"Interfaces": dbus.Array(["org.ofono.SimManager", "org.ofono.NetworkRegistration",
+					"org.ofono.ConnectionManager"], signature="s") }),
+			"org.ofono.SimManager": variantDict({ "Present": True, "PinRequired": "none", "ServiceProviderName": "Swisscom",
+				"MobileCountryCode": "228", "MobileNetworkCode": "01", "SubscriberIdentity": "228012345678901" }),
+			"org.ofono.NetworkRegistration": variantDict({ "Status": "registered", "Name": "Swisscom", "Technology": "lte",
+				"Strength": dbus.Byte(80), "MobileCountryCode": "228", "MobileNetworkCode": "01" }),
+			"org.ofono.ConnectionManager": variantDict({ "Attached": True, "Powered": True, "RoamingAllowed": False,
+				"Bearer": "lte" }),
+		}
+		dbus.service.Object.__init__(self, bus, MODEM_PATH)
+
+class FakeContext(dbus.service.Object):
+	def __init__(self, bus, interface_name):
+		active = interface_name != "none"
+		self.properties = variantDict({ "Active": active, "Type": "internet", "Name": "Internet",
+			"AccessPointName": "gprs.swisscom.ch", "Username": "", "Password": "", "Protocol": "ip",
+			"Settings": getContextSettings(interface_name) if active else variantDict({}) })
+		dbus.service.Object.__init__(self, bus, CONTEXT_PATH)
+
+	@dbus.service.method("org.ofono.ConnectionContext", out_signature="a{sv}")
+	def GetProperties(self):
+		return self.properties
+
+def serve(interface_name):
+	dbus.mainloop.glib.DBusGMainLoop(set_as_default=True)
+	bus = dbus.SystemBus()
+	context = FakeContext(bus, interface_name) if interface_name != "nocontext" else None
+	manager = OfonoManager(bus, "/")
+	manager.modem = FakeModem(bus, context)
+	# the name is requested last: clients waiting for it find all the objects in place
+	name = dbus.service.BusName("org.ofono", bus)
+	print("Fake ofono on %s, context interface: %s, Ctrl-C to stop" % (os.environ.get("DBUS_SYSTEM_BUS_ADDRESS", "system bus"), interface_name))
+	sys.stdout.flush()
+	try:
+		GObject.MainLoop().run()
+	except KeyboardInterrupt:
+		pass
+
+def __importLibModem():
+	sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "files"))
+	import lib_modem
+	return lib_modem
+
+def __importSupervisor():
+	import cellular_data_supervisor
+	return cellular_data_supervisor
+
+def __startFakeOfono(bus, interface_name):
+	fake_ofono = subprocess.Popen([sys.executable, os.path.abspath(__file__), "serve", interface_name], stdout=subprocess.DEVNULL)
+	for attempt in range(50):
+		if bus.name_has_owner("org.ofono"):
+			return fake_ofono
+		time.sleep(0.1)
+	fake_ofono.kill()
+	raise RuntimeError("Fake ofono not on DBus")
+
+def __stopFakeOfono(bus, fake_ofono):
+	fake_ofono.terminate()
+	fake_ofono.wait()
+	while bus.name_has_owner("org.ofono"):
+		time.sleep(0.1)
+
+def check():
+	""" Check the data path functions of lib_modem and the choice of the modems supervised by cellular_data_supervisor
+	against the fake ofono, on a private bus. Return True when all pass
+	"""
+	# the session configuration lets any process own any name
+	dbus_daemon = subprocess.Popen(["dbus-daemon", "--session", "--nofork", "--print-address=1"], stdout=subprocess.PIPE)
+	os.environ["DBUS_SYSTEM_BUS_ADDRESS"] = dbus_daemon.stdout.readline().decode().strip()
+
+	lib_modem = __importLibModem()
+	bus = dbus.SystemBus()
+
+	# (context interface served, expected data interface, expected context status)
+	scenarios = [
+		("usb0", "usb0", True),
+		("wwan0", "wwan0", True),
+		("ppp0", "ppp0", True),
+		("none", lib_modem.CELLULAR_INTERFACE_NAME, False),
+	]
+
+	# the modem served by the fake ofono (found on DBus by its path) and a modem not on DBus
+	cellular_data_supervisor = __importSupervisor()
+	codes = lib_modem.ModemDiagnosticCode
+	on_dbus = lib_modem.ModemHandle(MODEM_PATH, "", "", None)
+	absent = lib_modem.ModemHandle(None, "ABSENT", "1bc7:0036", "/sys/devices/absent")
+	# (context interface served, modem, diagnostic, expected supervised): a modem never configured is left as is, a
+	# modem whose contexts cannot be read is recovered (reset) like before
+	supervision_scenarios = [
+		("usb0", on_dbus, codes.InternetContextFailed, True),
+		("nocontext", on_dbus, codes.InternetContextFailed, False),
+		("nocontext", on_dbus, codes.WellConfigured, True),
+		("nocontext", absent, codes.ModemIsNotRecognized, True),
+	]
+
+	failures = 0
+	try:
+		for served_interface, expected_interface, expected_active in scenarios:
+			fake_ofono = __startFakeOfono(bus, served_interface)
+			try:
+				lib_modem.getModemSession(bus).invalidate()
+				interface_name = lib_modem.getDataInterfaceName(bus)
+				active, message = lib_modem.isInternetContextActive(bus)
+				passed = interface_name == expected_interface and active == expected_active
+			finally:
+				__stopFakeOfono(bus, fake_ofono)
+			failures += 0 if passed else 1
+			print("context interface %-8s %-5s data interface %s, %s" % (served_interface, "ok" if passed else "FAIL", interface_name, message))
+
+		for served_interface, modem, modem_diagnostic, expected_supervised in supervision_scenarios:
+			fake_ofono = __startFakeOfono(bus, served_interface)
+			try:
+				lib_modem.getModemSession(bus, modem).invalidate()
+				supervised, message = cellular_data_supervisor.isModemSupervised(bus, modem, modem_diagnostic)
+				passed = supervised == expected_supervised
+			finally:
+				__stopFakeOfono(bus, fake_ofono)
+			failures += 0 if passed else 1
+			print("context interface %-9s %-5s %s, %s: %s %s" % (served_interface, "ok" if passed else "FAIL", modem.describe(),
+				modem_diagnostic.name, "supervised" if supervised else "left as is", message))
+	finally:
+		dbus_daemon.terminate()
+
+	print("%d scenario(s), %d failure(s)" % (len(scenarios) + len(supervision_scenarios), failures))
+	return failures == 0
+
+if __name__ == '__main__':
+	command = sys.argv[1] if len(sys.argv) > 1 else "serve"
+
+	if command == "serve":
+		serve(sys.argv[2] if len(sys.argv) > 2 else "usb0")
+	elif command == "check":
+		sys.exit(0 if check() else 1)
+	else:
+		print("usage: %s [serve [interface] | check]" % (sys.argv[0]))
+		sys.exit(1)
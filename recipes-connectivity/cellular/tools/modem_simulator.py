@@ -0,0 +1,270 @@
+#!/usr/bin/python3
+#
+# Simulated Telit LE910 modem on a pseudo-terminal, to exercise the serial path of lib_modem (ATChannel,
+# sendSerialCommandToModem, checkModemReadyForATCommands, loadModemFactoryConfiguration, isNorthAmericaModemViaSerial,
+# logModemDiagnosticInformation) without hardware. It is a development tool, not installed on the controller image:
+#     python3 modem_simulator.py                        serve the simulated modem until Ctrl-C, its port is printed
+#     python3 modem_simulator.py benchmark [iterations]  measure the latency of the serial functions of lib_modem
+#     python3 modem_simulator.py regression              check the serial functions of lib_modem against faults
+# The benchmark and regression need the imports of lib_modem (dbus-python, GObject...), e.g. on the controller itself.
+#
+# The simulator answers the commands sent by lib_modem with scripted answers. The answer delay of each command, the
+# echo (ATE0/ATE1) and faults (no answer, garbage, ERROR) are configurable. Commands chained on a single command line
+# ("AT+CREG?;+CSQ") are answered like the modem does: the answers of all the commands followed by a single final result code.
+
+import os
+import sys
+import pty
+import tty
+import time
+import select
+import threading
+
+# Scripted answers of a LE910-EU V2 registered on a LTE network, indexed by command without "AT" prefix: list of the
+# information lines of the answer (final result code OK is added), None for a command answered with ERROR
+LE910_ANSWERS = {
+	"": [],
+	"&F1": [],
+	"+CMEE=2": [],
+	"+CGMM": ["LE910-EU V2"],
+	"+CGSN": ["357164090123456"],
+	"+CGMR": ["20.00.403"],
+	"+CEMODE?": ["+CEMODE: 2"],
+	"+CFUN?": ["+CFUN: 1"],
+	"+CPIN?": ["+CPIN: READY"],
+	"+CIMI": ["228012345678901"],
+	"+CGATT?": ["+CGATT: 1"],
+	"+CREG?": ["+CREG: 0,1"],
+	"+CGREG?": ["+CGREG: 0,1"],
+	"+CEREG?": ["+CEREG: 0,1"],
+	"+COPS?": ["+COPS: 0,0,\"Swisscom\",7"],
+	"+CSQ": ["+CSQ: 17,99"],
+	# firmware switch is only supported by North America variants
+	"#FWSWITCH?": None,
+}
+
+# Answers differing for a LE910-NA V2
+LE910_NA_ANSWERS = {
+	"+CGMM": ["LE910-NA V2"],
+	"+COPS?": ["+COPS: 0,0,\"AT&T\",7"],
+	"#FWSWITCH?": ["#FWSWITCH: 0,1"],
+}
+
+# Faults that can be injected on a command
+FAULT_NO_ANSWER = "no_answer"	# the command is silently dropped
+FAULT_GARBAGE = "garbage"	# noise is sent instead of the answer, without final result code
+FAULT_ERROR = "error"	# the command is answered with ERROR
+
+_garbage = b"\x00\xfe+C\xff\xff~#\x13\r\n\x7f\x1b[0;"
+
+class ModemSimulator(object):
+	"""Simulated modem answering AT commands on the slave side of a pseudo-terminal, whose path is given by port
+	once started. Commands are processed one command line at a time, in a dedicated thread.
+		answers: scripted answers replacing or completing LE910_ANSWERS (see LE910_ANSWERS)
+		latency: answer delay (seconds) of any command
+		latencies: answer delay of specific commands, indexed like answers (e.g. { "+COPS?": 0.5 })
+		faults: fault injected on specific commands, indexed like answers (e.g. { "+CSQ": FAULT_ERROR })
+		echo: initial echo of the command line (changed by ATE0/ATE1)
+	"""
+
+	def __init__(self, answers=None, latency=0, latencies=None, faults=None, echo=True):
+		self.answers = dict(LE910_ANSWERS)
+		self.answers.update(answers or {})
+		self.latency = latency
+		self.latencies = latencies or {}
+		self.faults = faults or {}
+		self.echo = echo
+		self.port = None
+		self.command_lines = []	# command lines received, for the checks of the caller
+		self.__master = None
+		self.__slave = None
+		self.__thread = None
+		self.__stop = threading.Event()
+
+	def start(self):
+		"""create the pseudo-terminal and start answering commands, return the path of the serial port
+		"""
+		self.__master, self.__slave = pty.openpty()
+		# the slave side is kept open so that clients can close and open the port again without the master getting EIO
+		tty.setraw(self.__slave)
+		self.port = os.ttyname(self.__slave)
+		self.__stop.clear()
+		self.__thread = threading.Thread(target=self.__serve, daemon=True)
+		self.__thread.start()
+		return self.port
+
+	def stop(self):
+		self.__stop.set()
+		if self.__thread != None:
+			self.__thread.join()
+			self.__thread = None
+		for fd in (self.__master, self.__slave):
+			if fd != None:
+				os.close(fd)
+		self.__master = self.__slave = None
+
+	def __enter__(self):
+		self.start()
+		return self
+
+	def __exit__(self, *exception):
+		self.stop()
+		return False
+
+	def __serve(self):
+		buffer = b""
+		while not self.__stop.is_set():
+			ready, _, _ = select.select([self.__master], [], [], 0.1)
+			if not ready:
+				continue
+			try:
+				buffer += os.read(self.__master, 1024)
+			except OSError:
+				continue
+			# a command line ends with a carriage return, line feeds are ignored
+			while b"\r" in buffer:
+				line, buffer = buffer.split(b"\r", 1)
+				self.__processCommandLine(line.replace(b"\n", b"").decode("ascii", "replace"))
+
+	def __write(self, data):
+		os.write(self.__master, data.encode() if isinstance(data, str) else data)
+
+	def __processCommandLine(self, line):
+		if len(line.strip()) == 0:
+			return
+		self.command_lines.append(line)
+		if self.echo:
+			self.__write(line + "\r")
+
+		if not line.upper().startswith("AT"):
+			self.__write("\r\nERROR\r\n")
+			return
+
+		# "AT+CREG?;+CSQ" is the command line of commands "+CREG?" and "+CSQ"
+		commands = [command.strip().upper() for command in line[2:].split(";")]
+		delay = sum([self.latencies.get(command, self.latency) for command in commands])
+		if delay > 0:
+			time.sleep(delay)
+
+		answer = ""
+		for command in commands:
+			fault = self.faults.get(command)
+			if fault == FAULT_NO_ANSWER:
+				return
+			if fault == FAULT_GARBAGE:
+				self.__write(_garbage)
+				return
+			if command in ("E0", "E1"):
+				self.echo = command == "E1"
+				continue
+			if command == "&F1":
+				self.echo = True
+			lines = self.answers.get(command) if fault != FAULT_ERROR else None
+			if lines == None:
+				# the modem stops at the first failing command of a command line
+				self.__write(answer + "\r\nERROR\r\n")
+				return
+			answer += "".join(["\r\n%s\r\n" % (information) for information in lines])
+		self.__write(answer + "\r\nOK\r\n")
+
+def __patchLibModem(lib_modem, port):
+	"""redirect the serial functions of lib_modem to the simulated modem on port
+	"""
+	lib_modem.MODEM_SERIAL_PORT = port
+	# a pseudo-terminal accepts the 7O2 settings of the modem once only, it is used with the default 8N1 settings
+	lib_modem.MODEM_SERIAL_SETTINGS = { "baudrate": 115200 }
+	# neither USB modem nor ofono on the development system
+	supported_modems = getattr(lib_modem, "__supported_modems")
+	lib_modem.listUSBModems = lambda verbose=False: (1, "Modem '%s' is detected" % (supported_modems[0].Name), supported_modems[:1])
+	lib_modem.isOfonodRunning = lambda: (False, "")
+
+def __importLibModem():
+	sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "files"))
+	import lib_modem
+	return lib_modem
+
+def benchmark(iterations):
+	lib_modem = __importLibModem()
+
+	functions = [
+		("sendSerialCommandToModem", lambda: lib_modem.sendSerialCommandToModem("AT+CSQ")),
+		("checkModemReadyForATCommands", lambda: lib_modem.checkModemReadyForATCommands()),
+		("loadModemFactoryConfiguration", lambda: lib_modem.loadModemFactoryConfiguration()),
+		("isNorthAmericaModemViaSerial", lambda: lib_modem.isNorthAmericaModemViaSerial()),
+		("logModemDiagnosticInformation", lambda: lib_modem.logModemDiagnosticInformation()),
+	]
+
+	print("%-32s %12s %12s %14s" % ("function", "no delay (ms)", "10 ms (ms)", "command lines"))
+	for name, function in functions:
+		results = []
+		for latency in (0, 0.01):
+			with ModemSimulator(latency=latency) as simulator:
+				__patchLibModem(lib_modem, simulator.port)
+				start = time.monotonic()
+				for _ in range(iterations):
+					function()
+				results.append((time.monotonic() - start) / iterations * 1000)
+				command_lines = len(simulator.command_lines) / iterations
+		print("%-32s %12.1f %12.1f %14.1f" % (name, results[0], results[1], command_lines))
+
+def regression():
+	lib_modem = __importLibModem()
+
+	# (description, simulator settings, function, check of the result)
+	scenarios = [
+		("ready", {}, lambda: lib_modem.checkModemReadyForATCommands(), lambda result: result[0]),
+		("ready, no answer", { "faults": { "+CGMR": FAULT_NO_ANSWER } }, lambda: lib_modem.checkModemReadyForATCommands(), lambda result: not result[0]),
+		("ready, garbage", { "faults": { "+CGMR": FAULT_GARBAGE } }, lambda: lib_modem.checkModemReadyForATCommands(), lambda result: not result[0]),
+		("ready, ERROR", { "faults": { "+CGMR": FAULT_ERROR } }, lambda: lib_modem.checkModemReadyForATCommands(), lambda result: not result[0]),
+		("ready, slow modem", { "latency": 0.5 }, lambda: lib_modem.checkModemReadyForATCommands(), lambda result: result[0]),
+		("factory configuration", {}, lambda: lib_modem.loadModemFactoryConfiguration(), lambda result: result[0]),
+		("factory configuration, ERROR", { "faults": { "&F1": FAULT_ERROR } }, lambda: lib_modem.loadModemFactoryConfiguration(), lambda result: not result[0]),
+		("EU variant", {}, lambda: lib_modem.isNorthAmericaModemViaSerial(), lambda result: result == False),
+		("NA variant", { "answers": LE910_NA_ANSWERS }, lambda: lib_modem.isNorthAmericaModemViaSerial(), lambda result: result == True),
+		("diagnostic", {}, lambda: lib_modem.logModemDiagnosticInformation(),
+			lambda result: result["signal"]["rssi"] == 17 and result["operator"]["operator"] == "Swisscom" and result["imsi"]["value"] == "228012345678901"),
+		("diagnostic, echo off", { "echo": False }, lambda: lib_modem.logModemDiagnosticInformation(),
+			lambda result: result["model"]["value"] == "LE910-EU V2" and result["registration"]["stat"] == 1),
+		("diagnostic, ERROR in chain", { "faults": { "+CSQ": FAULT_ERROR } }, lambda: lib_modem.logModemDiagnosticInformation(),
+			lambda result: "error" in result["signal"] and result["operator"]["act"] == 7),
+		("diagnostic, no answer in chain", { "faults": { "+COPS?": FAULT_NO_ANSWER } }, lambda: lib_modem.logModemDiagnosticInformation(),
+			lambda result: "error" in result["operator"] and result["gprs_attachment"]["attached"]),
+	]
+
+	failures = 0
+	for description, settings, function, check in scenarios:
+		with ModemSimulator(**settings) as simulator:
+			__patchLibModem(lib_modem, simulator.port)
+			start = time.monotonic()
+			result = function()
+			elapsed = time.monotonic() - start
+		try:
+			passed = check(result)
+		except (KeyError, TypeError):
+			passed = False
+		failures += 0 if passed else 1
+		print("%-36s %-5s %6.2f s" % (description, "ok" if passed else "FAIL", elapsed))
+		if not passed:
+			print("    result: %s" % (result,))
+
+	print("%d scenario(s), %d failure(s)" % (len(scenarios), failures))
+	return failures == 0
+
+if __name__ == '__main__':
+	command = sys.argv[1] if len(sys.argv) > 1 else "serve"
+
+	if command == "benchmark":
+		benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 20)
+	elif command == "regression":
+		sys.exit(0 if regression() else 1)
+	elif command == "serve":
+		with ModemSimulator() as simulator:
+			print("Simulated modem on %s (8N1), Ctrl-C to stop" % (simulator.port))
+			try:
+				while True:
+					time.sleep(1)
+			except KeyboardInterrupt:
+				pass
+	else:
+		print("usage: %s [serve | benchmark [iterations] | regression]" % (sys.argv[0]))
+		sys.exit(1)
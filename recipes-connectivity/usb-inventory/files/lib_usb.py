@@ -0,0 +1,113 @@
+#!/usr/bin/python3
+#
+# Inventory of the USB devices mounted by the system, read from sysfs in a single pass (no lsusb process), or from the
+# registry kept up to date on hotplug events by usb_device_registry.py when it runs
+
+import os
+import glob
+import re
+import json
+import socket
+import select
+from collections import namedtuple
+
+USB_DEVICES_PATH = "/sys/bus/usb/devices"
+
+# Registry of the USB devices written by usb_device_registry.py
+USB_REGISTRY_FILE_PATH = "/run/usb_device_registry.json"
+
+# netlink protocol and multicast group of kernel uevents
+NETLINK_KOBJECT_UEVENT = 15
+UEVENT_KERNEL_GROUP = 1
+
+# USB device mounted by the system: "vid:pid" (e.g. "1bc7:0036"), serial number ("" when the device has none) and sysfs
+# directory of the device (e.g. "/sys/bus/usb/devices/1-1.2")
+USBDevice = namedtuple("USBDevice", "VidPid Serial Path")
+
+def __readAttribute(device_path, name):
+	try:
+		with open(os.path.join(device_path, name)) as attribute:
+			return attribute.read().strip()
+	except (IOError, OSError):
+		return ""
+
+def listUSBDevices():
+	""" Return the USB devices currently mounted by the system, indexed by "vid:pid": dict of lists of USBDevice, several
+	identical devices sharing the same "vid:pid"
+	"""
+	devices = {}
+	for device_path in sorted(glob.glob(os.path.join(USB_DEVICES_PATH, "*"))):
+		# interfaces of the devices (e.g. "1-1.2:1.0") are listed too, they have no vendor id
+		vendor = __readAttribute(device_path, "idVendor")
+		if len(vendor) == 0:
+			continue
+		vid_pid = "%s:%s" % (vendor, __readAttribute(device_path, "idProduct"))
+		devices.setdefault(vid_pid, []).append(USBDevice(vid_pid, __readAttribute(device_path, "serial"), device_path))
+	return devices
+
+def loadRegistry():
+	""" Return the content of the registry of USB devices, None when the registry is not maintained (usb_device_registry.py
+	not running) and may be outdated:
+		"pid": process id of usb_device_registry.py
+		"devices": attached devices indexed by kernel device path, e.g. { "vid_pid": "1bc7:0036", "serial": "...", "attached": date }
+		"events": last attach ("add") and detach ("remove") events, e.g. { "action": "add", "vid_pid": ..., "serial": ..., "date": date }
+	"""
+	try:
+		with open(USB_REGISTRY_FILE_PATH) as registry_file:
+			registry = json.load(registry_file)
+		if os.path.exists("/proc/%d" % (registry["pid"])):
+			return registry
+	except (IOError, OSError, ValueError, KeyError, TypeError):
+		pass
+	return None
+
+def listRegisteredUSBDevices():
+	""" Same as listUSBDevices, from the registry of USB devices when it is maintained, from sysfs otherwise
+	"""
+	registry = loadRegistry()
+	if registry == None:
+		return listUSBDevices()
+	devices = {}
+	for device_path, device in sorted(registry["devices"].items()):
+		devices.setdefault(device["vid_pid"], []).append(USBDevice(device["vid_pid"], device["serial"], "/sys" + device_path))
+	return devices
+
+def findSupportedDevices(supported_devices, devices=None):
+	""" Return the entries of supported_devices (named tuples having a VidPid field, e.g. the supported modems) that are
+	currently mounted by the system, devices being the result of listUSBDevices() (listRegisteredUSBDevices() when None)
+	"""
+	if devices == None:
+		devices = listRegisteredUSBDevices()
+	return [supported_device for supported_device in supported_devices if supported_device.VidPid in devices]
+
+def listDeviceTTYs(device):
+	""" Return the names of the serial ports (e.g. "ttyACM0") of the interfaces of a USB device, sorted by number
+	"""
+	ttys = [os.path.basename(path) for path in glob.glob(os.path.join(device.Path, "*:*", "tty", "*"))]
+	return sorted(ttys, key=lambda tty: (re.sub(r"\d", "", tty), int("0" + re.sub(r"\D", "", tty))))
+
+def openUeventSocket():
+	""" Return a netlink socket receiving the uevents of the kernel (attach and detach of devices), see readUevent.
+	Uevents are queued from its creation, create it before triggering the events to wait for
+	"""
+	uevent_socket = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_KOBJECT_UEVENT)
+	uevent_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1024 * 1024)
+	# port id 0: assigned by the kernel
+	uevent_socket.bind((0, UEVENT_KERNEL_GROUP))
+	return uevent_socket
+
+def parseUevent(message):
+	""" Return the properties of a kernel uevent message ("ACTION@DEVPATH" then "KEY=VALUE" fields separated by '\\0'),
+	e.g. { "ACTION": "add", "DEVPATH": "/devices/...", "SUBSYSTEM": "tty", "DEVNAME": "ttyACM0" }
+	"""
+	fields = message.decode("utf-8", "replace").split("\0")
+	return dict([field.split("=", 1) for field in fields[1:] if "=" in field])
+
+def readUevent(uevent_socket, timeout=None):
+	""" Wait for the next kernel uevent for at most timeout seconds (no limit when None), return its properties (see
+	parseUevent), None on timeout
+	"""
+	ready, _, _ = select.select([uevent_socket], [], [], timeout)
+	if not ready:
+		return None
+	return parseUevent(uevent_socket.recv(65536))
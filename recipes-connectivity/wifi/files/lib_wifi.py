@@ -2,6 +2,7 @@
 
 import dbus
 import lib_system
+import lib_usb
 import os
 import glob
 import re
@@ -156,23 +157,15 @@ def list_USB_dongles(logger):
 	message = "No dongle found"
 	exception = False
 
-	# We search dongles mounted by the system
-	for supported_dongle in __supported_dongles:
-		try:
-			# check if this dongle exists in the system using lsusb command (searched by vendor Id & product Id)
-			command = ['lsusb', '-d', supported_dongle.VidPid]
-			with open(os.devnull, 'w') as shutup:
-				subprocess.check_call(command, stdout=shutup, stderr=shutup)
+	# We search dongles mounted by the system (sysfs is read once for all supported dongles)
+	try:
+		for supported_dongle in lib_usb.findSupportedDevices(__supported_dongles):
 			count += 1
 			mounted_dongles.append(supported_dongle)
 			message = "Dongle \'%s\' is detected" % (supported_dongle.Name)
-		except subprocess.CalledProcessError as e:
-			# this exception is raised when lusb commands failed to find a specific device
-			# in this case we look for the next one
-			pass
-		except Exception as e:
-			message = "Generic exception while getting USB dongle(s):%s" % (e)
-			break
+	except Exception as e:
+		message = "Generic exception while getting USB dongle(s):%s" % (e)
+		exception = True
 
 	if exception:
 		logger.error(message)
@@ -64,7 +64,13 @@ resolvectl &> "${NETWORK}/resolvectl"
 cp -aL /etc/resolv.conf "${NETWORK}/"
 cp -a /media/persistent/system/config_modem ${NETWORK}/
 cp -a /media/persistent/system/config_modem_logs* ${NETWORK}/
+cp -a /media/persistent/system/config_modem_enumeration.json ${NETWORK}/
+cp -a /media/persistent/system/config_modem_timings.json ${NETWORK}/
+cp -a /media/persistent/system/modem_identity.json ${NETWORK}/
+cp -a /media/persistent/system/cellular_registered_network*.json ${NETWORK}/
 cp -a /media/persistent/system/cellular_data_supervisor_stats.csv* ${NETWORK}/
+cp -a /media/persistent/system/cellular_modem_diagnostics.jsonl* ${NETWORK}/
+cp -a /run/usb_device_registry.json ${NETWORK}/
 
 cp -a /media/persistent/system/config_wifi_logs* ${NETWORK}/
 cp -a /media/persistent/system/wifi_stats.csv* ${NETWORK}/